@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Benchmarks of the models, managers and containers against a local
+redis-server.
+
+Usage:
+
+    python benchmarks/bench.py --mode sync --output sync.json
+    python benchmarks/bench.py --mode async --output async.json
+
+The sync and async suites run in separate processes because the mode
+of the client is global. Each case reports throughput, latency
+percentiles and Redis round trips per operation, and the results are
+written as JSON so that runs can be compared.
+
+The keys of the selected db are flushed before each case. Cases that
+read a container fill it first; the fill is not timed.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import bredis
+from bredis.containers import Set, List, SortedSet, Hash, TypedList
+from bredis.orm import Model, CharField, IntegerField
+
+
+WIDTHS = (4, 16, 64)
+BATCHES = (1, 10, 100)
+
+
+class RoundTrips(object):
+    """Counts the round trips sent by a client and its pipelines."""
+
+    def __init__(self):
+        self.count = 0
+
+    def install(self, db):
+        execute_command = db.execute_command
+        pipeline = db.pipeline
+
+        def counted_execute_command(*args, **kwargs):
+            self.count += 1
+            return execute_command(*args, **kwargs)
+
+        def counted_pipeline(*args, **kwargs):
+            p = pipeline(*args, **kwargs)
+            execute = p.execute
+
+            def counted_execute(*args, **kwargs):
+                self.count += 1
+                return execute(*args, **kwargs)
+
+            p.execute = counted_execute
+            return p
+
+        db.execute_command = counted_execute_command
+        db.pipeline = counted_pipeline
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return values[k]
+
+
+def summarize(name, params, latencies, elapsed, round_trips, ops):
+    return {
+        'name': name,
+        'params': params,
+        'ops': ops,
+        'ops_per_sec': ops / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'round_trips_per_op': float(round_trips) / ops if ops else 0.0,
+    }
+
+
+def make_model(width):
+    attrs = dict(('f%d' % i, CharField()) for i in xrange(width - 1))
+    attrs['n'] = IntegerField()
+    return type('BenchW%d' % width, (Model,), attrs)
+
+
+# models are registered by name, so each is defined once
+MODELS = dict((width, make_model(width)) for width in WIDTHS)
+
+
+def make_instance(model_class, width):
+    kwargs = dict(('f%d' % i, u'value %d' % i) for i in xrange(width - 1))
+    kwargs['n'] = width
+    return model_class(**kwargs)
+
+
+class SyncSuite(object):
+
+    def __init__(self, db, round_trips, iterations):
+        self.db = db
+        self.round_trips = round_trips
+        self.iterations = iterations
+        self.results = []
+
+    def measure(self, name, params, func, setup=None):
+        self.db.flushdb()
+        state = setup() if setup else None
+        latencies = []
+        self.round_trips.count = 0
+        start = time.time()
+        for i in xrange(self.iterations):
+            t = time.time()
+            func(state, i)
+            latencies.append(time.time() - t)
+        elapsed = time.time() - start
+        self.results.append(summarize(name, params, latencies, elapsed,
+            self.round_trips.count, self.iterations))
+
+    def run(self):
+        for width in WIDTHS:
+            model_class = MODELS[width]
+            params = {'width': width}
+
+            def save(state, i):
+                make_instance(model_class, width).save()
+            self.measure('Model.save', params, save)
+
+            def saved():
+                objs = [make_instance(model_class, width) for i in xrange(100)]
+                for o in objs:
+                    o.save()
+                return [o.id for o in objs]
+
+            def get_by_id(ids, i):
+                model_class.objects.get_by_id(ids[i % len(ids)])
+            self.measure('Manager.get_by_id', params, get_by_id, saved)
+
+            def lazy_attributes(ids, i):
+                o = model_class.objects.get_by_id(ids[i % len(ids)])
+                for k in o.attributes:
+                    getattr(o, k)
+            self.measure('Attribute.__get__', params, lazy_attributes,
+                    saved)
+
+        for batch in BATCHES:
+            params = {'batch': batch}
+
+            def typed_list():
+                model_class = MODELS[4]
+                l = TypedList('bench:typed', model_class)
+                for i in xrange(batch):
+                    o = make_instance(model_class, 4)
+                    o.save()
+                    l.append(o)
+                return l
+
+            def iterate(l, i):
+                list(l.all())
+            self.measure('TypedList.all', params, iterate, typed_list)
+
+        self.run_containers()
+        return self.results
+
+    def run_containers(self):
+        params = {}
+        s, l = Set('bench:set'), List('bench:list')
+        z, h = SortedSet('bench:zset'), Hash('bench:hash')
+        members = xrange(self.iterations)
+
+        self.measure('Set.add', params, lambda _, i: s.add(i))
+        self.measure('Set.__contains__', params, lambda _, i: i in s,
+                lambda: s.add_many(members))
+        self.measure('List.append', params, lambda _, i: l.append(i))
+        self.measure('List.__getitem__', params,
+                lambda _, i: l[i % 10], lambda: l.extend(range(10)))
+        self.measure('SortedSet.add', params, lambda _, i: z.add(i, i))
+        self.measure('SortedSet.score', params, lambda _, i: z.score(i),
+                lambda: z.add_many(dict((i, i) for i in members)))
+        self.measure('Hash.__setitem__', params,
+                lambda _, i: h.__setitem__('f%d' % i, i))
+        self.measure('Hash.__getitem__', params,
+                lambda _, i: h['f%d' % (i % 10)],
+                lambda: h.update(dict(('f%d' % i, i) for i in xrange(10))))
+
+
+class AsyncSuite(object):
+
+    def __init__(self, db, round_trips, iterations):
+        self.db = db
+        self.round_trips = round_trips
+        self.iterations = iterations
+        self.results = []
+
+    def measure(self, name, params, func, state, callback):
+        """Runs func(state, i, done) sequentially and calls callback."""
+        latencies = []
+        stamp = {}
+
+        def step(i):
+            if i == self.iterations:
+                elapsed = time.time() - stamp['start']
+                self.results.append(summarize(name, params, latencies,
+                    elapsed, self.round_trips.count, self.iterations))
+                callback()
+                return
+            t = time.time()
+
+            def done(*args):
+                latencies.append(time.time() - t)
+                step(i + 1)
+            func(state, i, done)
+
+        self.round_trips.count = 0
+        stamp['start'] = time.time()
+        step(0)
+
+    def run(self, callback):
+        cases = []
+        for width in WIDTHS:
+            model_class = MODELS[width]
+            params = {'width': width}
+            cases.append(('Model.save_async', params,
+                lambda m, i, done, w=width:
+                    make_instance(m, w).save_async(done),
+                model_class))
+            cases.append(('Manager.get_by_id_async', params,
+                lambda m, i, done:
+                    m.objects.get_by_id_async(str(i % 100 + 1), done),
+                model_class))
+            for batch in BATCHES:
+                cases.append(('Manager.get_by_ids_async',
+                    dict(params, batch=batch),
+                    lambda m, i, done, b=batch:
+                        m.objects.get_by_ids_async(
+                            [str(k + 1) for k in xrange(b)], callback=done),
+                    model_class))
+
+        s, z = Set('bench:set'), SortedSet('bench:zset')
+        l, h = List('bench:list'), Hash('bench:hash')
+        cases.extend([
+            ('Set.add_async', {}, lambda c, i, done: c.add_async(i, done), s),
+            ('Set.contains_async', {},
+                lambda c, i, done: c.contains_async(i, done), s),
+            ('List.append_async', {},
+                lambda c, i, done: c.append_async(i, done), l),
+            ('SortedSet.add_async', {},
+                lambda c, i, done: c.add_async(i, i, done), z),
+            ('Hash.set_async', {},
+                lambda c, i, done: c.set_async('f%d' % i, i, done), h),
+        ])
+
+        def next_case(index=0):
+            if index == len(cases):
+                callback(self.results)
+                return
+            name, params, func, state = cases[index]
+            self.measure(name, params, func, state,
+                    lambda: next_case(index + 1))
+
+        next_case()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--mode', choices=('sync', 'async'), default='sync')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--db', type=int, default=15)
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--output', help='JSON file, default stdout')
+    args = parser.parse_args()
+
+    if args.mode == 'sync':
+        bredis.setup_connection(args.host, args.port, args.db)
+        db = bredis.get_client()
+        round_trips = RoundTrips()
+        round_trips.install(db)
+        results = SyncSuite(db, round_trips, args.iterations).run()
+        write_results(args, results)
+    else:
+        import redis
+        from tornado.ioloop import IOLoop
+        redis.Redis(args.host, args.port, args.db).flushdb()
+        bredis.setup_connection(args.host, args.port, args.db, async=True)
+        db = bredis.get_client()
+        round_trips = RoundTrips()
+        round_trips.install(db)
+
+        def on_done(results):
+            write_results(args, results)
+            IOLoop.instance().stop()
+
+        AsyncSuite(db, round_trips, args.iterations).run(on_done)
+        IOLoop.instance().start()
+
+
+def write_results(args, results):
+    doc = {
+        'mode': args.mode,
+        'iterations': args.iterations,
+        'time': int(time.time()),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(doc, f, indent=2)
+    else:
+        json.dump(doc, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
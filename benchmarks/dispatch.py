@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Microbenchmark of the method dispatch of the containers.
+
+Usage:
+
+    python benchmarks/dispatch.py --number 200000
+
+No redis-server is needed: the containers get a stub client whose
+commands return at once, so the timings are the overhead bredis adds
+to each call. The legacy classes reproduce the previous dispatch, a
+``__getattribute__`` hook that resolved the client and allocated a
+``functools.partial`` on each delegated call, for comparison.
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+from functools import partial
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bredis import get_client
+from bredis.containers import Set, Hash
+from bredis.instrument import instrument
+
+
+class StubClient(object):
+    """A client whose commands do nothing."""
+
+    def _command(self, *args, **kwargs):
+        return 0
+
+    sadd = sismember = scard = hget = hset = _command
+
+
+class LegacyDispatch(object):
+    """The dispatch of the containers before the methods were
+    generated per class.
+    """
+
+    def __getattribute__(self, att):
+        if att in object.__getattribute__(self, 'DELEGATEABLE_METHODS'):
+            return partial(getattr(object.__getattribute__(self, 'db'), att),
+                    self.key)
+        else:
+            return object.__getattribute__(self, att)
+
+    @property
+    def db(self):
+        if self.pipeline:
+            return self.pipeline
+        if self._db:
+            return instrument(self._db, self.__class__.__name__)
+        return instrument(get_client(), self.__class__.__name__)
+
+
+class LegacySet(LegacyDispatch, Set):
+    pass
+
+
+class LegacyHash(LegacyDispatch, Hash):
+    pass
+
+
+CASES = [
+    ('Set.add', 's.add(1)'),
+    ('Set.__contains__', '1 in s'),
+    ('Set.__len__', 'len(s)'),
+    ('Set.key', 's.key'),
+    ('Hash.__setitem__', "h['f'] = 1"),
+    ('Hash.__getitem__', "h['f']"),
+]
+
+
+def make(legacy):
+    """Returns the (Set, Hash) pair the cases run against."""
+    if legacy:
+        return (LegacySet('bench:set', db=StubClient()),
+                LegacyHash('bench:hash', db=StubClient()))
+    return (Set('bench:set', db=StubClient()),
+            Hash('bench:hash', db=StubClient()))
+
+
+def measure(statement, number, legacy=False):
+    timer = timeit.Timer(statement,
+            setup='from __main__ import make; s, h = make(%r)' % legacy)
+    # the best of 3 runs, in nanoseconds per call
+    return min(timer.repeat(3, number)) / number * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--number', type=int, default=200000)
+    args = parser.parse_args()
+
+    results = []
+    for name, statement in CASES:
+        before = measure(statement, args.number, legacy=True)
+        after = measure(statement, args.number)
+        results.append({
+            'name': name,
+            'before_ns': round(before, 1),
+            'after_ns': round(after, 1),
+            'speedup': round(before / after, 2) if after else None,
+        })
+    json.dump({'number': args.number, 'results': results}, sys.stdout,
+            indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
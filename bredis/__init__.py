@@ -1,6 +1,7 @@
 import redis
-from tornadoredis import Client as AsyncClient
+from tornadoredis import Client as TornadoClient
 from tornadoredis import ConnectionPool
+from tornadoredis.client import Pipeline as TornadoPipeline
 
 
 class Client(object):
@@ -15,25 +16,128 @@ class Client(object):
         self.connection_settings.update(d)
 
 
-def setup_connection(host, port, db=None, async=False):
-    global connection, client, async_client
-    if async:
-        if async_client is None:
-            pool = ConnectionPool(host=host, port=port,
-                    max_connections=100, wait_for_available=True)
-            async_client = AsyncClient(connection_pool=pool)
-        connection = async_client
+def _format_reply(self, cmd_line, data):
+    # tornadoredis formats the error replies too, which raises instead
+    # of passing the error to the callback, or turns it into a reply
+    # (an empty dict for HMGET)
+    if isinstance(data, Exception):
+        return data
+    return TornadoClient.format_reply(self, cmd_line, data)
+
+
+def _pipeline_command(self, cmd, *args, **kwargs):
+    # tornadoredis also queues the AUTH and SELECT a pipeline sends on
+    # (re)connection, so that its next execute returned their replies
+    if cmd in ('AUTH', 'SELECT'):
+        return TornadoClient.execute_command(self, cmd, *args, **kwargs)
+    return TornadoPipeline.execute_command(self, cmd, *args, **kwargs)
+
+
+# tornadoredis binds the methods found in the dict of the class or of
+# its Client only, so the methods of its Pipeline are copied
+AsyncPipeline = type('AsyncPipeline', (TornadoPipeline,),
+        dict(TornadoPipeline.__dict__, execute_command=_pipeline_command,
+             format_reply=_format_reply))
+
+
+class AsyncClient(TornadoClient):
+
+    format_reply = _format_reply
+
+    def pipeline(self, transactional=False):
+        # the pipeline is kept by the client, its methods are bound to
+        # a weak proxy
+        if not self._pipeline:
+            # a pipeline does not connect, it writes to the connection
+            # of the client
+            if not self.connection.connected():
+                self.connection.connect()
+            self._pipeline = AsyncPipeline(
+                transactional=transactional,
+                selected_db=self.selected_db,
+                password=self.password,
+                io_loop=self._io_loop,
+            )
+            self._pipeline.connection = self.connection
+        return self._pipeline
+
+
+def register_backend(name, factory, async=False, blocking=None):
+    """Registers a client backend.
+
+    Arguments:
+        name -- the name passed to ``setup_connection``
+        factory -- callable(host, port, db, **options) returning the
+                   client
+        async -- True if the client takes callbacks. Default: False
+        blocking -- callable(client) returning a client with a
+                    connection of its own, for the blocking commands
+                    which would hold up the other commands sent on the
+                    client. Default: None, they share the client
+
+    The client should provide the command methods of redis-py (sync)
+    or tornado-redis (async) used by the models and containers, and
+    ``pipeline()`` whose ``execute()`` returns (or passes to callback)
+    the list of replies.
+    """
+    _backends[name] = (factory, async, blocking)
+
+
+def _redis_backend(host, port, db=None, **options):
+    global client
+    kwargs = {
+        'host': host,
+        'port': port,
+        'db': db,
+    }
+    kwargs.update(options)
+    if client:
+        client.update(kwargs)
     else:
-        kwargs = {
-            'host': host,
-            'port': port,
-            'db': db,
-        }
-        if client:
-            client.update(kwargs)
-        else:
-            client = Client(**kwargs)
-        connection = client.redis()
+        client = Client(**kwargs)
+    return client.redis()
+
+
+def _tornado_backend(host, port, db=None, max_connections=100, **options):
+    global tornado_client
+    settings = (host, port, db, max_connections, sorted(options.items()))
+    # the client is kept while the settings are the same
+    if tornado_client is None or tornado_client[0] != settings:
+        pool = ConnectionPool(host=host, port=port,
+                max_connections=max_connections, wait_for_available=True)
+        client = AsyncClient(selected_db=db, connection_pool=pool,
+                **options)
+        tornado_client = (settings, client)
+    return tornado_client[1]
+
+
+def _tornado_blocking_client(client):
+    # all the commands of a tornadoredis client share its connection,
+    # a new client takes one of its own from the pool
+    return AsyncClient(selected_db=client.selected_db,
+            password=client.password,
+            connection_pool=client._connection_pool)
+
+
+def setup_connection(host, port, db=None, async=False, backend=None,
+        **options):
+    """Sets up the client returned by ``get_client``.
+
+    The backend defaults to 'tornado' if async is True and to 'redis'
+    otherwise. Extra options are passed to the backend factory, e.g.
+    ``max_connections`` to bound the tornado connection pool.
+    """
+    global connection, async_client, blocking_factory
+    if backend is None:
+        backend = 'tornado' if async else 'redis'
+    try:
+        factory, is_async_backend, blocking = _backends[backend]
+    except KeyError:
+        raise ValueError("Unknown backend %s" % backend)
+    connection = factory(host, port, db, **options)
+    # is_async() follows the backend of the current connection
+    async_client = connection if is_async_backend else None
+    blocking_factory = blocking
 
 
 def release_connection(callback=None):
@@ -47,12 +151,28 @@ def get_client():
     return connection
 
 
+def get_blocking_client():
+    """Returns a client for blocking commands, e.g. BRPOPLPUSH, see
+    ``register_backend``. The tornado backend returns a new client per
+    call, the caller keeps it while it is needed.
+    """
+    if blocking_factory is None:
+        return connection
+    return blocking_factory(connection)
+
+
 def is_async():
     global async_client
     return async_client is not None
 
 
+_backends = {}
+register_backend('redis', _redis_backend)
+register_backend('tornado', _tornado_backend, async=True,
+        blocking=_tornado_blocking_client)
+
 client = Client()
 async_client = None
+tornado_client = None
+blocking_factory = None
 connection = client.redis()
-
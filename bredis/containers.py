@@ -3,8 +3,435 @@ This module contains the container classes to create objects
 that persist directly in a Redis server.
 """
 
+import abc
 import collections
-from functools import partial
+import hashlib
+import logging
+import math
+import time
+
+from . import get_blocking_client, get_client, is_async
+from .instrument import instrument
+from .scripts import Script
+
+
+def _transform(callback, func):
+    """Returns a callback that passes func(result) to callback.
+
+    Errors returned by the async client are passed through.
+    """
+    def on_response(res):
+        if callback is None:
+            return
+        if isinstance(res, Exception):
+            callback(res)
+        else:
+            callback(func(res))
+    return on_response
+
+
+# KEYS: the destination, then the operand sets
+# ARGV: 'sinterstore', 'sunionstore' or 'sdiffstore', the ttl
+_cached_store = Script("""
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('SCARD', KEYS[1])
+end
+local n = redis.call(ARGV[1], unpack(KEYS))
+if n > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return n
+""")
+
+_sscan = Script("""
+local args = {'SSCAN', KEYS[1], ARGV[1]}
+if ARGV[2] then
+    table.insert(args, 'COUNT')
+    table.insert(args, ARGV[2])
+end
+return redis.call(unpack(args))
+""")
+
+# ARGV: (field, value) per field, set with HMSETs of 1000 fields since
+# unpack is bounded by the Lua stack
+_hash_replace = Script("""
+redis.call('DEL', KEYS[1])
+for i = 1, #ARGV, 2000 do
+    redis.call('HMSET', KEYS[1], unpack(ARGV, i, math.min(i + 1999, #ARGV)))
+end
+return #ARGV / 2
+""")
+
+_hash_pop = Script("""
+local value = redis.call('HGET', KEYS[1], ARGV[1])
+if value then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return value
+""")
+
+_hash_setdefault = Script("""
+if redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2]) == 1 then
+    return ARGV[2]
+end
+return redis.call('HGET', KEYS[1], ARGV[1])
+""")
+
+# ARGV: (field, amount, 'f' for a float amount or '') per field
+_hash_incr = Script("""
+local values = {}
+for i = 1, #ARGV, 3 do
+    if ARGV[i + 2] == 'f' then
+        values[#values + 1] = redis.call('HINCRBYFLOAT', KEYS[1], ARGV[i],
+                                         ARGV[i + 1])
+    else
+        values[#values + 1] = redis.call('HINCRBY', KEYS[1], ARGV[i],
+                                         ARGV[i + 1])
+    end
+end
+return values
+""")
+
+def _variadic(keys, args, db):
+    """Queues the command args[0] with the rest of args after the key
+    on the pipeline db. The batches are always pipelined, where a
+    script would be sent as EVAL with its source for each chunk.
+    """
+    db.execute_command(args[0], keys[0], *args[1:])
+
+# ARGV: the command, then the arguments to call it with one by one
+_each = Script("""
+local res = {}
+for i = 2, #ARGV do
+    res[i - 1] = redis.call(ARGV[1], KEYS[1], ARGV[i])
+end
+return res
+""")
+
+# ARGV: the command, then its arguments after the keys
+_command = Script("""
+local args = {ARGV[1]}
+for _, key in ipairs(KEYS) do
+    args[#args + 1] = key
+end
+for i = 2, #ARGV do
+    args[#args + 1] = ARGV[i]
+end
+return redis.call(unpack(args))
+""")
+
+# KEYS: the destination, then the operands
+# ARGV: the operation, which BITOP takes before the keys
+_bitop = Script("""
+return redis.call('BITOP', ARGV[1], unpack(KEYS))
+""")
+
+# ARGV: the bit value, then the offsets
+_setbits = Script("""
+local res = {}
+for i = 2, #ARGV do
+    res[i - 1] = redis.call('SETBIT', KEYS[1], ARGV[i], ARGV[1])
+end
+return res
+""")
+
+# the number of arguments per command of the batch operations
+BATCH_SIZE = 1000
+
+# KEYS: the queue, the in-flight set, the claimed list
+# ARGV: the number of items, their deadline, an item claimed by a
+#       blocking pop, if any
+_queue_pop = Script("""
+local items = {}
+if ARGV[3] then
+    redis.call('LREM', KEYS[3], 1, ARGV[3])
+    redis.call('ZADD', KEYS[2], ARGV[2], ARGV[3])
+    items[1] = ARGV[3]
+end
+while #items < tonumber(ARGV[1]) do
+    local item = redis.call('RPOP', KEYS[1])
+    if not item then
+        break
+    end
+    redis.call('ZADD', KEYS[2], ARGV[2], item)
+    items[#items + 1] = item
+end
+return items
+""")
+
+# KEYS: the queue, the in-flight set, the claimed list
+# ARGV: the current time, '1' to also requeue the claimed list
+_queue_reclaim = Script("""
+local items = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, item in ipairs(items) do
+    redis.call('ZREM', KEYS[2], item)
+    redis.call('RPUSH', KEYS[1], item)
+end
+local n = #items
+if ARGV[2] == '1' then
+    local item = redis.call('RPOPLPUSH', KEYS[3], KEYS[1])
+    while item do
+        n = n + 1
+        item = redis.call('RPOPLPUSH', KEYS[3], KEYS[1])
+    end
+end
+return n
+""")
+
+# KEYS: the in-flight set
+# ARGV: the new deadline, then the items
+_queue_touch = Script("""
+local n = 0
+for i = 2, #ARGV do
+    if redis.call('ZSCORE', KEYS[1], ARGV[i]) then
+        redis.call('ZADD', KEYS[1], ARGV[1], ARGV[i])
+        n = n + 1
+    end
+end
+return n
+""")
+
+# KEYS: the series, its sample counter, then the hash and the bucket
+#       index of each rollup
+# ARGV: the retention cutoff or '', the number of rollups, (interval,
+#       cutoff or '') per rollup, then (timestamp, value) per sample
+_series_append = Script("""
+local rollups = {}
+local i = 3
+for r = 1, tonumber(ARGV[2]) do
+    rollups[r] = {interval = tonumber(ARGV[i]), cutoff = ARGV[i + 1],
+                  hash = KEYS[2 * r + 1], index = KEYS[2 * r + 2]}
+    i = i + 2
+end
+
+local added = 0
+for j = i, #ARGV, 2 do
+    local ts, value = ARGV[j], ARGV[j + 1]
+    local seq = redis.call('INCR', KEYS[2])
+    local member = ts .. ':' .. seq .. ':' .. value
+    if redis.call('ZADD', KEYS[1], ts, member) == 1 then
+        added = added + 1
+        local v = tonumber(value)
+        for _, r in ipairs(rollups) do
+            local bucket = math.floor(tonumber(ts) / r.interval) * r.interval
+            local b = string.format('%d', bucket)
+            redis.call('HINCRBY', r.hash, b .. ':count', 1)
+            redis.call('HINCRBYFLOAT', r.hash, b .. ':sum', value)
+            local min = tonumber(redis.call('HGET', r.hash, b .. ':min'))
+            if not min or v < min then
+                redis.call('HSET', r.hash, b .. ':min', value)
+            end
+            local max = tonumber(redis.call('HGET', r.hash, b .. ':max'))
+            if not max or v > max then
+                redis.call('HSET', r.hash, b .. ':max', value)
+            end
+            redis.call('ZADD', r.index, bucket, b)
+        end
+    end
+end
+
+if ARGV[1] ~= '' then
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[1])
+end
+for _, r in ipairs(rollups) do
+    if r.cutoff ~= '' then
+        local old = redis.call('ZRANGEBYSCORE', r.index, '-inf',
+                               '(' .. r.cutoff)
+        for _, b in ipairs(old) do
+            redis.call('HDEL', r.hash, b .. ':count', b .. ':sum',
+                       b .. ':min', b .. ':max')
+        end
+        redis.call('ZREMRANGEBYSCORE', r.index, '-inf', '(' .. r.cutoff)
+    end
+end
+return added
+""")
+
+# KEYS: the series
+# ARGV: start, end, the interval
+# Returns (bucket, count, sum, min, max) per bucket, flattened.
+_series_buckets = Script("""
+local rows = redis.call('ZRANGEBYSCORE', KEYS[1], ARGV[1], ARGV[2],
+                        'WITHSCORES')
+local interval = tonumber(ARGV[3])
+local buckets, order = {}, {}
+for i = 1, #rows, 2 do
+    local member = rows[i]
+    local v = tonumber(string.match(member, '([^:]*)$'))
+    local b = math.floor(tonumber(rows[i + 1]) / interval) * interval
+    local s = buckets[b]
+    if not s then
+        s = {0, 0, v, v}
+        buckets[b] = s
+        order[#order + 1] = b
+    end
+    s[1] = s[1] + 1
+    s[2] = s[2] + v
+    if v < s[3] then
+        s[3] = v
+    end
+    if v > s[4] then
+        s[4] = v
+    end
+end
+local res = {}
+for _, b in ipairs(order) do
+    local s = buckets[b]
+    res[#res + 1] = string.format('%d', b)
+    res[#res + 1] = s[1]
+    for k = 2, 4 do
+        res[#res + 1] = string.format('%.17g', s[k])
+    end
+end
+return res
+""")
+
+# KEYS: the hash and the bucket index of a rollup
+# ARGV: start, end
+_series_rollup = Script("""
+local res = {}
+for _, b in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], ARGV[1], ARGV[2])) do
+    local s = redis.call('HMGET', KEYS[1], b .. ':count', b .. ':sum',
+                         b .. ':min', b .. ':max')
+    res[#res + 1] = b
+    for k = 1, 4 do
+        res[#res + 1] = s[k]
+    end
+end
+return res
+""")
+
+SERIES_AGGREGATES = ('avg', 'sum', 'min', 'max', 'count')
+
+_missing = object()
+
+CACHE_PREFIX = 'bredis:cache'
+
+
+def _chunks(args, size):
+    return [args[i:i + size] for i in xrange(0, len(args), size)]
+
+
+def _sum(res):
+    return sum(int(r) for r in res)
+
+
+def _concat(res):
+    return [r for chunk in res for r in chunk]
+
+
+def _first(res):
+    """Returns the first reply of a batch, None if it was queued."""
+    return None if res is None else res[0]
+
+
+def _any(res):
+    return any(int(r) for r in res)
+
+
+def _bools(res):
+    return [bool(int(r)) for r in _concat(res)]
+
+
+def _bit_ids(value):
+    """Returns the offsets of the bits set in the string value."""
+    ids = []
+    for i, c in enumerate(value or ''):
+        byte = ord(c)
+        for bit in xrange(8):
+            if byte & (0x80 >> bit):
+                ids.append(i * 8 + bit)
+    return ids
+
+
+def _number(value):
+    """Returns the number value as a string without loss."""
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _finite_number(value):
+    """Returns the finite number value, a string is read as a float.
+    Raises ValueError otherwise.
+    """
+    if not isinstance(value, (int, long, float)):
+        try:
+            value = float(value)
+        except TypeError:
+            raise ValueError("Not a number: %r" % (value,))
+    if math.isinf(value) or math.isnan(value):
+        raise ValueError("Not a finite number: %r" % (value,))
+    return _number(value)
+
+
+def _bucket_values(res, agg):
+    """Returns [(bucket, value)] from the flattened (bucket, count,
+    sum, min, max) replies of the series scripts.
+    """
+    values = []
+    for i in xrange(0, len(res), 5):
+        bucket, count, total, min, max = res[i:i + 5]
+        if count is None:
+            continue
+        count = int(count)
+        if agg == 'count':
+            value = count
+        elif agg == 'sum':
+            value = float(total)
+        elif agg == 'avg':
+            value = float(total) / count if count else None
+        elif agg == 'min':
+            value = float(min)
+        else:
+            value = float(max)
+        values.append((int(bucket), value))
+    return values
+
+
+def _samples(res):
+    """Returns [(timestamp, value)] from the members of a series."""
+    samples = []
+    for member in res:
+        parts = member.split(':')
+        samples.append((float(parts[0]), float(parts[-1])))
+    return samples
+
+
+def cache_key(op, keys):
+    """Returns the temp key of the result of op over the sets keys.
+
+    The key is derived from the operand keys, in order for
+    'sdiffstore' and sorted otherwise since the result does not
+    depend on it.
+    """
+    if op != 'sdiffstore':
+        keys = sorted(keys)
+    digest = hashlib.sha1('\x00'.join(keys)).hexdigest()
+    return '%s:%s:%s' % (CACHE_PREFIX, op[:-5], digest)
+
+
+def _delegate(name):
+    """Returns a method sending the command name on the key."""
+    def method(self, *args, **kwargs):
+        return getattr(self.db, name)(self.key, *args, **kwargs)
+    method.__name__ = name
+    return method
+
+
+class ContainerType(abc.ABCMeta):
+    """Metaclass of the containers.
+
+    Generates a method per name in ``DELEGATEABLE_METHODS`` when the
+    class is defined, e.g. ``Set.sadd(value)`` sends SADD on the key.
+    Methods defined by the class itself are kept. It derives from
+    ABCMeta so that ``Hash`` can also be a MutableMapping.
+    """
+    def __init__(cls, name, bases, attrs):
+        super(ContainerType, cls).__init__(name, bases, attrs)
+        for method in cls.DELEGATEABLE_METHODS:
+            if method not in attrs:
+                setattr(cls, method, _delegate(method))
 
 
 class Container(object):
@@ -13,10 +440,14 @@ class Container(object):
     Arguments:
         key -- the Redis key this container is stored at
         db  -- the Redis client object. Default: None
+        pipeline -- a pipeline the commands are queued on, e.g. the
+                    one of a ``Session``. Default: None
 
     When ``db`` is not set, the gets the default connection from
-    ``redisco.connection`` module.
+    ``bredis.get_client``.
     """
+    __metaclass__ = ContainerType
+
     def __init__(self, key, db=None, pipeline=None):
         self._db = db
         self.key = key
@@ -24,26 +455,75 @@ class Container(object):
 
     def clear(self):
         """Remove container from Redis database."""
-        del self.db[self.key]
-
-    def __getattribute__(self, att):
-        if att in object.__getattribute__(self, 'DELEGATEABLE_METHODS'):
-            return partial(getattr(object.__getattribute__(self, 'db'), att), self.key)
-        else:
-            return object.__getattribute__(self, att)
+        self.db.delete(self.key)
+
+    def clear_async(self, callback=None):
+        """Async clear."""
+        self.db.delete(self.key, callback=callback)
+
+    def _batch(self, script, command, args, chunk_size, func,
+            callback=None, keys=None):
+        """Runs command over args through script, chunk_size arguments
+        per call, and returns func(replies). command may also be a
+        list of leading arguments, keys defaults to the key of the
+        container.
+
+        The calls are sent in one pipeline, or queued on the pipeline
+        the container is attached to, in which case None is returned
+        (and passed to callback). Reads, whose replies the caller
+        needs, raise RuntimeError on an attached container.
+        """
+        if self.pipeline is not None and script is _each:
+            raise RuntimeError("%s reads cannot be queued on a pipeline."
+                               % self.__class__.__name__)
+        args = list(args)
+        if not args:
+            res = func([])
+            if callback:
+                callback(res)
+            return res
+        chunks = _chunks(args, chunk_size)
+        keys = keys or [self.key]
+        if not isinstance(command, list):
+            command = [command]
+        if self.pipeline is not None:
+            for chunk in chunks:
+                script(keys, command + chunk, db=self.pipeline)
+            if callback:
+                callback(None)
+            return None
+        pipeline = self.db.pipeline()
+        for chunk in chunks:
+            script(keys, command + chunk, db=pipeline)
+        if is_async():
+            on_response = _transform(callback, func)
+
+            def on_replies(res):
+                # the pipeline returns the error of a command among
+                # the replies
+                if isinstance(res, list):
+                    res = next((r for r in res if isinstance(r, Exception)),
+                               res)
+                on_response(res)
+
+            pipeline.execute(callback=on_replies)
+            return None
+        res = func(pipeline.execute())
+        if callback:
+            callback(res)
+        return res
 
     @property
     def db(self):
-        if self.pipeline:
+        # an empty redis-py pipeline is falsy, hence the 'is not None'
+        if self.pipeline is not None:
             return self.pipeline
-        if self._db:
-            return self._db
-        if hasattr(self, 'db_cache') and self.db_cache:
-            return self.db_cache
-        else:
-            from bredisco import connection
-            self.db_cache = connection
-            return self.db_cache
+        # the default client is looked up per call, so that a
+        # container follows setup_connection
+        db = self._db
+        if db is None:
+            db = get_client()
+        return instrument(db, self.__class__.__name__)
 
     DELEGATEABLE_METHODS = ()
 
@@ -85,6 +565,26 @@ class Set(Container):
     def __contains__(self, value):
         return self.sismember(value)
 
+    def add_many(self, values, chunk_size=BATCH_SIZE):
+        """Adds values with variadic SADDs of chunk_size members, sent
+        in one pipeline. Returns the number of members added.
+        """
+        return self._batch(_variadic, 'SADD', values, chunk_size, _sum)
+
+    def remove_many(self, values, chunk_size=BATCH_SIZE):
+        """Removes values, see ``add_many``. Returns the number of
+        members removed.
+        """
+        return self._batch(_variadic, 'SREM', values, chunk_size, _sum)
+
+    def contains_many(self, values, chunk_size=BATCH_SIZE):
+        """Returns whether each of values is a member, in order.
+
+        The SISMEMBERs run server-side, chunk_size per script call.
+        """
+        return self._batch(_each, 'SISMEMBER', values, chunk_size,
+                lambda res: [bool(r) for r in _concat(res)])
+
     def isdisjoint(self, other):
         """Return True if the set has no elements in common with other."""
         return not bool(self.db.sinter([self.key, other.key]))
@@ -180,6 +680,58 @@ class Set(Container):
     def __iter__(self):
         return self.members.__iter__()
 
+    def _cached(self, op, others, ttl, callback=None):
+        keys = [self.key] + [o.key for o in others]
+        key = cache_key(op, keys)
+        db = self.db
+        kwargs = {'callback': _transform(callback,
+                  lambda res: Set(key, db=self._db))} if callback else {}
+        _cached_store([key] + keys, [op, ttl], db=db, **kwargs)
+        return Set(key, db=self._db)
+
+    def cached_intersection(self, *others, **kwargs):
+        """Returns the intersection with others stored under a temp key.
+
+        The result is kept for ttl seconds (default: 60) under a key
+        derived from the operand keys, and reused by the following
+        calls until it expires, so it may lag behind the operands by
+        up to ttl. Empty results are not cached. Page through the
+        result with ``scan`` or ``sort_page``.
+        """
+        return self._cached('sinterstore', others, kwargs.get('ttl', 60))
+
+    def cached_union(self, *others, **kwargs):
+        """Returns the union with others stored under a temp key.
+
+        See ``cached_intersection``.
+        """
+        return self._cached('sunionstore', others, kwargs.get('ttl', 60))
+
+    def cached_difference(self, *others, **kwargs):
+        """Returns the difference with others stored under a temp key.
+
+        See ``cached_intersection``.
+        """
+        return self._cached('sdiffstore', others, kwargs.get('ttl', 60))
+
+    def scan(self, cursor=0, count=None):
+        """Returns (next cursor, members) of one SSCAN step.
+
+        The iteration is complete when the next cursor is 0.
+        """
+        args = [cursor] if count is None else [cursor, count]
+        cursor, members = _sscan([self.key], args, db=self.db)
+        return int(cursor), members
+
+    def sort_page(self, start=0, num=20, by=None, desc=False, alpha=False):
+        """Returns num members from start in sorted order.
+
+        Members are sorted as numbers, or as strings with alpha. by
+        names a pattern of keys to sort by, e.g. 'Post:*:score'.
+        """
+        return self.db.sort(self.key, start=start, num=num, by=by,
+                desc=desc, alpha=alpha)
+
     def sinter(self, *other_sets):
         """Performs an intersection between Sets.
 
@@ -201,6 +753,99 @@ class Set(Container):
         """
         return self.db.sdiff([self.key] + [s.key for s in other_sets])
 
+    # Async operations, the result is passed to callback
+
+    def all_async(self, callback=None):
+        self.smembers(callback=callback)
+
+    def add_async(self, value, callback=None):
+        self.sadd(value, callback=callback)
+
+    def remove_async(self, value, callback=None):
+        """Async remove, callback receives False if value was absent."""
+        self.srem(value, callback=_transform(callback, bool))
+
+    def pop_async(self, callback=None):
+        self.spop(callback=callback)
+
+    def discard_async(self, value, callback=None):
+        self.srem(value, callback=callback)
+
+    def len_async(self, callback=None):
+        self.scard(callback=callback)
+
+    def contains_async(self, value, callback=None):
+        self.sismember(value, callback=_transform(callback, bool))
+
+    def union_async(self, key, *others, **kwargs):
+        # the tornado client takes the keys before the destination
+        self.db.sunionstore([self.key] + [o.key for o in others], key,
+                callback=_transform(kwargs.get('callback'),
+                    lambda res: Set(key, db=self._db)))
+
+    def intersection_async(self, key, *others, **kwargs):
+        # the tornado client takes the keys before the destination
+        self.db.sinterstore([self.key] + [o.key for o in others], key,
+                callback=_transform(kwargs.get('callback'),
+                    lambda res: Set(key, db=self._db)))
+
+    def difference_async(self, key, *others, **kwargs):
+        # the tornado client takes the keys before the destination
+        self.db.sdiffstore([self.key] + [o.key for o in others], key,
+                callback=_transform(kwargs.get('callback'),
+                    lambda res: Set(key, db=self._db)))
+
+    def cached_intersection_async(self, *others, **kwargs):
+        """Async ``cached_intersection``, callback receives the Set."""
+        self._cached('sinterstore', others, kwargs.get('ttl', 60),
+                kwargs.get('callback'))
+
+    def cached_union_async(self, *others, **kwargs):
+        """Async ``cached_union``, callback receives the Set."""
+        self._cached('sunionstore', others, kwargs.get('ttl', 60),
+                kwargs.get('callback'))
+
+    def cached_difference_async(self, *others, **kwargs):
+        """Async ``cached_difference``, callback receives the Set."""
+        self._cached('sdiffstore', others, kwargs.get('ttl', 60),
+                kwargs.get('callback'))
+
+    def scan_async(self, cursor=0, count=None, callback=None):
+        """Async ``scan``, callback receives (next cursor, members)."""
+        args = [cursor] if count is None else [cursor, count]
+        _sscan([self.key], args, db=self.db, callback=_transform(callback,
+               lambda res: (int(res[0]), res[1])))
+
+    def sort_page_async(self, start=0, num=20, by=None, desc=False,
+            alpha=False, callback=None):
+        """Async ``sort_page``."""
+        self.db.sort(self.key, start=start, num=num, by=by, desc=desc,
+                alpha=alpha, callback=callback)
+
+    def add_many_async(self, values, chunk_size=BATCH_SIZE, callback=None):
+        self._batch(_variadic, 'SADD', values, chunk_size, _sum, callback)
+
+    def remove_many_async(self, values, chunk_size=BATCH_SIZE,
+            callback=None):
+        self._batch(_variadic, 'SREM', values, chunk_size, _sum, callback)
+
+    def contains_many_async(self, values, chunk_size=BATCH_SIZE,
+            callback=None):
+        self._batch(_each, 'SISMEMBER', values, chunk_size,
+                lambda res: [bool(r) for r in _concat(res)], callback)
+
+    def sinter_async(self, *other_sets, **kwargs):
+        self.db.sinter([self.key] + [s.key for s in other_sets],
+                callback=kwargs.get('callback'))
+
+    def sunion_async(self, *other_sets, **kwargs):
+        self.db.sunion([self.key] + [s.key for s in other_sets],
+                callback=kwargs.get('callback'))
+
+    def sdiff_async(self, *other_sets, **kwargs):
+        self.db.sdiff([self.key] + [s.key for s in other_sets],
+                callback=kwargs.get('callback'))
+
     DELEGATEABLE_METHODS = ('sadd', 'srem', 'spop', 'smembers',
             'scard', 'sismember', 'srandmember')
 
@@ -295,6 +940,53 @@ class List(Container):
         return "<%s '%s' %s>" % (self.__class__.__name__, self.key,
                 self.members)
 
+    # Async operations, the result is passed to callback
+
+    def all_async(self, callback=None):
+        self.lrange(0, -1, callback=callback)
+
+    def len_async(self, callback=None):
+        self.llen(callback=callback)
+
+    def get_async(self, index, callback=None):
+        """Async item access by index."""
+        self.lindex(index, callback=callback)
+
+    def range_async(self, start, end, callback=None):
+        self.lrange(start, end, callback=callback)
+
+    def set_async(self, index, value, callback=None):
+        self.lset(index, value, callback=callback)
+
+    def append_async(self, value, callback=None):
+        self.rpush(value, callback=callback)
+    push_async = append_async
+
+    def extend_async(self, iterable, callback=None):
+        """Async extend, sent in one pipeline."""
+        pipeline = self.db.pipeline()
+        for i in iterable:
+            pipeline.rpush(self.key, i)
+        pipeline.execute(callback=callback)
+
+    def pop_async(self, callback=None):
+        self.rpop(callback=callback)
+
+    def pop_onto_async(self, key, callback=None):
+        self.rpoplpush(key, callback=callback)
+
+    def shift_async(self, callback=None):
+        self.lpop(callback=callback)
+
+    def unshift_async(self, value, callback=None):
+        self.lpush(value, callback=callback)
+
+    def remove_async(self, value, num=1, callback=None):
+        self.lrem(value, num, callback=callback)
+
+    def trim_async(self, start, end, callback=None):
+        self.ltrim(start, end, callback=callback)
+
     DELEGATEABLE_METHODS = ('lrange', 'lpush', 'rpush', 'llen',
             'ltrim', 'lindex', 'lset', 'lpop', 'lrem', 'rpop', 'rpoplpush')
 
@@ -342,15 +1034,19 @@ class TypedList(object):
         else:
             return self.klass(value, *self._klass_args, **self._klass_kwargs)
 
-    def typecast_iter(self, values):
+    def typecast_iter(self, values, prefetch=()):
         if self._redisco_model:
-            return filter(lambda o: o is not None, [self.klass.objects.get_by_id(v) for v in values])
+            return self.klass.objects.get_by_ids(values, prefetch)
         else:
             return [self.klass(v, *self._klass_args, **self._klass_kwargs) for v in values]
 
-    def all(self):
-        """Returns all items in the list."""
-        return self.typecast_iter(self.list.all())
+    def all(self, prefetch=()):
+        """Returns all items in the list.
+
+        For a list of models, prefetch names the reference fields
+        to load along with the items.
+        """
+        return self.typecast_iter(self.list.all(), prefetch)
 
     def __len__(self):
         return len(self.list)
@@ -378,12 +1074,49 @@ class TypedList(object):
         self.list[index] = self.typecast_stor(value)
 
     def __iter__(self):
-        for i in xrange(len(self.list)):
-            yield self[i]
+        return iter(self.all())
 
     def __repr__(self):
         return repr(self.typecast_iter(self.list))
 
+    # Async operations, the result is passed to callback
+
+    def typecast_iter_async(self, values, callback=None):
+        """Async typecast, model instances are loaded in one pipeline."""
+        if self._redisco_model:
+            self.klass.objects.get_by_ids_async(values, as_dict=False,
+                    callback=callback)
+        else:
+            callback(self.typecast_iter(values))
+
+    def _on_values(self, callback):
+        def on_response(values):
+            if isinstance(values, Exception):
+                callback(values)
+            else:
+                self.typecast_iter_async(values, callback)
+        return on_response
+
+    def all_async(self, callback=None):
+        self.list.all_async(self._on_values(callback))
+
+    def range_async(self, start, end, callback=None):
+        self.list.range_async(start, end, self._on_values(callback))
+
+    def get_async(self, index, callback=None):
+        self.range_async(index, index, _transform(callback,
+            lambda values: values[0] if values else None))
+
+    def len_async(self, callback=None):
+        self.list.len_async(callback)
+
+    def append_async(self, value, callback=None):
+        self.list.append_async(self.typecast_stor(value), callback)
+
+    def extend_async(self, iter, callback=None):
+        self.list.extend_async(map(lambda i: self.typecast_stor(i), iter),
+                callback)
+
 
 class SortedSet(Container):
 
@@ -395,6 +1128,43 @@ class SortedSet(Container):
         """Removes member from set."""
         self.zrem(member)
 
+    def add_many(self, scores, chunk_size=BATCH_SIZE):
+        """Adds the members of the dict {member: score} with variadic
+        ZADDs of chunk_size members, sent in one pipeline. Returns the
+        number of members added.
+        """
+        return self._batch(_variadic, 'ZADD', self._score_args(scores),
+                chunk_size * 2, _sum)
+
+    @staticmethod
+    def _score_args(scores):
+        args = []
+        for member, score in scores.iteritems():
+            args.extend([score, member])
+        return args
+
+    def remove_many(self, members, chunk_size=BATCH_SIZE):
+        """Removes members, see ``add_many``. Returns the number of
+        members removed.
+        """
+        return self._batch(_variadic, 'ZREM', members, chunk_size, _sum)
+
+    def scores_many(self, members, chunk_size=BATCH_SIZE):
+        """Returns the score of each of members, in order, None for
+        the missing ones.
+        """
+        return self._batch(_each, 'ZSCORE', members, chunk_size,
+                self._scores)
+
+    @staticmethod
+    def _scores(res):
+        return [None if r is None else float(r) for r in _concat(res)]
+
+    def contains_many(self, members, chunk_size=BATCH_SIZE):
+        """Returns whether each of members is in the set, in order."""
+        return self._batch(_each, 'ZSCORE', members, chunk_size,
+                lambda res: [r is not None for r in _concat(res)])
+
     def incr_by(self, member, increment):
         """Increments the member by increment."""
         self.zincrby(member, increment)
@@ -502,6 +1272,70 @@ class SortedSet(Container):
         """
         return self.zrangebyscore(value, value)
 
+    # Async operations, the result is passed to callback
+
+    def add_async(self, member, score, callback=None):
+        self.zadd(score, member, callback=callback)
+
+    def remove_async(self, member, callback=None):
+        self.zrem(member, callback=callback)
+
+    def add_many_async(self, scores, chunk_size=BATCH_SIZE, callback=None):
+        self._batch(_variadic, 'ZADD', self._score_args(scores),
+                chunk_size * 2, _sum, callback)
+
+    def remove_many_async(self, members, chunk_size=BATCH_SIZE,
+            callback=None):
+        self._batch(_variadic, 'ZREM', members, chunk_size, _sum, callback)
+
+    def scores_many_async(self, members, chunk_size=BATCH_SIZE,
+            callback=None):
+        self._batch(_each, 'ZSCORE', members, chunk_size, self._scores,
+                callback)
+
+    def contains_many_async(self, members, chunk_size=BATCH_SIZE,
+            callback=None):
+        self._batch(_each, 'ZSCORE', members, chunk_size,
+                lambda res: [r is not None for r in _concat(res)], callback)
+
+    def incr_by_async(self, member, increment, callback=None):
+        self.zincrby(member, increment, callback=callback)
+
+    def rank_async(self, member, callback=None):
+        self.zrank(member, callback=callback)
+
+    def revrank_async(self, member, callback=None):
+        self.zrevrank(member, callback=callback)
+
+    def score_async(self, member, callback=None):
+        self.zscore(member, callback=callback)
+
+    def len_async(self, callback=None):
+        self.zcard(callback=callback)
+
+    def contains_async(self, member, callback=None):
+        self.zscore(member, callback=_transform(callback,
+            lambda score: score is not None))
+
+    def range_async(self, start, stop, callback=None):
+        self.zrange(start, stop, False, callback=callback)
+
+    def members_async(self, callback=None):
+        self.zrange(0, -1, False, callback=callback)
+
+    def revmembers_async(self, callback=None):
+        self.zrevrange(0, -1, False, callback=callback)
+
+    def between_async(self, min, max, limit=None, offset=None,
+            callback=None):
+        if limit is not None and offset is None:
+            offset = 0
+        self.zrangebyscore(min, max, offset, limit, False,
+                callback=callback)
+
+    def eq_async(self, value, callback=None):
+        self.zrangebyscore(value, value, callback=callback)
+
     DELEGATEABLE_METHODS = ('zadd', 'zrem', 'zincrby', 'zrank',
             'zrevrank', 'zrange', 'zrevrange', 'zrangebyscore', 'zcard',
             'zscore', 'zremrangebyrank', 'zremrangebyscore')
@@ -551,16 +1385,896 @@ class Hash(Container, collections.MutableMapping):
     def values(self):
         return self.hvals()
 
+    def items(self):
+        return self.hgetall().items()
+
+    def iteritems(self):
+        return self.hgetall().iteritems()
+
+    def get(self, att, default=None):
+        value = self.hget(att)
+        return default if value is None else value
+
+    def get_many(self, atts):
+        """Returns the values of atts as a dict, in one HMGET.
+
+        Missing fields are set to None.
+        """
+        atts = list(atts)
+        if not atts:
+            return {}
+        return self._many_dict(atts, self.hmget(atts))
+
+    @staticmethod
+    def _many_dict(atts, values):
+        # the async client replies with a dict, the sync one a list
+        if isinstance(values, dict):
+            return dict((k, values.get(k)) for k in atts)
+        return dict(zip(atts, values))
+
+    def update(self, *args, **kwargs):
+        """Sets the fields of a dict and kwargs in one HMSET."""
+        d = dict(*args, **kwargs)
+        if d:
+            self.hmset(d)
+
+    def pop(self, att, default=_missing):
+        """Removes att and returns its value, atomically."""
+        value = _hash_pop([self.key], [att], db=self.db)
+        if value is None:
+            if default is _missing:
+                raise KeyError(att)
+            return default
+        return value
+
+    def setdefault(self, att, default=None):
+        """Sets att to default unless it exists, and returns its value.
+
+        Both are done atomically, default is stored as a string. A
+        None default is not stored: the hash is left unchanged and the
+        value of att, or None, is returned.
+        """
+        if default is None:
+            return self.hget(att)
+        return _hash_setdefault([self.key], [att, default], db=self.db)
+
+    def replace(self, d):
+        """Replaces the whole content of the hash with d, atomically."""
+        _hash_replace([self.key], self._flatten(d), db=self.db)
+
+    @staticmethod
+    def _flatten(d):
+        args = []
+        for k, v in d.iteritems():
+            args.extend([k, v])
+        return args
+
+    def incr(self, att, amount=1):
+        """Increments the integer value of att, returns the new value."""
+        return self.hincrby(att, amount)
+
+    def incr_float(self, att, amount=1.0):
+        """Increments the float value of att, returns the new value."""
+        return float(_hash_incr([self.key], [att, amount, 'f'],
+                db=self.db)[0])
+
+    def incr_many(self, amounts):
+        """Increments several fields at once.
+
+        amounts maps the fields to their increment, float increments
+        use HINCRBYFLOAT. Returns the new values by field.
+        """
+        atts, args = self._incr_args(amounts)
+        return self._incr_dict(amounts, atts,
+                _hash_incr([self.key], args, db=self.db))
+
+    @staticmethod
+    def _incr_args(amounts):
+        atts, args = [], []
+        for k, v in amounts.iteritems():
+            atts.append(k)
+            args.extend([k, v, 'f' if isinstance(v, float) else ''])
+        return atts, args
+
+    @staticmethod
+    def _incr_dict(amounts, atts, values):
+        return dict((k, float(v) if isinstance(amounts[k], float) else int(v))
+                    for k, v in zip(atts, values))
+
     def _get_dict(self):
         return self.hgetall()
 
     def _set_dict(self, new_dict):
-        self.clear()
-        self.update(new_dict)
+        self.replace(new_dict)
 
     dict = property(_get_dict, _set_dict)
 
+    # Async operations, the result is passed to callback
+
+    def get_async(self, att, callback=None):
+        self.hget(att, callback=callback)
+
+    def set_async(self, att, val, callback=None):
+        self.hset(att, val, callback=callback)
+
+    def delete_async(self, att, callback=None):
+        self.hdel(att, callback=callback)
+
+    def len_async(self, callback=None):
+        self.hlen(callback=callback)
+
+    def contains_async(self, att, callback=None):
+        self.hexists(att, callback=_transform(callback, bool))
+
+    def keys_async(self, callback=None):
+        self.hkeys(callback=callback)
+
+    def values_async(self, callback=None):
+        self.hvals(callback=callback)
+
+    def dict_async(self, callback=None):
+        self.hgetall(callback=callback)
+
+    def update_async(self, d, callback=None):
+        if not d:
+            if callback:
+                callback(True)
+            return
+        self.hmset(d, callback=callback)
+
+    def get_many_async(self, atts, callback=None):
+        """Async ``get_many``."""
+        atts = list(atts)
+        if not atts:
+            callback({})
+            return
+        self.hmget(atts, callback=_transform(callback,
+                   lambda res: self._many_dict(atts, res)))
+
+    def pop_async(self, att, default=None, callback=None):
+        """Async ``pop``, callback receives default if att is missing."""
+        _hash_pop([self.key], [att], db=self.db, callback=_transform(
+                  callback, lambda res: default if res is None else res))
+
+    def setdefault_async(self, att, default=None, callback=None):
+        """Async ``setdefault``."""
+        if default is None:
+            self.hget(att, callback=callback)
+            return
+        _hash_setdefault([self.key], [att, default], db=self.db,
+                callback=callback)
+
+    def replace_async(self, d, callback=None):
+        """Async ``replace``."""
+        _hash_replace([self.key], self._flatten(d), db=self.db,
+                callback=callback)
+
+    def incr_async(self, att, amount=1, callback=None):
+        self.hincrby(att, amount, callback=callback)
+
+    def incr_float_async(self, att, amount=1.0, callback=None):
+        _hash_incr([self.key], [att, amount, 'f'], db=self.db,
+                callback=_transform(callback, lambda res: float(res[0])))
+
+    def incr_many_async(self, amounts, callback=None):
+        """Async ``incr_many``."""
+        atts, args = self._incr_args(amounts)
+        _hash_incr([self.key], args, db=self.db, callback=_transform(
+                   callback, lambda res: self._incr_dict(amounts, atts, res)))
+
     DELEGATEABLE_METHODS = ('hlen', 'hset', 'hdel', 'hkeys',
             'hgetall', 'hvals', 'hget', 'hexists', 'hincrby',
             'hmget', 'hmset')
 
+
+
+class Queue(Container):
+    """A reliable work queue stored in Redis.
+
+    Arguments:
+        key -- the Redis key of the list of pending items
+        visibility_timeout -- seconds a popped item stays in flight
+                              before ``reclaim`` requeues it.
+                              Default: 30
+        db, pipeline -- see ``Container``
+
+    Items are pushed on the list at key, and popped in batches into
+    the sorted set ``<key>:inflight``, scored by their deadline. ``ack``
+    removes the processed items and ``reclaim`` pushes back the ones
+    whose deadline passed, so delivery is at-least-once. In-flight
+    items are members of a set, so the items should be unique, e.g.
+    job ids. The blocking pops are sent on a client of their own, see
+    ``bredis.get_blocking_client``, unless db is given.
+
+    Example:
+
+        queue = Queue('jobs')
+        queue.push_many(job_ids)
+        items = queue.pop(100, timeout=5)
+        ...
+        queue.ack(items)
+    """
+    def __init__(self, key, visibility_timeout=30, db=None, pipeline=None):
+        super(Queue, self).__init__(key, db, pipeline)
+        self.visibility_timeout = visibility_timeout
+        self.inflight_key = '%s:inflight' % key
+        # holds an item between a blocking pop and its registration
+        self.claimed_key = '%s:claimed' % key
+        self._blocking = None
+
+    def __len__(self):
+        """Returns the number of pending items."""
+        return self.llen()
+
+    def __repr__(self):
+        return "<%s '%s'>" % (self.__class__.__name__, self.key)
+
+    def inflight_len(self):
+        """Returns the number of items popped and not acked."""
+        return self.db.zcard(self.inflight_key)
+
+    def clear(self):
+        """Removes the queue and its in-flight items."""
+        self.db.delete(self.key, self.inflight_key, self.claimed_key)
+
+    def push(self, *items):
+        """Pushes items, returns the number of pending items."""
+        return self.push_many(items)
+
+    def push_many(self, items, chunk_size=BATCH_SIZE):
+        """Pushes items with variadic LPUSHs in one pipeline."""
+        return self._batch(_variadic, 'LPUSH', items, chunk_size,
+                lambda res: int(res[-1]) if res else 0)
+
+    @property
+    def blocking_db(self):
+        """The client the blocking pops are sent on."""
+        if self.pipeline is not None or self._db is not None:
+            return self.db
+        # kept while the default client is the same
+        client = get_client()
+        if self._blocking is None or self._blocking[0] is not client:
+            self._blocking = (client, get_blocking_client())
+        return instrument(self._blocking[1], self.__class__.__name__)
+
+    def _deadline(self, visibility_timeout=None):
+        return time.time() + (visibility_timeout or self.visibility_timeout)
+
+    def _pop_script(self, count, claimed=None, db=None, callback=None):
+        args = [count, self._deadline()]
+        if claimed is not None:
+            args.append(claimed)
+        return _queue_pop([self.key, self.inflight_key, self.claimed_key],
+                args, db=db or self.db, callback=callback)
+
+    def pop(self, count=1, timeout=None):
+        """Pops up to count items, oldest first, in one round trip.
+
+        With a timeout in seconds (0 for no limit), waits with
+        BRPOPLPUSH for an item when the queue is empty. Returns the
+        list of items, empty if none came.
+        """
+        items = self._pop_script(count)
+        if items or timeout is None:
+            return items
+        item = self.blocking_db.brpoplpush(self.key, self.claimed_key,
+                timeout)
+        if item is None:
+            return []
+        return self._pop_script(count, item)
+
+    def ack(self, items, chunk_size=BATCH_SIZE):
+        """Acknowledges processed items, returns how many were in
+        flight.
+        """
+        return self._batch(_variadic, 'ZREM', items, chunk_size, _sum,
+                keys=[self.inflight_key])
+
+    def touch(self, items, visibility_timeout=None):
+        """Extends the deadline of in-flight items, returns how many
+        were in flight.
+        """
+        items = list(items)
+        if not items:
+            return 0
+        return _queue_touch([self.inflight_key],
+                [self._deadline(visibility_timeout)] + items, db=self.db)
+
+    def reclaim(self, orphans=False):
+        """Requeues the in-flight items whose deadline passed, returns
+        how many.
+
+        With orphans, the items left claimed by a consumer that died
+        during a blocking pop are requeued too. A running consumer may
+        then get its item twice.
+        """
+        return _queue_reclaim([self.key, self.inflight_key,
+                self.claimed_key], [time.time(), int(orphans)], db=self.db)
+
+    def consume(self, handler, count=10, timeout=1, reclaim_interval=None):
+        """Starts a ``QueueConsumer`` on the tornado IOLoop and
+        returns it.
+        """
+        consumer = QueueConsumer(self, handler, count, timeout,
+                reclaim_interval)
+        consumer.start()
+        return consumer
+
+    # Async operations, the result is passed to callback
+
+    def clear_async(self, callback=None):
+        self.db.delete(self.key, self.inflight_key, self.claimed_key,
+                callback=callback)
+
+    def len_async(self, callback=None):
+        self.llen(callback=callback)
+
+    def inflight_len_async(self, callback=None):
+        self.db.zcard(self.inflight_key, callback=callback)
+
+    def push_async(self, item, callback=None):
+        self.push_many_async([item], callback=callback)
+
+    def push_many_async(self, items, chunk_size=BATCH_SIZE, callback=None):
+        self._batch(_variadic, 'LPUSH', items, chunk_size,
+                lambda res: int(res[-1]) if res else 0, callback)
+
+    def pop_async(self, count=1, timeout=None, callback=None):
+        """Async ``pop``, callback receives the list of items."""
+        def on_claimed(item):
+            if isinstance(item, Exception):
+                callback(item)
+            elif item is None:
+                callback([])
+            else:
+                self._pop_script(count, item, callback=callback)
+
+        def on_items(items):
+            if items or timeout is None or isinstance(items, Exception):
+                callback(items)
+                return
+            self.blocking_db.brpoplpush(self.key, self.claimed_key, timeout,
+                    callback=on_claimed)
+
+        self._pop_script(count, callback=on_items)
+
+    def ack_async(self, items, chunk_size=BATCH_SIZE, callback=None):
+        self._batch(_variadic, 'ZREM', items, chunk_size, _sum, callback,
+                keys=[self.inflight_key])
+
+    def touch_async(self, items, visibility_timeout=None, callback=None):
+        items = list(items)
+        if not items:
+            if callback:
+                callback(0)
+            return
+        _queue_touch([self.inflight_key],
+                [self._deadline(visibility_timeout)] + items, db=self.db,
+                callback=callback)
+
+    def reclaim_async(self, orphans=False, callback=None):
+        _queue_reclaim([self.key, self.inflight_key, self.claimed_key],
+                [time.time(), int(orphans)], db=self.db, callback=callback)
+
+    DELEGATEABLE_METHODS = ('llen',)
+
+
+class QueueConsumer(object):
+    """Consumes a ``Queue`` on the tornado IOLoop.
+
+    Arguments:
+        queue -- the Queue
+        handler -- called as handler(items, done) with each batch
+        count -- the maximum number of items per batch. Default: 10
+        timeout -- seconds each blocking pop waits. Default: 1
+        reclaim_interval -- seconds between two ``reclaim`` of the
+                            queue, None not to reclaim. Default: None
+
+    The handler calls ``done()`` to ack the whole batch, or
+    ``done(items)`` to ack some of them; the others are delivered
+    again after the visibility timeout. The next batch is popped once
+    the ack is sent back. Only the first call of ``done`` counts.
+    """
+    def __init__(self, queue, handler, count=10, timeout=1,
+            reclaim_interval=None):
+        self.queue = queue
+        self.handler = handler
+        self.count = count
+        self.timeout = timeout
+        self.reclaim_interval = reclaim_interval
+        self._running = False
+        self._reclaimer = None
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        if self.reclaim_interval:
+            from tornado.ioloop import PeriodicCallback
+            self._reclaimer = PeriodicCallback(self.queue.reclaim_async,
+                    self.reclaim_interval * 1000)
+            self._reclaimer.start()
+        self._next()
+
+    def stop(self):
+        """Stops after the batch being processed."""
+        self._running = False
+        if self._reclaimer is not None:
+            self._reclaimer.stop()
+            self._reclaimer = None
+
+    def _next(self):
+        if self._running:
+            self.queue.pop_async(self.count, self.timeout,
+                    callback=self._on_items)
+
+    def _later(self, seconds=1):
+        from tornado.ioloop import IOLoop
+        IOLoop.instance().add_timeout(time.time() + seconds, self._next)
+
+    def _on_items(self, items):
+        if isinstance(items, Exception):
+            logging.error(u'Queue %s error: [%s]', self.queue.key, items)
+            self._later()
+            return
+        if not items:
+            if self.timeout:
+                self._next()
+            else:
+                self._later()
+            return
+
+        called = []
+
+        def done(acked=None):
+            if called:
+                logging.warning(u'Queue %s batch done more than once',
+                        self.queue.key)
+                return
+            called.append(True)
+            self.queue.ack_async(items if acked is None else acked,
+                    callback=lambda res: self._next())
+
+        try:
+            self.handler(items, done)
+        except Exception as e:
+            # the items are delivered again after the visibility timeout
+            logging.error(u'Queue %s handler error: [%s]', self.queue.key, e)
+            if not called:
+                called.append(True)
+                self._next()
+
+
+class HyperLogLog(Container):
+    """A HyperLogLog stored in Redis, estimates the number of unique
+    values added with a standard error of 0.81% in at most 12KB.
+    """
+
+    def add(self, *values):
+        """Adds values, returns True if the estimate changed."""
+        return self.add_many(values)
+
+    def add_many(self, values, chunk_size=BATCH_SIZE):
+        """Adds values with variadic PFADDs in one pipeline."""
+        return self._batch(_variadic, 'PFADD', values, chunk_size, _any)
+
+    def count(self, *others):
+        """Returns the estimated number of unique values, in the
+        union with the others if given.
+        """
+        return int(_command([self.key] + [o.key for o in others],
+                ['PFCOUNT'], db=self.db))
+
+    def __len__(self):
+        return self.count()
+
+    def merge(self, *others):
+        """Merges the others into this HyperLogLog."""
+        _command([self.key] + [o.key for o in others], ['PFMERGE'],
+                db=self.db)
+
+    def __repr__(self):
+        return "<%s '%s'>" % (self.__class__.__name__, self.key)
+
+    # Async operations, the result is passed to callback
+
+    def add_async(self, value, callback=None):
+        self.add_many_async([value], callback=callback)
+
+    def add_many_async(self, values, chunk_size=BATCH_SIZE, callback=None):
+        self._batch(_variadic, 'PFADD', values, chunk_size, _any, callback)
+
+    def count_async(self, *others, **kwargs):
+        _command([self.key] + [o.key for o in others], ['PFCOUNT'],
+                db=self.db, callback=kwargs.get('callback'))
+
+    def merge_async(self, *others, **kwargs):
+        _command([self.key] + [o.key for o in others], ['PFMERGE'],
+                db=self.db, callback=kwargs.get('callback'))
+
+
+class Bitmap(Container):
+    """A bitmap stored in Redis, keyed by integer ids.
+
+    A bit per id, so a million ids take 125KB. Keep the ids dense,
+    the string grows up to the highest id set.
+    """
+
+    def set(self, id, value=True):
+        """Sets the bit of id, returns its previous value."""
+        return bool(self.setbit(int(id), int(bool(value))))
+
+    def get(self, id):
+        return bool(self.getbit(int(id)))
+
+    def __contains__(self, id):
+        return self.get(id)
+
+    def set_many(self, ids, value=True, chunk_size=BATCH_SIZE):
+        """Sets the bits of ids in one pipeline, returns their previous
+        values in order.
+        """
+        return self._batch(_setbits, int(bool(value)),
+                [int(id) for id in ids], chunk_size, _bools)
+
+    def get_many(self, ids, chunk_size=BATCH_SIZE):
+        """Returns the bits of ids in order, in one pipeline."""
+        return self._batch(_each, 'GETBIT', [int(id) for id in ids],
+                chunk_size, _bools)
+
+    def count(self):
+        """Returns the number of ids set (BITCOUNT)."""
+        return int(_command([self.key], ['BITCOUNT'], db=self.db))
+
+    def __len__(self):
+        return self.count()
+
+    def ids(self):
+        """Returns the ids set, reading the whole bitmap."""
+        return _bit_ids(self.db.get(self.key))
+
+    def bitop(self, op, key, *others):
+        """Stores op ('AND', 'OR', 'XOR' or 'NOT') of the bitmap and
+        others at key, returns the Bitmap at key.
+        """
+        _bitop([key, self.key] + [o.key for o in others], [op.upper()],
+                db=self.db)
+        return Bitmap(key, db=self._db)
+
+    def intersection(self, key, *others):
+        return self.bitop('AND', key, *others)
+
+    def union(self, key, *others):
+        return self.bitop('OR', key, *others)
+
+    def bitfield(self, *args):
+        """Runs BITFIELD with args, e.g.
+        ``bitfield('INCRBY', 'u8', '#3', 1)``.
+        """
+        return _command([self.key], ['BITFIELD'] + list(args), db=self.db)
+
+    def __repr__(self):
+        return "<%s '%s'>" % (self.__class__.__name__, self.key)
+
+    # Async operations, the result is passed to callback
+
+    def set_async(self, id, value=True, callback=None):
+        self.setbit(int(id), int(bool(value)),
+                callback=_transform(callback, bool))
+
+    def get_async(self, id, callback=None):
+        self.getbit(int(id), callback=_transform(callback, bool))
+
+    def set_many_async(self, ids, value=True, chunk_size=BATCH_SIZE,
+            callback=None):
+        self._batch(_setbits, int(bool(value)), [int(id) for id in ids],
+                chunk_size, _bools, callback)
+
+    def get_many_async(self, ids, chunk_size=BATCH_SIZE, callback=None):
+        self._batch(_each, 'GETBIT', [int(id) for id in ids], chunk_size,
+                _bools, callback)
+
+    def count_async(self, callback=None):
+        _command([self.key], ['BITCOUNT'], db=self.db, callback=callback)
+
+    def ids_async(self, callback=None):
+        self.db.get(self.key, callback=_transform(callback, _bit_ids))
+
+    def bitop_async(self, op, key, *others, **kwargs):
+        _bitop([key, self.key] + [o.key for o in others], [op.upper()],
+                db=self.db, callback=_transform(kwargs.get('callback'),
+                    lambda res: Bitmap(key, db=self._db)))
+
+    def bitfield_async(self, *args, **kwargs):
+        _command([self.key], ['BITFIELD'] + list(args), db=self.db,
+                callback=kwargs.get('callback'))
+
+    DELEGATEABLE_METHODS = ('setbit', 'getbit')
+
+
+class BloomFilter(Container):
+    """A Bloom filter stored in a Redis bitmap.
+
+    Arguments:
+        key -- the Redis key of the bitmap
+        capacity -- the number of values expected. Default: 1000000
+        error_rate -- the false positive rate at capacity.
+                      Default: 0.01
+
+    Checks never miss an added value, and wrongly accept a value not
+    added at about error_rate. The size is computed from capacity
+    and error_rate, e.g. 1.2MB for a million values at 1%, so keep
+    them the same for a key. Values cannot be removed.
+    """
+    def __init__(self, key, capacity=1000000, error_rate=0.01, db=None,
+            pipeline=None):
+        super(BloomFilter, self).__init__(key, db, pipeline)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = int(math.ceil(-capacity * math.log(error_rate) /
+                                  math.log(2) ** 2))
+        if self.size > 2 ** 32:
+            raise ValueError("A Bloom filter is limited to 2^32 bits.")
+        self.hashes = max(1, int(round(self.size / float(capacity) *
+                                       math.log(2))))
+
+    def offsets(self, value):
+        """Returns the bits of value, by double hashing its md5."""
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        digest = hashlib.md5(str(value)).hexdigest()
+        h1, h2 = int(digest[:16], 16), int(digest[16:], 16)
+        return [(h1 + i * h2) % self.size for i in xrange(self.hashes)]
+
+    def _offsets(self, values):
+        offsets = []
+        for value in values:
+            offsets.extend(self.offsets(value))
+        return offsets
+
+    def _groups(self, bits, func):
+        k = self.hashes
+        return [func(bits[i:i + k]) for i in xrange(0, len(bits), k)]
+
+    def add(self, value):
+        """Adds value, returns False if it may have been added already.
+
+        On a pipeline the add is queued and None is returned.
+        """
+        return _first(self.add_many([value]))
+
+    def add_many(self, values, chunk_size=BATCH_SIZE):
+        """Adds values in one pipeline, chunk_size values per script
+        call. Returns for each value False if it may have been added
+        already.
+        """
+        return self._batch(_setbits, 1, self._offsets(values),
+                chunk_size * self.hashes,
+                lambda res: self._groups(_bools(res), lambda b: not all(b)))
+
+    def __contains__(self, value):
+        return _first(self.contains_many([value]))
+
+    def contains_many(self, values, chunk_size=BATCH_SIZE):
+        """Returns for each value whether it may have been added."""
+        return self._batch(_each, 'GETBIT', self._offsets(values),
+                chunk_size * self.hashes,
+                lambda res: self._groups(_bools(res), all))
+
+    def __repr__(self):
+        return "<%s '%s' %d bits %d hashes>" % (self.__class__.__name__,
+                self.key, self.size, self.hashes)
+
+    # Async operations, the result is passed to callback
+
+    def add_async(self, value, callback=None):
+        self.add_many_async([value], callback=_transform(callback, _first))
+
+    def add_many_async(self, values, chunk_size=BATCH_SIZE, callback=None):
+        self._batch(_setbits, 1, self._offsets(values),
+                chunk_size * self.hashes,
+                lambda res: self._groups(_bools(res), lambda b: not all(b)),
+                callback)
+
+    def contains_async(self, value, callback=None):
+        self.contains_many_async([value], callback=_transform(callback,
+                _first))
+
+    def contains_many_async(self, values, chunk_size=BATCH_SIZE,
+            callback=None):
+        self._batch(_each, 'GETBIT', self._offsets(values),
+                chunk_size * self.hashes,
+                lambda res: self._groups(_bools(res), all), callback)
+
+
+class TimeSeries(Container):
+    """A series of numeric samples stored in a sorted set scored by
+    timestamp.
+
+    Arguments:
+        key -- the Redis key of the sorted set
+        retention -- seconds the samples are kept, trimmed on each
+                     append. Default: None, kept forever
+        rollups -- the bucket intervals in seconds maintained on
+                   write, or (interval, retention) pairs, e.g.
+                   ``(60, (3600, 86400 * 365))``. Default: ()
+        db, pipeline -- see ``Container``
+
+    A sample is the member '<timestamp>:<seq>:<value>', where seq
+    comes from the counter ``<key>:seq``, so that equal samples are
+    all kept. Each rollup keeps the count, sum, min and max per
+    bucket in the hash ``<key>:rollup:<interval>``, with the sorted
+    set ``<key>:rollup:<interval>:buckets`` indexing the buckets for
+    range reads and retention.
+    """
+    def __init__(self, key, retention=None, rollups=(), db=None,
+            pipeline=None):
+        super(TimeSeries, self).__init__(key, db, pipeline)
+        self.retention = retention
+        self.rollups = []
+        for rollup in rollups:
+            if isinstance(rollup, (tuple, list)):
+                interval, rollup_retention = rollup
+            else:
+                interval, rollup_retention = rollup, None
+            self._check_interval(interval)
+            self.rollups.append((int(interval), rollup_retention))
+
+    @property
+    def seq_key(self):
+        """Returns the key of the counter of the samples."""
+        return '%s:seq' % self.key
+
+    def rollup_keys(self, interval):
+        """Returns (hash, bucket index) keys of the rollup."""
+        key = '%s:rollup:%d' % (self.key, interval)
+        return key, key + ':buckets'
+
+    def _append_args(self):
+        """Returns (keys, leading args) of the append script."""
+        now = time.time()
+        keys = [self.key, self.seq_key]
+        args = [_number(now - self.retention) if self.retention else '',
+                len(self.rollups)]
+        for interval, retention in self.rollups:
+            keys.extend(self.rollup_keys(interval))
+            args.extend([interval,
+                         _number(now - retention) if retention else ''])
+        return keys, args
+
+    def _sample_args(self, samples):
+        args = []
+        for ts, value in samples:
+            # the script would store a bad sample before failing on
+            # it, so the samples are checked before anything is sent
+            args.extend([_finite_number(ts), _finite_number(value)])
+        return args
+
+    def append(self, value, timestamp=None):
+        """Appends a sample, at the current time by default."""
+        if timestamp is None:
+            timestamp = time.time()
+        return self.append_many([(timestamp, value)])
+
+    def append_many(self, samples, chunk_size=BATCH_SIZE):
+        """Appends the (timestamp, value) samples in one pipeline,
+        chunk_size samples per script call, updating the rollups and
+        trimming past the retention. Returns the number of samples
+        added.
+        """
+        keys, args = self._append_args()
+        return self._batch(_series_append, args, self._sample_args(samples),
+                chunk_size * 2, _sum, keys=keys)
+
+    def range(self, start=None, end=None):
+        """Returns the (timestamp, value) samples between start and end."""
+        return _samples(self.db.zrangebyscore(self.key,
+                '-inf' if start is None else start,
+                '+inf' if end is None else end))
+
+    def aggregate(self, interval, agg='avg', start=None, end=None):
+        """Returns [(bucket, value)] with agg ('avg', 'sum', 'min',
+        'max' or 'count') of the samples per interval seconds.
+
+        The samples are bucketed by a script, only the buckets are
+        transferred. Use ``rollup`` for the maintained intervals.
+        """
+        self._check_agg(agg)
+        self._check_interval(interval)
+        return _bucket_values(_series_buckets([self.key],
+                self._range_args(start, end) + [interval], db=self.db), agg)
+
+    def rollup(self, interval, agg='avg', start=None, end=None):
+        """Returns [(bucket, value)] of a rollup maintained on write,
+        see ``aggregate``.
+        """
+        self._check_agg(agg)
+        return _bucket_values(_series_rollup(self.rollup_keys(interval),
+                self._range_args(start, end), db=self.db), agg)
+
+    def trim(self):
+        """Removes the samples past the retention."""
+        if self.retention:
+            return self.db.zremrangebyscore(self.key, '-inf',
+                    '(%s' % _number(time.time() - self.retention))
+        return 0
+
+    def __len__(self):
+        return self.db.zcard(self.key)
+
+    def __repr__(self):
+        return "<%s '%s'>" % (self.__class__.__name__, self.key)
+
+    def clear(self):
+        """Removes the series and its rollups."""
+        self.db.delete(*self._keys())
+
+    def _keys(self):
+        keys = [self.key, self.seq_key]
+        for interval, retention in self.rollups:
+            keys.extend(self.rollup_keys(interval))
+        return keys
+
+    @staticmethod
+    def _check_agg(agg):
+        if agg not in SERIES_AGGREGATES:
+            raise ValueError("Unknown aggregate %s" % agg)
+
+    @staticmethod
+    def _check_interval(interval):
+        if not interval > 0:
+            raise ValueError("interval must be positive.")
+
+    @staticmethod
+    def _range_args(start, end):
+        return ['-inf' if start is None else _number(start),
+                '+inf' if end is None else _number(end)]
+
+    # Async operations, the result is passed to callback
+
+    def append_async(self, value, timestamp=None, callback=None):
+        if timestamp is None:
+            timestamp = time.time()
+        self.append_many_async([(timestamp, value)], callback=callback)
+
+    def append_many_async(self, samples, chunk_size=BATCH_SIZE,
+            callback=None):
+        keys, args = self._append_args()
+        self._batch(_series_append, args, self._sample_args(samples),
+                chunk_size * 2, _sum, callback, keys=keys)
+
+    def range_async(self, start=None, end=None, callback=None):
+        start, end = self._range_args(start, end)
+        self.db.zrangebyscore(self.key, start, end, None, None, False,
+                callback=_transform(callback, _samples))
+
+    def aggregate_async(self, interval, agg='avg', start=None, end=None,
+            callback=None):
+        self._check_agg(agg)
+        self._check_interval(interval)
+        _series_buckets([self.key], self._range_args(start, end) +
+                [interval], db=self.db, callback=_transform(callback,
+                lambda res: _bucket_values(res, agg)))
+
+    def rollup_async(self, interval, agg='avg', start=None, end=None,
+            callback=None):
+        self._check_agg(agg)
+        _series_rollup(self.rollup_keys(interval),
+                self._range_args(start, end), db=self.db,
+                callback=_transform(callback,
+                    lambda res: _bucket_values(res, agg)))
+
+    def trim_async(self, callback=None):
+        if not self.retention:
+            if callback:
+                callback(0)
+            return
+        self.db.zremrangebyscore(self.key, '-inf',
+                '(%s' % _number(time.time() - self.retention),
+                callback=callback)
+
+    def len_async(self, callback=None):
+        self.db.zcard(self.key, callback=callback)
+
+    def clear_async(self, callback=None):
+        self.db.delete(*self._keys(), callback=callback)
@@ -0,0 +1,311 @@
+"""
+This module contains the instrumentation of the Redis commands sent
+by the models and containers.
+
+Commands are only wrapped while a sink is installed, so that the cost
+is a single check when instrumentation is disabled.
+
+Example:
+
+    from bredis.instrument import add_sink, HistogramSink
+
+    histograms = HistogramSink()
+    add_sink(histograms)
+    ...
+    histograms.snapshot()
+"""
+
+import bisect
+import logging
+import socket
+import threading
+import time
+
+from . import is_async
+
+
+_sinks = []
+
+# the last client wrapped and its wrappers by tag, see instrument
+_wrapped = (None, {})
+
+
+def add_sink(sink):
+    """Installs a sink, its ``record`` method receives each Event."""
+    if sink not in _sinks:
+        _sinks.append(sink)
+
+
+def remove_sink(sink):
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def is_enabled():
+    return bool(_sinks)
+
+
+def instrument(db, tag):
+    """Returns db wrapped to report its commands tagged with tag.
+
+    Returns db itself when no sink is installed. The wrappers of the
+    last client wrapped, usually the one of ``get_client``, are kept
+    per tag.
+    """
+    global _wrapped
+    if not _sinks or db is None:
+        return db
+    if isinstance(db, (InstrumentedClient, InstrumentedPipeline)):
+        return db
+    client, wrappers = _wrapped
+    if client is not db:
+        wrappers = {}
+        _wrapped = (db, wrappers)
+    wrapper = wrappers.get(tag)
+    if wrapper is None:
+        wrapper = wrappers[tag] = InstrumentedClient(db, tag)
+    return wrapper
+
+
+class Event(object):
+    """A round trip to Redis.
+
+    Attributes:
+        tag -- the model class or container type name
+        operation -- the command name, or 'pipeline'
+        duration -- seconds until the reply
+        bytes_sent -- approximate size of the arguments
+        bytes_received -- approximate size of the reply
+        commands -- number of commands in the round trip
+        error -- the exception, or None
+    """
+    __slots__ = ('tag', 'operation', 'duration', 'bytes_sent',
+            'bytes_received', 'commands', 'error')
+
+    def __init__(self, tag, operation, duration, bytes_sent=0,
+            bytes_received=0, commands=1, error=None):
+        self.tag = tag
+        self.operation = operation
+        self.duration = duration
+        self.bytes_sent = bytes_sent
+        self.bytes_received = bytes_received
+        self.commands = commands
+        self.error = error
+
+
+def _size(obj):
+    """Returns the approximate size of obj on the wire."""
+    if obj is None:
+        return 0
+    if isinstance(obj, basestring):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(_size(k) + _size(v) for k, v in obj.iteritems())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sum(_size(o) for o in obj)
+    return len(str(obj))
+
+
+def _emit(event):
+    for sink in list(_sinks):
+        try:
+            sink.record(event)
+        except Exception as e:
+            logging.error(u'Instrumentation sink error: [%s]', e)
+
+
+class InstrumentedClient(object):
+    """Wraps a client to time its commands and pipelines.
+
+    The wrapper of a command is built on first access and kept. In
+    async mode the callback is the ``callback`` keyword argument.
+    """
+
+    def __init__(self, db, tag):
+        self._db = db
+        self._tag = tag
+
+    def pipeline(self, *args, **kwargs):
+        return InstrumentedPipeline(self._db.pipeline(*args, **kwargs),
+                self._tag)
+
+    def __getattr__(self, name):
+        attr = getattr(self._db, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        tag = self._tag
+
+        if is_async():
+            def command(*args, **kwargs):
+                callback = kwargs.pop('callback', None)
+                sent = _size(args)
+                start = time.time()
+
+                def on_response(res):
+                    error = res if isinstance(res, Exception) else None
+                    _emit(Event(tag, name, time.time() - start, sent,
+                        0 if error else _size(res), error=error))
+                    if callback:
+                        callback(res)
+
+                return attr(*args, callback=on_response, **kwargs)
+        else:
+            def command(*args, **kwargs):
+                sent = _size(args)
+                start = time.time()
+                try:
+                    res = attr(*args, **kwargs)
+                except Exception as e:
+                    _emit(Event(tag, name, time.time() - start, sent,
+                        error=e))
+                    raise
+                _emit(Event(tag, name, time.time() - start, sent,
+                    _size(res)))
+                return res
+
+        self.__dict__[name] = command
+        return command
+
+
+class InstrumentedPipeline(object):
+    """Wraps a pipeline to time its execution as one round trip."""
+
+    def __init__(self, pipeline, tag):
+        self._pipeline = pipeline
+        self._tag = tag
+        self._commands = 0
+        self._sent = 0
+
+    def execute(self, *args, **kwargs):
+        tag, commands, sent = self._tag, self._commands, self._sent
+        self._commands = self._sent = 0
+        start = time.time()
+        if is_async():
+            callback = kwargs.pop('callback', None)
+
+            def on_response(res):
+                # the errors of the commands are among the replies
+                errors = [res] if isinstance(res, Exception) else \
+                         [r for r in res if isinstance(r, Exception)]
+                error = errors[0] if errors else None
+                _emit(Event(tag, 'pipeline', time.time() - start, sent,
+                    0 if error else _size(res), commands, error))
+                if callback:
+                    callback(res)
+
+            return self._pipeline.execute(*args, callback=on_response,
+                    **kwargs)
+        try:
+            res = self._pipeline.execute(*args, **kwargs)
+        except Exception as e:
+            _emit(Event(tag, 'pipeline', time.time() - start, sent,
+                commands=commands, error=e))
+            raise
+        _emit(Event(tag, 'pipeline', time.time() - start, sent,
+            _size(res), commands))
+        return res
+
+    def __getattr__(self, name):
+        attr = getattr(self._pipeline, name)
+        if (name.startswith('_') or not callable(attr) or
+                name in ('reset', 'discard')):
+            return attr
+
+        def command(*args, **kwargs):
+            self._commands += 1
+            self._sent += _size(args)
+            attr(*args, **kwargs)
+            return self
+        self.__dict__[name] = command
+        return command
+
+
+class LoggingSink(object):
+    """Logs each round trip."""
+
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self.logger = logger or logging.getLogger('bredis')
+        self.level = level
+
+    def record(self, event):
+        self.logger.log(self.level,
+                u'%s %s: %.2fms %d commands %d/%d bytes%s',
+                event.tag, event.operation, event.duration * 1000,
+                event.commands, event.bytes_sent, event.bytes_received,
+                u' error: %s' % event.error if event.error else u'')
+
+
+class StatsdSink(object):
+    """Sends timers and counters to a statsd server over UDP.
+
+    Metrics are named ``<prefix>.<tag>.<operation>.<metric>``.
+    """
+
+    def __init__(self, host='localhost', port=8125, prefix='bredis'):
+        self.addr = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def record(self, event):
+        name = '%s.%s.%s' % (self.prefix, event.tag, event.operation)
+        lines = [
+            '%s.time:%d|ms' % (name, event.duration * 1000),
+            '%s.calls:1|c' % name,
+            '%s.commands:%d|c' % (name, event.commands),
+            '%s.bytes_sent:%d|c' % (name, event.bytes_sent),
+            '%s.bytes_received:%d|c' % (name, event.bytes_received),
+        ]
+        if event.error:
+            lines.append('%s.errors:1|c' % name)
+        try:
+            self.socket.sendto('\n'.join(lines), self.addr)
+        except socket.error:
+            pass
+
+
+class HistogramSink(object):
+    """Keeps latency histograms and totals per (tag, operation) in memory.
+
+    Arguments:
+        buckets -- upper bounds of the latency buckets in milliseconds
+    """
+
+    BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def record(self, event):
+        ms = event.duration * 1000
+        with self._lock:
+            k = (event.tag, event.operation)
+            stats = self._stats.get(k)
+            if stats is None:
+                stats = self._stats[k] = {
+                    'round_trips': 0,
+                    'commands': 0,
+                    'errors': 0,
+                    'bytes_sent': 0,
+                    'bytes_received': 0,
+                    'total_ms': 0.0,
+                    'histogram': [0] * (len(self.buckets) + 1),
+                }
+            stats['round_trips'] += 1
+            stats['commands'] += event.commands
+            stats['errors'] += 1 if event.error else 0
+            stats['bytes_sent'] += event.bytes_sent
+            stats['bytes_received'] += event.bytes_received
+            stats['total_ms'] += ms
+            stats['histogram'][bisect.bisect_left(self.buckets, ms)] += 1
+
+    def snapshot(self):
+        """Returns a copy of the stats keyed by (tag, operation)."""
+        with self._lock:
+            return dict((k, dict(v, histogram=list(v['histogram'])))
+                        for k, v in self._stats.iteritems())
@@ -1,4 +1,9 @@
 from .base import *
 from .attributes import *
 from .exceptions import *
+from .session import *
+from .buffer import *
+from .profiling import *
+from .migrations import *
+from .views import *
 
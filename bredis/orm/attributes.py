@@ -1,8 +1,28 @@
+import os
+import random
 import time
 from datetime import datetime, date
 
 from .. import is_async
+from ..scripts import Script
+from .buffer import get_counter_buffer
 from .exceptions import FieldValidationError
+from .profiling import note_lazy_load
+
+
+# the key of the internal state of a model instance in its __dict__,
+# which cannot clash with the field values cached as '_<name>'
+_STATE_KEY = '_:state'
+
+
+def _instance_state(instance):
+    """Returns the dict of the internal state of a model instance,
+    e.g. its key cache.
+    """
+    state = instance.__dict__.get(_STATE_KEY)
+    if state is None:
+        state = instance.__dict__[_STATE_KEY] = {}
+    return state
 
 
 class Attribute(object):
@@ -17,14 +37,18 @@ class Attribute(object):
         self.default = default
         self.validator = validator
 
-    def __get__(self, instance):
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
         try:
             return getattr(instance, '_' + self.name)
         except AttributeError:
+            # values are not fetched in async mode, see Model.load_async
             if instance.is_new() or is_async():
                 value = self.default
             else:
-                value = instance.db.hget(instance.key(), self.name)
+                note_lazy_load(instance, self.name)
+                value = instance._fetch(self.name)
                 if value is not None:
                     value = self.typecast_for_read(value)
 
@@ -78,12 +102,38 @@ class Attribute(object):
             raise FieldValidationError(errors)
 
 
+def normalize_prefix(value):
+    """Returns value stripped and lowercased, as utf-8, for the
+    prefix indexes.
+    """
+    if not isinstance(value, unicode):
+        value = str(value).decode('utf-8')
+    return value.strip().lower().encode('utf-8')
+
+
 class CharField(Attribute):
-    """Model field of str and unicode type."""
+    """Model field of str and unicode type.
 
-    def __init__(self, max_length=2048, **kwargs):
+    With prefix_index, the values are kept in a lexicographic sorted
+    set that ``Manager.startswith`` searches.
+    """
+
+    def __init__(self, max_length=2048, prefix_index=False, **kwargs):
         super(CharField, self).__init__(**kwargs)
         self.max_length = max_length
+        self.prefix_index = prefix_index
+
+    def prefix_member(self, value, id):
+        """Returns the member of the object id in the prefix index,
+        or None if value is not indexed.
+        """
+        if value is None:
+            return None
+        value = normalize_prefix(value)
+        if not value:
+            return None
+        # ids follow a NUL, which sorts before any character
+        return '%s\x00%s' % (value, id)
 
     def validate(self, instance):
         errors = []
@@ -228,13 +278,16 @@ class ReferenceField(object):
         self._attname = attname
         self._related_name = related_name
 
-    def __get__(self, instance):
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
         try:
             if not hasattr(instance, '_' + self.name):
                 id = getattr(instance, self.attname)
                 if is_async():  # not fetch object on async mode
                     setattr(instance, '_' + self.name, id)
                 else:
+                    note_lazy_load(instance, self.name)
                     setattr(instance, '_' + self.name,
                             self.value_type().objects.get_by_id(id))
             return getattr(instance, '_' + self.name)
@@ -287,22 +340,118 @@ class ReferenceField(object):
             raise FieldValidationError(errors)
 
 
+_sum_shards = Script("""
+local totals = {}
+local k = 1
+for i = 1, #ARGV, 2 do
+    local total = 0
+    for j = 1, tonumber(ARGV[i + 1]) do
+        total = total + tonumber(redis.call('HGET', KEYS[k], ARGV[i]) or 0)
+        k = k + 1
+    end
+    table.insert(totals, total)
+end
+return totals
+""")
+
+
+def sum_shards(instance, counters, db=None, callback=None):
+    """Sums the shards of the sharded counters of instance.
+
+    The sums are computed server-side in one script call and returned
+    in the order of counters.
+    """
+    keys, args = [], []
+    for counter in counters:
+        keys.extend(counter.shard_keys(instance))
+        args.extend([counter.name, counter.shards])
+    return _sum_shards(keys, args, db=db, callback=callback)
+
+
 class Counter(IntegerField):
+    """Model field of counter, changed with ``Model.incr``.
+
+    With ``buffered=True`` increments are aggregated in-process by the
+    counter buffer and flushed in batches, and the value read from
+    Redis is cached on the instance, pending increments included.
+
+    With ``shards=N`` the counter is kept in N sub-keys instead of
+    the model hash, so that a hot object does not load a single key.
+    Increments go to a random shard (``shard_by='random'``) or to the
+    shard of the client process (``shard_by='client'``), and reads sum
+    the shards in one script call.
+    """
 
-    def __init__(self, **kwargs):
+    def __init__(self, buffered=False, shards=None, shard_by='random',
+            **kwargs):
         super(Counter, self).__init__(**kwargs)
         if not kwargs.has_key('default') or self.default is None:
             self.default = 0
-
-    def __get__(self, instance):
-        if not (instance.is_new() or is_async()):
-            value = instance.db.hget(instance.key(), self.name)
-            if value is None:
-                return 0
-            return int(value)
-        else:
+        if shard_by not in ('random', 'client'):
+            raise ValueError("shard_by should be 'random' or 'client'.")
+        self.buffered = buffered
+        self.shards = shards
+        self.shard_by = shard_by
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        if instance.is_new():
             return 0
+        value = instance.__dict__.get('_' + self.name)
+        if value is None and not is_async():
+            note_lazy_load(instance, self.name)
+            if self.shards:
+                value = int(sum_shards(instance, [self])[0])
+            else:
+                value = instance._fetch(self.name)
+                value = 0 if value is None else int(value)
+            if self.buffered:
+                self.load(instance, value)
+        if value is None:
+            value = 0
+        if self.buffered:
+            buffer = get_counter_buffer()
+            field = self.field(instance)
+            for key in self.shard_keys(instance):
+                value += buffer.pending(key, field)
+        return value
 
     def __set__(self, instance, value):
         raise AttributeError("can't set a counter.")
 
+    def load(self, instance, value):
+        """Caches the value read from Redis on the instance.
+
+        The cached value of a buffered counter is rebased by the
+        flushes of the counter buffer.
+        """
+        setattr(instance, '_' + self.name, value)
+        if self.buffered:
+            buffer = get_counter_buffer()
+            field = self.field(instance)
+            for key in self.shard_keys(instance):
+                buffer.watch(key, field, instance, self.name)
+
+    def field(self, instance):
+        """Returns the hash field holding the counter."""
+        if instance._bucket_size and not self.shards:
+            return '%s:%s' % (instance.id, self.name)
+        return self.name
+
+    def shard_keys(self, instance):
+        """Returns the keys of the hashes holding the counter."""
+        if not self.shards:
+            return [instance.storage_key()]
+        key = instance.key(self.name)
+        return [key[i] for i in xrange(self.shards)]
+
+    def shard_key(self, instance):
+        """Returns the key of the hash an increment is sent to."""
+        if not self.shards:
+            return instance.storage_key()
+        if self.shard_by == 'client':
+            i = os.getpid() % self.shards
+        else:
+            i = random.randrange(self.shards)
+        return instance.key(self.name)[i]
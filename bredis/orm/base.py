@@ -1,3 +1,5 @@
+import json
+import logging
 import time
 from datetime import datetime
 
@@ -5,10 +7,15 @@ from tornado import gen
 from tornado.util import ObjectDict
 
 from .. import get_client
+from ..instrument import instrument
+from ..scripts import Script
 from ..util import deserialize
 from .attributes import *
+from .attributes import _instance_state
 from .managers import *
-from .key import Key
+from .key import Key, ID_ENCODINGS, object_key, decode_id, strip_tag
+from .session import get_session
+from .buffer import get_counter_buffer
 from .exceptions import FieldValidationError, MissingID, BadKeyError
 
 
@@ -102,9 +109,112 @@ def _initialize_counters(model_class, name, bases, attrs):
 
 
 def _initialize_key(model_class, name):
-    """Initializes the key of the model."""
+    """Initializes the key of the model.
+
+    Meta options:
+        key_prefix -- the prefix of the keys (alias: key), e.g. 'u'.
+                      Default: the class name
+        id_encoding -- how ids are written in keys: 'decimal',
+                       'base62' or 'binary'. Default: 'decimal'
+        hash_tag -- wrap the object keys in a cluster hash tag, so that
+                    the keys of an object share a slot. Default: False
+        declare_keys -- pass every key a script reads in KEYS, as Redis
+                        Cluster requires, instead of deriving them on
+                        the server. Costs a round trip per set key.
+                        Default: False
+    """
+
+    meta = model_class._meta
+    model_class._key = Key(meta['key_prefix'] or meta['key'] or name)
+    model_class._id_encoding = meta['id_encoding'] or 'decimal'
+    if model_class._id_encoding not in ID_ENCODINGS:
+        raise ValueError("Unknown id encoding %s" % model_class._id_encoding)
+    model_class._hash_tag = bool(meta['hash_tag'])
+    model_class._declare_keys = bool(meta['declare_keys'])
+
+
+def _initialize_storage(model_class):
+    """Initializes the storage layout of the model.
+
+    With ``storage = 'bucketed'`` in Meta, the objects are packed into
+    shared hashes of ``bucket_size`` objects (default: 100).
+    """
+
+    if model_class._meta['storage'] == 'bucketed':
+        model_class._bucket_size = model_class._meta['bucket_size'] or 100
+    else:
+        model_class._bucket_size = None
+
 
-    model_class._key = Key(model_class._meta['key'] or name)
+def _initialize_ttl(model_class):
+    """Initializes the expiration of the model.
+
+    Meta options:
+        ttl -- seconds before a saved object expires, a float is
+               applied with millisecond precision. Default: None
+        sliding_ttl -- refresh the expiration when the object is
+                       loaded by the manager or an attribute is
+                       fetched lazily. Default: False
+    """
+
+    model_class._meta_ttl = model_class._meta['ttl']
+    model_class._meta_sliding_ttl = bool(model_class._meta['sliding_ttl'])
+    if model_class._meta_ttl and model_class._bucket_size:
+        raise ValueError("Bucketed models cannot expire.")
+    if model_class._meta_sliding_ttl and not model_class._meta_ttl:
+        raise ValueError("sliding_ttl needs a ttl.")
+    if model_class._meta_ttl and any(model_class._attributes[k].buffered
+                                for k in model_class._counters):
+        # the buffer could recreate the keys of expired objects
+        raise ValueError("Expiring models cannot have buffered counters.")
+
+
+def _initialize_indexes(model_class):
+    """Stores the names of the fields with a prefix index."""
+
+    model_class._prefix_indexes = [
+        k for k, v in model_class._attributes.iteritems()
+        if isinstance(v, CharField) and v.prefix_index]
+
+
+def _initialize_views(model_class):
+    """Binds the views of ``Meta.views`` to the model, see
+    ``SortedView``.
+    """
+
+    model_class._meta_views = list(model_class._meta['views'] or ())
+    names = set()
+    for view in model_class._meta_views:
+        if view.name in names:
+            raise ValueError("Duplicate view %s" % view.name)
+        names.add(view.name)
+        view.contribute_to_class(model_class)
+
+
+# the instance attributes of the models besides the field values, the
+# rest of their state is kept apart, see _instance_state
+_INSTANCE_ATTRIBUTES = ('_id', '_errors')
+
+
+def _deferred(instance):
+    """Returns the names of the attributes of instance deferred at
+    load, ``Model.deferred`` may be shadowed by a field.
+    """
+    return [k for k in _instance_state(instance).get('deferred', ())
+            if '_' + k not in instance.__dict__]
+
+
+def _check_field_names(model_class):
+    """Rejects the fields whose values, cached on the instances as
+    ``_<name>``, would shadow an attribute of the model.
+    """
+
+    for name in model_class._attributes.keys() + \
+            model_class._references.keys():
+        if (hasattr(model_class, '_' + name) or
+                '_' + name in _INSTANCE_ATTRIBUTES):
+            raise ValueError("The field %s of %s shadows _%s."
+                             % (name, model_class.__name__, name))
 
 
 def _initialize_manager(model_class):
@@ -138,6 +248,50 @@ class ModelOptions(object):
 
 _deferred_refs = []
 
+_incr_existing = Script("""
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return nil
+end
+local value = redis.call('HINCRBY', KEYS[2], ARGV[1], ARGV[2])
+local ttl = redis.call('PTTL', KEYS[1])
+if ttl > 0 then
+    redis.call('PEXPIRE', KEYS[2], ttl)
+end
+return value
+""")
+
+_reindex_prefix = Script("""
+local old = redis.call('HGET', KEYS[2], ARGV[1])
+if old then
+    redis.call('ZREM', KEYS[1], old)
+end
+if ARGV[2] == '' then
+    redis.call('HDEL', KEYS[2], ARGV[1])
+else
+    redis.call('ZADD', KEYS[1], 0, ARGV[2])
+    redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+end
+return 1
+""")
+
+# models by key prefix and by class name, see get_model_from_key
+_registry = {}
+
+
+def _register(model_class, name):
+    """Registers model_class by name and key prefix.
+
+    Raises ValueError if another model has the name or key prefix.
+    """
+
+    for k in (name, str(model_class._key)):
+        other = _registry.get(k)
+        if other is not None and other is not model_class:
+            raise ValueError("%s is already registered by %s."
+                             % (k, other.__name__))
+    _registry[name] = model_class
+    _registry[str(model_class._key)] = model_class
+
 
 class ModelBase(type):
     """Metaclass of the Model."""
@@ -151,7 +305,13 @@ class ModelBase(type):
         _initialize_attributes(cls, name, bases, attrs)
         _initialize_counters(cls, name, bases, attrs)
         _initialize_key(cls, name)
+        _initialize_storage(cls)
+        _initialize_ttl(cls)
+        _initialize_indexes(cls)
+        _initialize_views(cls)
+        _check_field_names(cls)
         _initialize_manager(cls)
+        _register(cls, name)
         # if targeted by a reference field using a string,
         # override for next try
         for target, model_class, att in _deferred_refs:
@@ -206,45 +366,344 @@ class Model(object):
             if att.name in kwargs:
                 att.__set__(self, kwargs[att.name])
 
-    def save(self):
-        """Saves the instance to the datastore."""
+    def save(self, ttl=None):
+        """Saves the instance to the datastore.
+
+        Inside a session the write is queued on the session pipeline.
+        ttl overrides ``Meta.ttl`` for this save.
+        """
 
         if not self.is_valid():
             return self._errors
+        self._check_ttl(ttl)
         _new = self.is_new()
         if _new:
             self._initialize_id()
+        session = get_session()
+        if session is not None:
+            self._write(_new, pipeline=session.pipeline, ttl=ttl)
+            return True
         with Mutex(self):
-            self._write(_new)
+            self._write(_new, ttl=ttl)
         return True
 
-    def save_async(self, callback=None):
-        """Async save."""
+    def save_async(self, callback=None, ttl=None):
+        """Async save.
+
+        Inside a session the write is queued on the session pipeline
+        and callback receives True once it is queued. ttl overrides
+        ``Meta.ttl`` for this save; with an expiration, prefix
+        indexes or views the write is sent as a pipeline and callback
+        receives its replies.
+        """
 
         if not self.is_valid():
             callback(self._errors)
             return
+        self._check_ttl(ttl)
         _new = self.is_new()
+        session = get_session()
+
+        def on_id(id=None):
+            d = self._get_data_for_storage(_new)
+            if session is not None:
+                self._queue_data(session.pipeline, d)
+                self._queue_expire(session.pipeline, ttl)
+                self._queue_indexes(session.pipeline)
+                self._queue_views(session.pipeline)
+                if _new:
+                    session.release()
+                if callback:
+                    callback(True)
+            elif (ttl or self._meta_ttl or self._prefix_indexes or
+                    self._meta_views):
+                pipeline = self.db.pipeline()
+                self._queue_data(pipeline, d)
+                self._queue_expire(pipeline, ttl)
+                self._queue_indexes(pipeline)
+                self._queue_views(pipeline)
+                pipeline.execute(callback=callback)
+            else:
+                self._queue_data(self.db, d, callback=callback)
+
         if _new:
-            self._initialize_id_async()
-        d = self._get_data_for_storage(_new)
-        self.db.hmset(self.key(), d, callback)
+            if session is not None:
+                session.hold()
+            self._initialize_id_async(callback=on_id)
+        else:
+            on_id()
 
     def key(self, att=None):
-        """Returns the Redis key where the values are stored."""
+        """Returns the Redis key where the values are stored.
+
+        The key of the instance is computed once per id.
+        """
 
+        state = _instance_state(self)
+        cache = state.get('key')
+        if cache is None or cache[0] != self.id:
+            cache = state['key'] = (self.id, self._object_key(self.id))
         if att is not None:
-            return self._key[self.id][att]
+            return Key("%s:%s" % (cache[1], att))
+        return cache[1]
+
+    def storage_key(self):
+        """Returns the key of the hash the values are stored in.
+
+        This is the bucket of the instance for bucketed models and
+        ``key()`` otherwise.
+        """
+
+        return self._storage_location(self.id)[0]
+
+    @classmethod
+    def _object_key(cls, id):
+        """Returns the key of the object with id."""
+        return object_key(cls._key, id, cls._id_encoding, cls._hash_tag)
+
+    @classmethod
+    def _prefix_key(cls, name):
+        """Returns the key of the prefix index of the field name.
+
+        The hash ``<key>:ids`` maps the ids to their indexed member.
+        """
+        key = cls._key['prefix'][name]
+        return key.tagged() if cls._hash_tag else key
+
+    @classmethod
+    def _storage_location(cls, id):
+        """Returns (key, field) where the object with id is stored.
+
+        field is None when the object has a hash of its own.
+        """
+        if cls._bucket_size:
+            key = cls._key['bucket'][int(id) // cls._bucket_size]
+            return key.tagged() if cls._hash_tag else key, str(id)
+        return cls._object_key(id), None
+
+    def _storage_fields(self, fields):
+        """Returns (key, hash fields) to HMGET the attributes fields."""
+        if not self._bucket_size:
+            return self.key(), list(fields)
+        key, id = self._storage_location(self.id)
+        return key, [id] + ['%s:%s' % (id, k) for k in fields
+                            if k in self._counters]
+
+    def _storage_decode(self, fields, values):
+        """Returns the stored values of fields from a HMGET reply."""
+        key, hash_fields = self._storage_fields(fields)
+        if isinstance(values, dict):
+            values = [values.get(f) for f in hash_fields]
+        if not self._bucket_size:
+            return dict(zip(fields, values))
+        d = dict.fromkeys(fields)
+        if values[0] is None:
+            return d
+        blob = json.loads(values[0])
+        for k in fields:
+            if k in blob:
+                d[k] = blob[k]
+        counters = [k for k in fields if k in self._counters]
+        d.update(zip(counters, values[1:]))
+        return d
+
+    def _fetch(self, name):
+        """Returns the stored value of the attribute name."""
+        if self._meta_sliding_ttl:
+            pipeline = self.db.pipeline()
+            pipeline.hget(self.key(), name)
+            self._queue_expire(pipeline)
+            return pipeline.execute()[0]
+        if not self._bucket_size:
+            return self.db.hget(self.key(), name)
+        key, hash_fields = self._storage_fields([name])
+        return self._storage_decode([name],
+                self.db.hmget(key, hash_fields))[name]
+
+    def _queue_data(self, db, h, callback=None):
+        """Sends the write of the values h (see ``_write``)."""
+        kwargs = {'callback': callback} if callback else {}
+        if not self._bucket_size:
+            return db.hmset(self.key(), h, **kwargs)
+        key, id = self._storage_location(self.id)
+        # counters have fields of their own in the bucket
+        blob = dict((k, v) for k, v in h.iteritems()
+                    if k not in self._counters)
+        return db.hset(key, id, json.dumps(blob), **kwargs)
+
+    def _queue_delete(self, pipeline):
+        keys = []
+        for counter in self.sharded_counters:
+            keys.extend(counter.shard_keys(self))
+        if self._bucket_size:
+            key, id = self._storage_location(self.id)
+            pipeline.hdel(key, id, *['%s:%s' % (id, k)
+                                     for k in self._counters])
         else:
-            return self._key[self.id]
+            keys.append(self.key())
+        if keys:
+            pipeline.delete(*keys)
+        self._queue_indexes(pipeline, delete=True)
+        self._queue_views(pipeline)
+
+    def _queue_views(self, pipeline, views=None):
+        """Queues the update of the views, after the write queued on
+        pipeline.
+        """
+        for view in self._meta_views if views is None else views:
+            view.queue_update(self, pipeline)
+
+    def _queue_indexes(self, pipeline, delete=False):
+        """Queues the update of the prefix indexes of the object.
+
+        Fields that were neither loaded nor set are left as indexed.
+        """
+        for name in self._prefix_indexes:
+            if delete:
+                member = None
+            elif '_' + name in self.__dict__:
+                member = self._attributes[name].prefix_member(
+                        self.__dict__['_' + name], self.id)
+            else:
+                continue
+            key = self._prefix_key(name)
+            _reindex_prefix([key, key['ids']], [self.id, member or ''],
+                    db=pipeline)
+
+    def _check_ttl(self, ttl):
+        if ttl and self._bucket_size:
+            raise ValueError("Bucketed models cannot expire.")
+
+    def _expire_keys(self, id=None):
+        """Returns the keys that expire with the object."""
+        if id is None:
+            id = self.id
+        keys = [self._object_key(id)]
+        key = keys[0]
+        for counter in self.sharded_counters:
+            keys.extend(key[counter.name][i] for i in xrange(counter.shards))
+        return keys
+
+    def _queue_expire(self, pipeline, ttl=None):
+        """Queues the expiration of the keys of the object.
+
+        ttl defaults to ``Meta.ttl``, nothing is queued without one.
+        """
+        ttl = ttl or self._meta_ttl
+        if not ttl:
+            return
+        for key in self._expire_keys():
+            if isinstance(ttl, float):
+                pipeline.pexpire(key, int(ttl * 1000))
+            else:
+                pipeline.expire(key, ttl)
+
+    def touch(self, ttl=None):
+        """Restarts the expiration of the object.
+
+        ttl defaults to ``Meta.ttl``.
+        """
+        self._check_ttl(ttl)
+        pipeline = self.db.pipeline()
+        self._queue_expire(pipeline, ttl)
+        pipeline.execute()
+
+    def touch_async(self, ttl=None, callback=None):
+        """Async touch."""
+        self._check_ttl(ttl)
+        pipeline = self.db.pipeline()
+        self._queue_expire(pipeline, ttl)
+        pipeline.execute(callback=callback)
 
     def delete(self):
         """Deletes the object from the datastore."""
 
+        session = get_session()
+        if session is not None:
+            self._queue_delete(session.pipeline)
+            return
         pipeline = self.db.pipeline()
-        pipeline.delete(self.key())
+        self._queue_delete(pipeline)
         pipeline.execute()
 
+    def delete_async(self, callback=None):
+        """Async delete.
+
+        Inside a session the delete is queued on the session pipeline
+        and callback receives True once it is queued. Otherwise it
+        receives the pipeline replies.
+        """
+
+        session = get_session()
+        if session is not None:
+            self._queue_delete(session.pipeline)
+            if callback:
+                callback(True)
+            return
+        pipeline = self.db.pipeline()
+        self._queue_delete(pipeline)
+        pipeline.execute(callback=callback)
+
+    @property
+    def deferred(self):
+        """Returns the names of the attributes deferred at load."""
+        return _deferred(self)
+
+    def load_deferred_async(self, callback=None):
+        """Async load of the deferred attributes.
+
+        callback receives the instance.
+        """
+        deferred = _deferred(self)
+        if not deferred:
+            callback(self)
+            return
+
+        def on_response(instance):
+            if instance is not None:
+                _instance_state(self).pop('deferred', None)
+            callback(instance)
+
+        self.load_async(deferred, on_response)
+
+    def load_async(self, fields=None, callback=None):
+        """Async load of the attribute values.
+
+        Attributes are not fetched lazily in async mode, so the
+        values to read have to be loaded first. Loads all attributes
+        when fields is None, callback receives the instance.
+        """
+
+        sharded = [c for c in self.sharded_counters
+                   if fields is None or c.name in fields]
+        if fields is None:
+            fields = self.attributes.keys()
+        fields = list(fields)
+
+        def on_response(res):
+            if isinstance(res, Exception):
+                logging.error(res)
+                callback(None)
+                return
+            if sharded:
+                res, totals = res
+            self.typecast_for_read(self._storage_decode(fields, res))
+            if sharded and not isinstance(totals, Exception):
+                for counter, total in zip(sharded, totals):
+                    counter.load(self, int(total))
+            callback(self)
+
+        key, hash_fields = self._storage_fields(fields)
+        if not hash_fields:
+            callback(self)
+        elif sharded:
+            pipeline = self.db.pipeline()
+            pipeline.hmget(key, hash_fields)
+            sum_shards(self, sharded, db=pipeline)
+            pipeline.execute(callback=on_response)
+        else:
+            self.db.hmget(key, hash_fields, callback=on_response)
+
     def is_new(self):
         """Returns True if the instance is new.
 
@@ -255,13 +714,83 @@ class Model(object):
     def incr(self, att, val=1):
         """Increments a counter."""
         if att not in self.counters:
-            raise ValueError("%s is not a counter.")
-        self.db.hincrby(self.key(), att, val)
+            raise ValueError("%s is not a counter." % att)
+        counter = self._attributes[att]
+        key, field = counter.shard_key(self), counter.field(self)
+        if counter.buffered:
+            get_counter_buffer().incr(key, field, val)
+            return
+        self.__dict__.pop('_' + att, None)
+        views = [v for v in self._meta_views if v.field == att]
+        session = get_session()
+        if session is not None:
+            self._queue_incr(session.pipeline, key, field, val)
+            self._queue_views(session.pipeline, views)
+            return
+        if views:
+            pipeline = self.db.pipeline()
+            self._queue_incr(pipeline, key, field, val)
+            self._queue_views(pipeline, views)
+            pipeline.execute()
+            return
+        self._queue_incr(self.db, key, field, val)
+
+    def incr_async(self, att, val=1, callback=None):
+        """Async increment of a counter.
+
+        callback receives the new value of the shard, or None when
+        the increment is buffered or queued on a session.
+        """
+        if att not in self.counters:
+            raise ValueError("%s is not a counter." % att)
+        counter = self._attributes[att]
+        key, field = counter.shard_key(self), counter.field(self)
+        if counter.buffered:
+            get_counter_buffer().incr(key, field, val)
+            if callback:
+                callback(None)
+            return
+        self.__dict__.pop('_' + att, None)
+        views = [v for v in self._meta_views if v.field == att]
+        session = get_session()
+        if session is not None:
+            self._queue_incr(session.pipeline, key, field, val)
+            self._queue_views(session.pipeline, views)
+            if callback:
+                callback(None)
+            return
+        if views:
+            def on_response(res):
+                if callback:
+                    callback(res if isinstance(res, Exception) else res[0])
+
+            pipeline = self.db.pipeline()
+            self._queue_incr(pipeline, key, field, val)
+            self._queue_views(pipeline, views)
+            pipeline.execute(callback=on_response)
+            return
+        self._queue_incr(self.db, key, field, val, callback=callback)
+
+    def _queue_incr(self, db, key, field, val, callback=None):
+        """Sends the HINCRBY of a counter.
+
+        Counters of expiring models are only incremented while the
+        object exists, and their shards expire with it.
+        """
+        kwargs = {'callback': callback} if callback else {}
+        if self._meta_ttl:
+            return _incr_existing([self.key(), key], [field, val], db=db,
+                    **kwargs)
+        return db.hincrby(key, field, val, **kwargs)
 
     def decr(self, att, val=1):
         """Decrements a counter."""
         self.incr(att, -1 * val)
 
+    def decr_async(self, att, val=1, callback=None):
+        """Async decrement of a counter."""
+        self.incr_async(att, -1 * val, callback)
+
     @property
     def attributes_dict(self):
         """Returns the mapping of the model attributes and their values."""
@@ -303,9 +832,9 @@ class Model(object):
         return cls._references
 
     @property
-    def db(cls):
+    def db(self):
         """Returns the Redis client used by the model."""
-        return get_client()
+        return instrument(get_client(), self.__class__.__name__)
 
     @property
     def errors(self):
@@ -324,30 +853,72 @@ class Model(object):
         """Returns the mapping of the counters."""
         return cls._counters
 
+    @property
+    def sharded_counters(cls):
+        """Returns the counter descriptors kept in shards."""
+        return [cls._attributes[k] for k in cls._counters
+                if cls._attributes[k].shards]
+
+    @property
+    def buffered_counters(cls):
+        """Returns the counter descriptors incremented through the
+        counter buffer.
+        """
+        return [cls._attributes[k] for k in cls._counters
+                if cls._attributes[k].buffered]
+
     @classmethod
     def exists(cls, id):
         """Checks if the model with id exists."""
-        return bool(get_client().exists(cls._key[str(id)]))
+        db = instrument(get_client(), cls.__name__)
+        key, field = cls._storage_location(id)
+        if field is not None:
+            return bool(db.hexists(key, field))
+        return bool(db.exists(key))
+
+    @classmethod
+    def exists_async(cls, id, callback=None):
+        """Async check if the model with id exists."""
+        def on_response(res):
+            if isinstance(res, Exception):
+                logging.error(res)
+                res = False
+            callback(bool(res))
+        db = instrument(get_client(), cls.__name__)
+        key, field = cls._storage_location(id)
+        if field is not None:
+            db.hexists(key, field, callback=on_response)
+        else:
+            db.exists(key, callback=on_response)
 
     def _initialize_id(self):
         """Initializes the id of the instance."""
         self.id = str(self.db.incr(self._key['id']))
 
     @gen.engine
-    def _initialize_id_async(self):
+    def _initialize_id_async(self, callback=None):
         """Async initialize."""
-        self.id = str(yield gen.Task(self.db.incr, self._key['id']))
+        self.id = str((yield gen.Task(self.db.incr, self._key['id'])))
+        if callback:
+            callback(self.id)
 
-    def _write(self, _new=False):
+    def _write(self, _new=False, pipeline=None, ttl=None):
         """Writes the values of the attributes to the datastore.
 
         This method also creates the indices and saves the lists
-        associated to the object.
+        associated to the object. When pipeline is given, the
+        commands are queued on it and not executed. The keys of the
+        object expire after ttl, which defaults to ``Meta.ttl``.
         """
-        pipeline = self.db.pipeline()
+        execute = pipeline is None
+        if execute:
+            pipeline = self.db.pipeline()
         h = {}
         # attributes
         for k, v in self.attributes.iteritems():
+            if isinstance(v, Counter) and (v.shards or v.buffered):
+                # HINCRBY owns them, see Model.incr
+                continue
             if isinstance(v, DateTimeField):
                 if v.auto_now:
                     setattr(self, k, datetime.now())
@@ -362,11 +933,24 @@ class Model(object):
             if for_storage is not None:
                 h[k] = v.typecast_for_storage(for_storage)
 
-        pipeline.delete(self.key())
-        if h:
-            pipeline.hmset(self.key(), h)
+        if self._bucket_size:
+            pass
+        elif self.buffered_counters:
+            # keeps the buffered counters, clears the unset attributes
+            unset = [k for k, v in self.attributes.iteritems()
+                     if k not in h and not isinstance(v, Counter)]
+            if unset:
+                pipeline.hdel(self.key(), *unset)
+        else:
+            pipeline.delete(self.key())
+        if h or self._bucket_size:
+            self._queue_data(pipeline, h)
+        self._queue_expire(pipeline, ttl)
+        self._queue_indexes(pipeline)
+        self._queue_views(pipeline)
 
-        pipeline.execute()
+        if execute:
+            pipeline.execute()
 
     def __hash__(self):
         return hash(self.key())
@@ -385,6 +969,8 @@ class Model(object):
     def _get_data_for_storage(self, _new=False):
         h = {}
         for k, v in self.attributes.iteritems():
+            if isinstance(v, Counter) and (v.shards or v.buffered):
+                continue
             if isinstance(v, DateTimeField):
                 if v.auto_now:
                     setattr(self, k, datetime.now())
@@ -410,7 +996,10 @@ class Model(object):
         attrs = self.attributes.values()
         for att in attrs:
             if att.name in d:
-                if isinstance(d[att.name], (type(None), tuple, list, dict)):
+                if isinstance(att, Counter):
+                    if d[att.name] is not None:
+                        att.load(self, int(d[att.name]))
+                elif isinstance(d[att.name], (type(None), tuple, list, dict)):
                     att.__set__(self, d[att.name])
                 else:
                     att.__set__(self, att.typecast_for_read(d[att.name]))
@@ -422,7 +1011,10 @@ class Model(object):
     def object_dict(self):
         d = {}
         attrs = self.attributes.values()
+        deferred = _deferred(self)
         for att in attrs:
+            if att.name in deferred:
+                continue
             value = getattr(self, att.name)
             if isinstance(value, (str, unicode)):
                 d[att.name] = deserialize(value, ignore_error=True)
@@ -433,14 +1025,37 @@ class Model(object):
 
 
 def get_model_from_key(key):
-    """Gets the model from a given key."""
+    """Gets the model from a given key.
+
+    key may also be the name of the model class.
+    """
 
-    _known_models = {}
-    model_name = key.split(':', 2)[0]
-    # populate
-    for klass in Model.__subclasses__():
-        _known_models[klass.__name__] = klass
-    return _known_models.get(model_name, None)
+    model = _registry.get(key)
+    if model is not None:
+        return model
+    key = strip_tag(key)
+    # the key prefix may contain ':' itself
+    parts = key.split(':')
+    for i in xrange(len(parts) - 1, 0, -1):
+        model = _registry.get(':'.join(parts[:i]))
+        if model is not None:
+            return model
+    return None
+
+
+def _parse_key(key):
+    """Returns (model, id) of the key, raises BadKeyError."""
+
+    model = get_model_from_key(key)
+    if model is None:
+        raise BadKeyError
+    key = strip_tag(key)
+    try:
+        id = key[len(model._key) + 1:].split(':', 1)[0]
+        id = decode_id(id, model._id_encoding)
+    except (ValueError, TypeError):
+        raise BadKeyError
+    return model, str(id)
 
 
 def from_key(key):
@@ -450,17 +1065,40 @@ def from_key(key):
     redisco or no defined model can be found.
     Returns None if the key could not be found.
     """
-    model = get_model_from_key(key)
-    if model is None:
-        raise BadKeyError
-    try:
-        _, id = key.split(':', 2)
-        id = int(id)
-    except ValueError, TypeError:
-        raise BadKeyError
+    model, id = _parse_key(key)
     return model.objects.get_by_id(id)
 
 
+def from_keys(keys):
+    """Returns the model instances of keys, loaded in one pipeline.
+
+    The keys may belong to different models. Raises BadKeyError if a
+    key is not recognized, the instances that could not be found are
+    None.
+    """
+    plans = []
+    pipeline = instrument(get_client(), 'from_keys').pipeline()
+    for key in keys:
+        model, id = _parse_key(key)
+        fields = model._attributes.keys()
+        sharded = model().sharded_counters
+        model.objects._queue_loads(pipeline, [id], fields, sharded)
+        plans.append((model, id, fields, sharded))
+    if not plans:
+        return []
+
+    res = pipeline.execute()
+    objs = []
+    i = 0
+    for model, id, fields, sharded in plans:
+        n = model.objects._load_size(fields, sharded)
+        loaded = model.objects._build_objects([id], res[i:i + n], fields,
+                sharded)
+        objs.append(loaded[0] if loaded else None)
+        i += n
+    return objs
+
+
 class Mutex(object):
     """Implements locking so that other instances may not modify it.
 
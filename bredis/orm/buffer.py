@@ -0,0 +1,211 @@
+"""
+This module contains the write-behind buffer of the counters declared
+with ``Counter(buffered=True)``.
+"""
+
+import atexit
+import logging
+import threading
+import weakref
+
+from .. import get_client, is_async
+from ..instrument import instrument
+
+
+class CounterBuffer(object):
+    """Aggregates counter increments in-process.
+
+    Arguments:
+        interval -- seconds between two flushes. Default: 1.0
+        max_pending -- number of pending (key, field) pairs that
+                       triggers an early flush. Default: 1000
+
+    The increments are summed per (key, field) and sent as one
+    pipeline of HINCRBY on each flush. Flushes are driven by a
+    ``PeriodicCallback`` in async mode and a daemon thread in sync
+    mode. Increments that fail are kept for the next flush, the
+    others of the same pipeline are applied.
+
+    The counter values cached on instances are registered with
+    ``watch``; once a flush succeeds its increments are added to them,
+    so that the cached value plus the pending increments never goes
+    backwards.
+    """
+    def __init__(self, interval=1.0, max_pending=1000):
+        self.interval = interval
+        self.max_pending = max_pending
+        self._deltas = {}
+        self._flushing = {}
+        self._watched = {}
+        self._lock = threading.Lock()
+        self._timer = None
+        self._stopped = None
+
+    def incr(self, key, field, val=1):
+        """Buffers an increment of field in the hash at key."""
+        with self._lock:
+            k = (key, field)
+            self._deltas[k] = self._deltas.get(k, 0) + val
+            full = len(self._deltas) >= self.max_pending
+        self.start()
+        if full:
+            self.flush()
+
+    def pending(self, key, field):
+        """Returns the increment not flushed yet for field at key,
+        including the increments of a flush in flight.
+        """
+        k = (key, field)
+        with self._lock:
+            return self._deltas.get(k, 0) + self._flushing.get(k, 0)
+
+    def watch(self, key, field, instance, name):
+        """Registers the value of the counter name cached on instance,
+        see ``Counter.load``.
+
+        Instances are weakly referenced. A value loaded while a flush
+        of field is in flight may or may not include its increments.
+        """
+        with self._lock:
+            refs = self._watched.get((key, field))
+            if refs is None:
+                refs = self._watched[(key, field)] = \
+                        weakref.WeakValueDictionary()
+            refs[(id(instance), name)] = instance
+
+    def _done(self, deltas, res):
+        """Ends the flush of the (key, field), increment pairs deltas.
+
+        res is the pipeline replies, or the error of the whole flush.
+        Flushed increments are added to the cached values, failed ones
+        are pending again.
+        """
+        if isinstance(res, Exception):
+            res = [res] * len(deltas)
+        with self._lock:
+            for (k, v), reply in zip(deltas, res):
+                left = self._flushing.pop(k, 0) - v
+                if left:
+                    self._flushing[k] = left
+                if isinstance(reply, Exception):
+                    self._deltas[k] = self._deltas.get(k, 0) + v
+                    continue
+                for (_, name), instance in self._watched.get(k, {}).items():
+                    value = instance.__dict__.get('_' + name)
+                    if value is not None:
+                        instance.__dict__['_' + name] = value + v
+            for k in [k for k, refs in self._watched.iteritems()
+                      if not refs]:
+                del self._watched[k]
+
+    def flush(self, callback=None):
+        """Sends the buffered increments in one pipeline.
+
+        In sync mode the first failed increment is raised, once the
+        others are accounted for.
+        """
+        with self._lock:
+            deltas, self._deltas = self._deltas, {}
+            deltas = [(k, v) for k, v in deltas.iteritems() if v]
+            for k, v in deltas:
+                self._flushing[k] = self._flushing.get(k, 0) + v
+        if not deltas:
+            if callback:
+                callback([])
+            return
+
+        pipeline = instrument(get_client(), 'CounterBuffer').pipeline()
+        for (key, field), val in deltas:
+            pipeline.hincrby(key, field, val)
+
+        if is_async():
+            def on_response(res):
+                errors = [res] if isinstance(res, Exception) else \
+                         [r for r in res if isinstance(r, Exception)]
+                if errors:
+                    logging.error(errors[0])
+                self._done(deltas, res)
+                if callback:
+                    callback(res)
+
+            pipeline.execute(callback=on_response)
+        else:
+            try:
+                res = pipeline.execute(raise_on_error=False)
+            except Exception as e:
+                self._done(deltas, e)
+                raise
+            self._done(deltas, res)
+            errors = [r for r in res if isinstance(r, Exception)]
+            if errors:
+                raise errors[0]
+            if callback:
+                callback(res)
+
+    def start(self):
+        """Starts the periodic flush if it is not running."""
+        with self._lock:
+            if self._timer is not None:
+                return
+            if is_async():
+                from tornado.ioloop import PeriodicCallback
+                self._timer = PeriodicCallback(self.flush,
+                        self.interval * 1000)
+            else:
+                self._stopped = threading.Event()
+                self._timer = threading.Thread(target=self._run,
+                        args=(self._stopped,))
+                self._timer.daemon = True
+            self._timer.start()
+
+    def _run(self, stopped):
+        while not stopped.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(u'Counter flush error: [%s]', e)
+
+    def stop(self, callback=None):
+        """Stops the periodic flush and flushes what is left."""
+        with self._lock:
+            if self._timer is not None:
+                if self._stopped is not None:
+                    self._stopped.set()
+                    self._stopped = None
+                else:
+                    self._timer.stop()
+                self._timer = None
+        self.flush(callback)
+
+
+def setup_counter_buffer(interval=1.0, max_pending=1000):
+    """Replaces the counter buffer, flushing the current one."""
+    global counter_buffer
+    counter_buffer.stop()
+    counter_buffer = CounterBuffer(interval, max_pending)
+
+
+def get_counter_buffer():
+    global counter_buffer
+    return counter_buffer
+
+
+def shutdown_counters(callback=None):
+    """Flushes the buffered counters.
+
+    Registered with ``atexit`` for sync mode. Async applications
+    should call it before stopping the IOLoop.
+    """
+    counter_buffer.stop(callback)
+
+
+def _flush_at_exit():
+    if not is_async():
+        try:
+            counter_buffer.stop()
+        except Exception as e:
+            logging.error(u'Counter flush error: [%s]', e)
+
+
+counter_buffer = CounterBuffer()
+atexit.register(_flush_at_exit)
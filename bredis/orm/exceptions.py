@@ -13,6 +13,9 @@ class BadKeyError(Error):
 class AttributeNotIndexed(Error):
     pass
 
+class QueryBudgetExceeded(Error):
+    pass
+
 class FieldValidationError(Error):
 
     def __init__(self, errors, *args, **kwargs):
@@ -1,4 +1,78 @@
+import string
+
+
 class Key(str):
 
     def __getitem__(self, key):
         return Key("%s:%s" % (self, key))
+
+    def tagged(self):
+        """Returns the key as a cluster hash tag, e.g. '{Post:1}'."""
+        return Key("{%s}" % self)
+
+
+BASE62 = string.digits + string.ascii_lowercase + string.ascii_uppercase
+
+ID_ENCODINGS = ('decimal', 'base62', 'binary')
+
+
+def encode_id(id, encoding='decimal'):
+    """Encodes the integer id for use in a key.
+
+    'base62' uses [0-9a-zA-Z] and 'binary' the big-endian bytes of id.
+    Binary ids may contain ':', so their keys cannot be parsed back.
+    Raises ValueError if id is not a non-negative integer.
+    """
+    n = int(id)
+    if n < 0:
+        raise ValueError("Negative id %s" % id)
+    if encoding == 'decimal':
+        return str(n)
+    if encoding == 'base62':
+        s = ''
+        while n:
+            n, r = divmod(n, 62)
+            s = BASE62[r] + s
+        return s or '0'
+    if encoding == 'binary':
+        s = ''
+        while n:
+            s = chr(n & 0xff) + s
+            n >>= 8
+        return s or '\x00'
+    raise ValueError("Unknown id encoding %s" % encoding)
+
+
+def decode_id(s, encoding='decimal'):
+    """Decodes an id encoded by ``encode_id``."""
+    if encoding == 'decimal':
+        return int(s)
+    n = 0
+    if encoding == 'base62':
+        for c in s:
+            n = n * 62 + BASE62.index(c)
+        return n
+    if encoding == 'binary':
+        for c in s:
+            n = (n << 8) + ord(c)
+        return n
+    raise ValueError("Unknown id encoding %s" % encoding)
+
+
+def strip_tag(key):
+    """Returns key without the braces of its leading hash tag, e.g.
+    'Post:1:hits' for '{Post:1}:hits'.
+    """
+    if key.startswith('{'):
+        end = key.find('}')
+        if end > 0:
+            return key[1:end] + key[end + 1:]
+    return key
+
+
+def object_key(prefix, id, encoding='decimal', hash_tag=False):
+    """Returns the key of the object with id under prefix."""
+    key = Key(prefix)[encode_id(id, encoding)]
+    if hash_tag:
+        return key.tagged()
+    return key
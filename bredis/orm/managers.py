@@ -1,12 +1,382 @@
+import base64
 import logging
 
+from tornado.util import ObjectDict
+
+from ..scripts import Script
+from .attributes import (sum_shards, normalize_prefix, IntegerField,
+        FloatField, DateTimeField, DateField, Counter, _instance_state)
+from .exceptions import AttributeNotIndexed
+from .key import Key
+
+
+_prefix_search = Script("""
+local prefix = ARGV[1]
+return redis.call('ZRANGEBYLEX', KEYS[1], '[' .. prefix,
+                  '[' .. prefix .. '\\255', 'LIMIT', 0, ARGV[2])
+""")
+
+# KEYS: the members of a set or sorted set
+_members = Script("""
+if redis.call('TYPE', KEYS[1]).ok == 'zset' then
+    return redis.call('ZRANGE', KEYS[1], 0, -1)
+end
+return redis.call('SMEMBERS', KEYS[1])
+""")
+
+# KEYS: the set or sorted set of ids, if any; with declared keys, per
+#       id the key of the hash the object is stored in, then the shard
+#       keys of each aggregate of a sharded counter
+# ARGV: key prefix, id encoding, hash tag, bucket size or '', '1' if
+#       the keys are declared, number of aggregates, (op, field, kind)
+#       per aggregate, then the ids unless they are read from a key
+# kind is '' for a stored value, 'c' for a counter of a bucketed
+# model, or the number of shards of a sharded counter.
+_aggregate = Script("""
+local prefix, encoding = ARGV[1], ARGV[2]
+local tagged, bucket_size = ARGV[3] == '1', tonumber(ARGV[4])
+local declared, nops = ARGV[5] == '1', tonumber(ARGV[6])
+local ops, fields, kinds = {}, {}, {}
+local size = 1
+for i = 1, nops do
+    ops[i] = ARGV[4 + 3 * i]
+    fields[i] = ARGV[5 + 3 * i]
+    kinds[i] = ARGV[6 + 3 * i]
+    if tonumber(kinds[i]) then
+        size = size + tonumber(kinds[i])
+    end
+end
+
+local ids
+if not declared and #KEYS > 0 then
+    if redis.call('TYPE', KEYS[1]).ok == 'zset' then
+        ids = redis.call('ZRANGE', KEYS[1], 0, -1)
+    else
+        ids = redis.call('SMEMBERS', KEYS[1])
+    end
+else
+    ids = {}
+    for i = 7 + 3 * nops, #ARGV do
+        ids[#ids + 1] = ARGV[i]
+    end
+end
+
+local digits = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+local function encode(id)
+    if encoding == 'decimal' then
+        return id
+    end
+    local n, base, s = tonumber(id), 256, ''
+    if encoding == 'base62' then
+        base = 62
+    end
+    while n > 0 do
+        local r = n % base
+        if base == 62 then
+            s = string.sub(digits, r + 1, r + 1) .. s
+        else
+            s = string.char(r) .. s
+        end
+        n = (n - r) / base
+    end
+    if s == '' then
+        s = base == 62 and '0' or '\\0'
+    end
+    return s
+end
+
+local function tag(key)
+    if tagged then
+        return '{' .. key .. '}'
+    end
+    return key
+end
+
+-- returns the key the object is stored in and the key of the j-th
+-- shard of field, the k-th id having its keys from KEYS[k * size + 1]
+local function storage_key(id, k)
+    if declared then
+        return KEYS[k * size + 1]
+    end
+    if bucket_size then
+        local bucket = math.floor(tonumber(id) / bucket_size)
+        return tag(prefix .. ':bucket:' .. string.format('%d', bucket))
+    end
+    return tag(prefix .. ':' .. encode(id))
+end
+
+local function shard_key(id, k, field, j, shard)
+    if declared then
+        return KEYS[k * size + 2 + shard + j]
+    end
+    return tag(prefix .. ':' .. encode(id)) .. ':' .. field .. ':' .. j
+end
+
+-- returns the values of the aggregated fields, or nil if id is missing
+local function read(id, k)
+    local key, values, blob = storage_key(id, k), {}, nil
+    if bucket_size then
+        blob = redis.call('HGET', key, id)
+        if not blob then
+            return nil
+        end
+        blob = cjson.decode(blob)
+    elseif redis.call('EXISTS', key) == 0 then
+        return nil
+    end
+    local shard = 0
+    for i = 1, nops do
+        local n = tonumber(kinds[i])
+        if n then
+            local total = 0
+            for j = 0, n - 1 do
+                total = total + tonumber(redis.call('HGET',
+                    shard_key(id, k, fields[i], j, shard), fields[i]) or 0)
+            end
+            values[i] = total
+            shard = shard + n
+        elseif kinds[i] == 'c' then
+            values[i] = redis.call('HGET', key, id .. ':' .. fields[i])
+        elseif blob then
+            values[i] = blob[fields[i]]
+        else
+            values[i] = redis.call('HGET', key, fields[i])
+        end
+    end
+    return values
+end
+
+local count, acc, n = 0, {}, {}
+for k, id in ipairs(ids) do
+    local values = read(id, k - 1)
+    if values then
+        count = count + 1
+        for i = 1, nops do
+            local v = tonumber(values[i])
+            if v then
+                local op = ops[i]
+                n[i] = (n[i] or 0) + 1
+                if op == 'sum' or op == 'avg' then
+                    acc[i] = (acc[i] or 0) + v
+                elseif op == 'min' then
+                    if not acc[i] or v < acc[i] then
+                        acc[i] = v
+                    end
+                elseif not acc[i] or v > acc[i] then
+                    acc[i] = v
+                end
+            end
+        end
+    end
+end
+
+local res = {tostring(count)}
+for i = 1, nops do
+    local v = acc[i]
+    if v and ops[i] == 'avg' then
+        v = v / n[i]
+    end
+    res[i + 1] = v and string.format('%.17g', v) or false
+end
+return res
+""")
+
+# KEYS: the sorted set
+# ARGV: min, max, count, reverse, then the score and member of the
+#       cursor, if any
+_sort_page = Script("""
+local key, min, max = KEYS[1], ARGV[1], ARGV[2]
+local count, rev = tonumber(ARGV[3]), ARGV[4] == '1'
+local score, member = ARGV[5], ARGV[6]
+
+local function range(lo, hi, offset, n)
+    if rev then
+        return redis.call('ZREVRANGEBYSCORE', key, hi, lo, 'WITHSCORES',
+                          'LIMIT', offset, n)
+    end
+    return redis.call('ZRANGEBYSCORE', key, lo, hi, 'WITHSCORES',
+                      'LIMIT', offset, n)
+end
+
+if not score then
+    return range(min, max, 0, count)
+end
+
+-- the ties of the cursor score that sort after its member are found
+-- by rank while the member is in the set, else by scanning the ties
+local res = {}
+local current = redis.call('ZSCORE', key, member)
+if current and tonumber(current) == tonumber(score) then
+    local rank, before
+    if rev then
+        rank = redis.call('ZREVRANK', key, member)
+        before = redis.call('ZCOUNT', key, '(' .. score, '+inf')
+    else
+        rank = redis.call('ZRANK', key, member)
+        before = redis.call('ZCOUNT', key, '-inf', '(' .. score)
+    end
+    res = range(score, score, rank - before + 1, count)
+else
+    local ties = redis.call('ZCOUNT', key, score, score)
+    for offset = 0, ties - 1, count do
+        local page = range(score, score, offset, count)
+        for i = 1, #page, 2 do
+            local m = page[i]
+            if (not rev and m > member) or (rev and m < member) then
+                res[#res + 1] = m
+                res[#res + 1] = page[i + 1]
+                if #res == 2 * count then
+                    return res
+                end
+            end
+        end
+    end
+end
+if #res == 2 * count then
+    return res
+end
+
+local rest
+if rev then
+    rest = range(min, '(' .. score, 0, count - #res / 2)
+else
+    rest = range('(' .. score, max, 0, count - #res / 2)
+end
+for i = 1, #rest do
+    res[#res + 1] = rest[i]
+end
+return res
+""")
+
+
+def encode_cursor(score, member):
+    """Returns the opaque cursor of a sorted set position."""
+    return base64.urlsafe_b64encode('%s:%s' % (score, member))
+
+
+def decode_cursor(cursor):
+    """Returns (score, member) of a cursor, see ``encode_cursor``."""
+    try:
+        score, member = base64.urlsafe_b64decode(str(cursor)).split(':', 1)
+        float(score)
+    except (TypeError, ValueError):
+        raise ValueError("Bad cursor %r" % cursor)
+    return score, member
+
+
+_AGGREGATES = ('sum', 'avg', 'min', 'max')
+
+
+def _load_shards(instance, counters, totals):
+    """Caches the summed shards of the sharded counters on instance."""
+    if isinstance(totals, Exception):
+        logging.error(totals)
+        return
+    for counter, total in zip(counters, totals):
+        counter.load(instance, int(total))
+
+
+def _prefix_ids(members):
+    """Returns the ids of the members of a prefix index."""
+    return [m.rsplit('\x00', 1)[1] for m in members]
+
+
+def _parse_prefetch(prefetch):
+    """Parses ('author', 'author__avatar') into {'author': ['avatar']}."""
+    tree = {}
+    for path in prefetch:
+        name, _, rest = path.partition('__')
+        nested = tree.setdefault(name, [])
+        if rest:
+            nested.append(rest)
+    return tree
+
+
+def _reference(references, name):
+    """Returns the reference field name of a prefetch."""
+    try:
+        return references[name]
+    except KeyError:
+        raise ValueError("Unknown reference %s" % name)
+
+
+def _reference_ids(objs, field):
+    ids = []
+    seen = set()
+    for o in objs:
+        id = getattr(o, field.attname, None)
+        if id and id not in seen:
+            seen.add(id)
+            ids.append(id)
+    return ids
+
+
+def _attach_references(objs, field, targets):
+    by_id = dict((t.id, t) for t in targets)
+    for o in objs:
+        setattr(o, '_' + field.name,
+                by_id.get(getattr(o, field.attname, None)))
+
+
+def prefetch_references(objs, prefetch):
+    """Loads the references named in prefetch for all objs.
+
+    The ids are collected and deduped, and each reference field is
+    loaded with one pipeline, so reading the field afterwards costs
+    no round trip. Nested references are named with '__', e.g.
+    ``prefetch=('author', 'author__avatar')``.
+    """
+    if not objs:
+        return
+    references = objs[0].references
+    for name, nested in _parse_prefetch(prefetch).iteritems():
+        field = _reference(references, name)
+        ids = _reference_ids(objs, field)
+        targets = field.value_type().objects.get_by_ids(ids, nested)
+        _attach_references(objs, field, targets)
+
+
+def prefetch_references_async(objs, prefetch, callback):
+    """Async ``prefetch_references``, callback receives objs."""
+    tree = _parse_prefetch(prefetch)
+    if not objs or not tree:
+        callback(objs)
+        return
+    references = objs[0].references
+    pending = [len(tree)]
+
+    def load(field, nested):
+        def on_response(targets):
+            _attach_references(objs, field, targets)
+            pending[0] -= 1
+            if not pending[0]:
+                callback(objs)
+
+        ids = _reference_ids(objs, field)
+        field.value_type().objects.get_by_ids_async(ids, as_dict=False,
+                prefetch=nested, callback=on_response)
+
+    fields = [(_reference(references, name), nested)
+              for name, nested in tree.items()]
+    for field, nested in fields:
+        load(field, nested)
+
+
+def _object_dict(obj, prefetch=()):
+    """Returns the object dict of obj with the prefetched references."""
+    od = obj.object_dict
+    for name, nested in _parse_prefetch(prefetch).iteritems():
+        target = obj.__dict__.get('_' + name)
+        od[name] = _object_dict(target, nested) if target else None
+    return od
+
 
 class ManagerDescriptor(object):
 
     def __init__(self, manager):
         self.manager = manager
 
-    def __get__(self, instance):
+    def __get__(self, instance, owner=None):
         if instance != None:
             raise AttributeError
         return self.manager
@@ -17,33 +387,86 @@ class Manager(object):
     def __init__(self, model_class):
         self.model_class = model_class
 
-    def get_by_id(self, id):
-        if self.model_class.exists(id):
+    def get_by_id(self, id, only=None, defer=None):
+        """Returns the object with id, or None if it does not exist.
+
+        The attributes are fetched lazily, unless only or defer is
+        given: the selected attributes are then loaded at once and
+        the deferred ones fetched on first access.
+        """
+        if only is None and defer is None:
             instance = self.model_class()
             instance._id = str(id)
-            return instance
+            if self.model_class._meta_sliding_ttl:
+                # expiring models have a hash of their own
+                pipeline = instance.db.pipeline()
+                pipeline.exists(instance.key())
+                instance._queue_expire(pipeline)
+                exists = pipeline.execute()[0]
+            else:
+                exists = self.model_class.exists(id)
+            return instance if exists else None
+        objs = self.get_by_ids([id], only=only, defer=defer)
+        return objs[0] if objs else None
 
-    def get_by_id_async(self, id, callback=None):
+    def get_by_id_async(self, id, callback=None, only=None, defer=None):
+        """Async load of the object with id.
+
+        callback receives the instance, or None if it does not exist.
+        See ``get_by_ids_async`` for only and defer.
+        """
+        def on_response(objs):
+            callback(objs[0] if objs else None)
+
+        self.get_by_ids_async([id], callback=on_response, as_dict=False,
+                only=only, defer=defer)
+
+    def get_by_ids(self, ids, prefetch=(), only=None, defer=None):
+        """Loads the objects with ids in one pipeline.
+
+        Missing objects are skipped. prefetch names the reference
+        fields to load along, see ``prefetch_references``. only and
+        defer select the attributes to load, the deferred ones are
+        fetched lazily on first access; ValueError is raised for a
+        name that is not an attribute.
+        """
+        ids = list(ids)
+        if not ids:
+            return []
         obj = self.model_class()
+        fields = self._select_fields(only, defer, prefetch)
+        sharded = [c for c in obj.sharded_counters if c.name in fields]
+        pipeline = obj.db.pipeline()
+        self._queue_loads(pipeline, ids, fields, sharded)
+        objs = self._build_objects(ids, pipeline.execute(), fields, sharded)
+        if prefetch:
+            prefetch_references(objs, prefetch)
+        return objs
 
-        def on_response(res):
-            if isinstance(res, Exception):
-                logging.error(res)
-                callback(None)
-                return
-            if any(res.values()):
-                callback(obj.typecast_for_read(res))
-            else:
-                callback(None)
+    def get_by_ids_async(self, ids, callback=None, as_dict=True,
+            prefetch=(), only=None, defer=None):
+        """Async load of the objects with ids in one pipeline.
 
-        obj.id = id
-        key = obj.key()
-        fields = obj.attributes.keys()
-        obj.db.hmget(key, fields, on_response)
+        callback receives the object dicts, or the instances if
+        as_dict is False. Missing objects are skipped. prefetch names
+        the reference fields to load along, see
+        ``prefetch_references_async``; in object dicts the referenced
+        objects are set under the name of the reference field.
 
-    def get_by_ids_async(self, ids, callback=None):
+        only and defer select the attributes to load. Deferred
+        attributes are left out of the object dicts, and are loaded
+        on instances with ``Model.load_deferred_async``.
+        """
         obj = self.model_class()
         ids = list(ids)
+        fields = self._select_fields(only, defer, prefetch)
+        sharded = [c for c in obj.sharded_counters if c.name in fields]
+
+        def on_prefetched(objs):
+            if as_dict:
+                callback([_object_dict(o, prefetch) for o in objs])
+            else:
+                callback(objs)
 
         def on_response(res):
             if isinstance(res, Exception):
@@ -51,29 +474,438 @@ class Manager(object):
                 callback([])
                 return
             if isinstance(res, list):
-                ods = []
-                for id, d in zip(ids, res):
-                    o = self.model_class()
-                    o.id = id
-                    od = o.typecast_for_read(d).object_dict
-                    if any(od.values()):
-                        ods.append(od)
-                callback(ods)
+                objs = self._build_objects(ids, res, fields, sharded)
+                if prefetch:
+                    prefetch_references_async(objs, prefetch, on_prefetched)
+                else:
+                    on_prefetched(objs)
                 return
             logging.error('wrong type of res: %s', res)
             callback([])
 
+        if not ids:
+            callback([])
+            return
         pipeline = obj.db.pipeline()
+        self._queue_loads(pipeline, ids, fields, sharded)
+        pipeline.execute(callback=on_response)
+
+    def _select_fields(self, only=None, defer=None, prefetch=()):
+        """Returns the attribute names to load."""
+        attributes = self.model_class._attributes
+        for name in tuple(only or ()) + tuple(defer or ()):
+            if name not in attributes:
+                raise ValueError("Unknown attribute %s" % name)
+        fields = attributes.keys()
+        if only is not None:
+            fields = [k for k in fields if k in only]
+        if defer:
+            fields = [k for k in fields if k not in defer]
+        # the ids of the prefetched references are always needed
+        references = self.model_class._references
+        for name in _parse_prefetch(prefetch):
+            attname = _reference(references, name).attname
+            if attname not in fields:
+                fields.append(attname)
+        return fields
+
+    def _queue_loads(self, pipeline, ids, fields, sharded):
+        """Queues the loads of ids, ``_load_size`` commands per id.
+
+        The existence of each object is checked along, so that an
+        object whose selected fields are unset is still loaded; with
+        no field selected only the existence is read. Models with
+        ``Meta.sliding_ttl`` also have their expiration refreshed.
+        """
+        sliding = self.model_class._meta_sliding_ttl
         for id in ids:
             o = self.model_class()
             o.id = id
-            key = o.key()
-            fields = o.attributes.keys()
-            pipeline.hmget(key, fields)
-        pipeline.execute(callback=on_response)
+            key, field = o._storage_location(id)
+            if field is None:
+                pipeline.exists(key)
+            else:
+                pipeline.hexists(key, field)
+            key, hash_fields = o._storage_fields(fields)
+            if hash_fields:
+                pipeline.hmget(key, hash_fields)
+            if sharded:
+                sum_shards(o, sharded, db=pipeline)
+            if sliding:
+                o._queue_expire(pipeline)
+
+    def _load_size(self, fields, sharded):
+        """Returns the number of replies per id of ``_queue_loads``."""
+        size = 1
+        if fields or self.model_class._bucket_size:
+            size += 1
+        if sharded:
+            size += 1
+        if self.model_class._meta_sliding_ttl:
+            size += len(self.model_class()._expire_keys('0'))
+        return size
+
+    def _build_objects(self, ids, res, fields, sharded):
+        """Builds the instances from the replies of ``_queue_loads``."""
+        size = self._load_size(fields, sharded)
+        loads = bool(fields or self.model_class._bucket_size)
+        objs = []
+        for i, id in enumerate(ids):
+            replies = res[i * size:(i + 1) * size]
+            exists = replies[0]
+            d = replies[1] if loads else []
+            errors = [r for r in (exists, d) if isinstance(r, Exception)]
+            if errors:
+                logging.error(errors[0])
+                continue
+            if not exists:
+                continue
+            o = self.model_class()
+            o.id = id
+            d = o._storage_decode(fields, d)
+            o.typecast_for_read(d)
+            if len(fields) < len(o._attributes):
+                _instance_state(o)['deferred'] = [
+                    k for k in o._attributes if k not in fields]
+            if sharded:
+                _load_shards(o, sharded, replies[1 + loads])
+            objs.append(o)
+        return objs
+
+    def _prefix_key(self, field):
+        if field not in self.model_class._prefix_indexes:
+            raise AttributeNotIndexed(
+                    "%s has no prefix index." % field)
+        return self.model_class._prefix_key(field)
+
+    def startswith(self, field, prefix, limit=10, load=False):
+        """Returns the ids of the objects whose field starts with prefix.
+
+        The field needs ``CharField(prefix_index=True)``; values and
+        prefix are compared stripped and lowercased, in lexicographic
+        order. With load the objects are returned instead, loaded in
+        a second round trip. Objects of expiring models stay in the
+        index after they expire, loading skips them.
+        """
+        key = self._prefix_key(field)
+        obj = self.model_class()
+        ids = _prefix_ids(_prefix_search([key],
+                [normalize_prefix(prefix), limit], db=obj.db))
+        if load:
+            return self.get_by_ids(ids)
+        return ids
+
+    def startswith_async(self, field, prefix, limit=10, load=False,
+            callback=None):
+        """Async ``startswith``.
+
+        callback receives the ids, or the instances with load.
+        """
+        key = self._prefix_key(field)
+        obj = self.model_class()
+
+        def on_response(res):
+            if isinstance(res, Exception):
+                logging.error(res)
+                callback([])
+                return
+            ids = _prefix_ids(res)
+            if load:
+                self.get_by_ids_async(ids, callback=callback, as_dict=False)
+            else:
+                callback(ids)
+
+        _prefix_search([key], [normalize_prefix(prefix), limit], db=obj.db,
+                callback=on_response)
+
+    def _aggregate_ops(self, aggregates):
+        """Returns the [(name, op, attribute)] of aggregates."""
+        model_class = self.model_class
+        ops = []
+        for op, names in sorted(aggregates.iteritems()):
+            if op not in _AGGREGATES:
+                raise ValueError("Unknown aggregate %s" % op)
+            if isinstance(names, basestring):
+                names = [names]
+            for name in names:
+                att = model_class._attributes.get(name)
+                numeric = (IntegerField, FloatField)
+                if op in ('min', 'max'):
+                    numeric += (DateTimeField, DateField)
+                if not isinstance(att, numeric):
+                    raise ValueError("Cannot %s the field %s." % (op, name))
+                ops.append(('%s__%s' % (name, op), op, att))
+        return ops
+
+    def _aggregate(self, ids_or_set_key, ops, db, callback=None):
+        """Runs the aggregate script on ids, or on the members of a
+        set key.
+
+        The script derives the keys of the objects from their ids.
+        With ``Meta.declare_keys`` every key it reads is passed in
+        KEYS instead, the members of a set key are then read first.
+        """
+        model_class = self.model_class
+        args = [model_class._key, model_class._id_encoding,
+                int(model_class._hash_tag), model_class._bucket_size or '',
+                int(model_class._declare_keys), len(ops)]
+        sharded = []
+        for _, op, att in ops:
+            if isinstance(att, Counter) and att.shards:
+                kind = att.shards
+                sharded.append(att)
+            elif isinstance(att, Counter) and model_class._bucket_size:
+                kind = 'c'
+            else:
+                kind = ''
+            args.extend([op, att.name, kind])
+
+        if isinstance(ids_or_set_key, basestring):
+            if not model_class._declare_keys:
+                return _aggregate([ids_or_set_key], args, db=db,
+                        callback=callback)
+
+            def on_members(ids):
+                if isinstance(ids, Exception):
+                    callback(ids)
+                    return
+                self._aggregate(ids, ops, db, callback)
+
+            if callback is not None:
+                _members([ids_or_set_key], db=db, callback=on_members)
+                return None
+            ids_or_set_key = _members([ids_or_set_key], db=db)
+
+        ids = [str(id) for id in ids_or_set_key]
+        keys = []
+        if model_class._declare_keys:
+            for id in ids:
+                keys.append(model_class._storage_location(id)[0])
+                for att in sharded:
+                    key = Key('%s:%s' % (model_class._object_key(id),
+                                         att.name))
+                    keys.extend(key[i] for i in xrange(att.shards))
+        return _aggregate(keys, args + ids, db=db, callback=callback)
+
+    def _aggregate_result(self, ops, res):
+        d = {'count': int(res[0])}
+        for (name, op, att), value in zip(ops, res[1:]):
+            if value is None:
+                d[name] = None
+            elif op == 'avg':
+                d[name] = float(value)
+            elif op == 'sum':
+                if isinstance(att, IntegerField):
+                    d[name] = int(float(value))
+                else:
+                    d[name] = float(value)
+            elif isinstance(att, IntegerField):
+                d[name] = int(float(value))
+            else:
+                d[name] = att.typecast_for_read(value)
+        return d
+
+    def aggregate(self, ids_or_set_key, **aggregates):
+        """Aggregates fields of the objects server-side.
+
+        ids_or_set_key is a list of ids, or the key of a set or sorted
+        set of ids. The aggregates are given as op='field' (or a list
+        of fields), with op in 'sum', 'avg', 'min' and 'max', e.g.
+        ``aggregate(ids, sum='price', max='created')``.
+
+        Returns a dict keyed '<field>__<op>', e.g. 'price__sum', plus
+        'count', the number of existing objects. Missing objects and
+        unset values are skipped. One script call reads the members
+        of the set key and the hashes, so only the aggregates are
+        transferred back. It blocks the server while it runs, so
+        aggregate large sets in slices.
+        """
+        ops = self._aggregate_ops(aggregates)
+        obj = self.model_class()
+        return self._aggregate_result(ops,
+                self._aggregate(ids_or_set_key, ops, db=obj.db))
+
+    def aggregate_async(self, ids_or_set_key, callback=None, **aggregates):
+        """Async ``aggregate``, callback receives the dict, or None
+        on error.
+        """
+        ops = self._aggregate_ops(aggregates)
+        obj = self.model_class()
+
+        def on_response(res):
+            if isinstance(res, Exception):
+                logging.error(res)
+                callback(None)
+                return
+            callback(self._aggregate_result(ops, res))
+
+        self._aggregate(ids_or_set_key, ops, db=obj.db, callback=on_response)
+
+    def count(self, ids_or_set_key):
+        """Returns the number of existing objects among ids, or among
+        the members of a set or sorted set, without loading them.
+        """
+        return self.aggregate(ids_or_set_key)['count']
+
+    def count_async(self, ids_or_set_key, callback=None):
+        """Async ``count``, callback receives the count, or 0 on error."""
+        def on_response(d):
+            callback(d['count'] if d else 0)
+
+        self.aggregate_async(ids_or_set_key, callback=on_response)
+
+    def _sort_page_args(self, start, end, count, reverse, cursor):
+        if not count > 0:
+            raise ValueError("count must be positive.")
+        args = ['-INF' if start is None else start,
+                '+INF' if end is None else end, count, int(bool(reverse))]
+        if cursor:
+            args.extend(decode_cursor(cursor))
+        return args
+
+    def _sort_page(self, res, count, with_scores):
+        members, scores = res[::2], res[1::2]
+        page = ObjectDict(ids=members, objects=[], cursor=None)
+        if with_scores:
+            page.scores = [float(s) for s in scores]
+        if len(members) == count:
+            page.cursor = encode_cursor(scores[-1], members[-1])
+        return page
+
+    def get_sort_page(self, key, cursor=None, count=20, start=None,
+            end=None, reverse=False, with_scores=False, load=True,
+            prefetch=(), only=None, defer=None):
+        """Returns a page of the ids in the sorted set key.
+
+        Pages are keyed by the last score and member of the previous
+        page rather than by an offset, so deep pages cost the same as
+        the first one and stay stable while members are added. Pass
+        the returned ``cursor`` to get the next page; it is None on
+        the last page. start and end bound the scores, reverse pages
+        from the highest score. Raises ValueError unless count is
+        positive.
+
+        Returns an ObjectDict with ``ids``, ``objects`` (loaded with
+        ``get_by_ids`` unless load is False, missing objects are
+        skipped), ``cursor`` and, with with_scores, ``scores``.
+        """
+        obj = self.model_class()
+        res = _sort_page([key], self._sort_page_args(start, end, count,
+                reverse, cursor), db=obj.db)
+        page = self._sort_page(res, count, with_scores)
+        if load:
+            page.objects = self.get_by_ids(page.ids, prefetch, only, defer)
+        return page
+
+    def get_sort_page_async(self, key, cursor=None, count=20, start=None,
+            end=None, reverse=False, with_scores=False, load=True,
+            as_dict=True, prefetch=(), only=None, defer=None,
+            callback=None):
+        """Async ``get_sort_page``.
+
+        callback receives the page, or None on error. The objects are
+        loaded with ``get_by_ids_async`` and as_dict.
+        """
+        obj = self.model_class()
+
+        def on_response(res):
+            if isinstance(res, Exception):
+                logging.error(res)
+                callback(None)
+                return
+            page = self._sort_page(res, count, with_scores)
+
+            def on_objects(objs):
+                page.objects = objs
+                callback(page)
+
+            if load and page.ids:
+                self.get_by_ids_async(page.ids, callback=on_objects,
+                        as_dict=as_dict, prefetch=prefetch, only=only,
+                        defer=defer)
+            else:
+                callback(page)
+
+        _sort_page([key], self._sort_page_args(start, end, count, reverse,
+                cursor), db=obj.db, callback=on_response)
+
+    def _view(self, name):
+        for view in self.model_class._meta_views:
+            if view.name == name:
+                return view
+        raise AttributeNotIndexed(
+                "%s has no view %s." % (self.model_class.__name__, name))
+
+    def _view_page(self, res, with_scores):
+        page = ObjectDict(ids=res[::2], objects=[])
+        if with_scores:
+            page.scores = [float(s) for s in res[1::2]]
+        return page
+
+    def view(self, name, partition=None, offset=0, limit=None,
+            min_score=None, max_score=None, reverse=True, with_scores=False,
+            load=True, prefetch=(), only=None, defer=None):
+        """Reads the materialized view name, see ``SortedView``.
+
+        Returns the objects of partition ranked by score, the highest
+        first unless reverse is False, between min_score and max_score
+        and from offset on, limit at most. The ids are read in one
+        script call and the objects loaded with ``get_by_ids``.
+
+        Returns an ObjectDict with ``ids``, ``objects`` (empty if
+        load is False, missing objects are skipped) and, with
+        with_scores, ``scores``.
+        """
+        view = self._view(name)
+        obj = self.model_class()
+        res = view.read(partition, offset, limit, min_score, max_score,
+                reverse, db=obj.db)
+        page = self._view_page(res, with_scores)
+        if load:
+            page.objects = self.get_by_ids(page.ids, prefetch, only, defer)
+        return page
+
+    def view_async(self, name, partition=None, offset=0, limit=None,
+            min_score=None, max_score=None, reverse=True, with_scores=False,
+            load=True, as_dict=True, prefetch=(), only=None, defer=None,
+            callback=None):
+        """Async ``view``.
+
+        callback receives the page, or None on error. The objects are
+        loaded with ``get_by_ids_async`` and as_dict.
+        """
+        view = self._view(name)
+        obj = self.model_class()
+
+        def on_response(res):
+            if isinstance(res, Exception):
+                logging.error(res)
+                callback(None)
+                return
+            page = self._view_page(res, with_scores)
+
+            def on_objects(objs):
+                page.objects = objs
+                callback(page)
+
+            if load and page.ids:
+                self.get_by_ids_async(page.ids, callback=on_objects,
+                        as_dict=as_dict, prefetch=prefetch, only=only,
+                        defer=defer)
+            else:
+                callback(page)
+
+        view.read(partition, offset, limit, min_score, max_score, reverse,
+                db=obj.db, callback=on_response)
 
     def get_sort_list_async(self, key, start=None, end=None, count=None,
-            reverse=False, callback=None):
+            reverse=False, callback=None, offset=None):
+        """Async read of the members of the sorted set key.
+
+        callback receives the members with scores between start and
+        end. count and offset limit the range; use
+        ``get_sort_page_async`` to page through large sets.
+        """
         obj = self.model_class()
 
         def on_response(res):
@@ -85,7 +917,10 @@ class Manager(object):
 
         start = '-INF' if start is None else start
         end = '+INF' if end is None else end
-        offset = None if count is None else 0
+        if count is None:
+            offset = None
+        elif offset is None:
+            offset = 0
 
         # the difference between zrange and zrevrange is the sorted order.
         if reverse:
@@ -0,0 +1,209 @@
+"""
+This module contains the tools that migrate the keyspace of a model
+to a new storage layout.
+
+They run with the sync client, e.g. from a maintenance script, while
+the application keeps serving with the new layout.
+"""
+
+import abc
+import json
+import logging
+import threading
+
+from .. import get_client, is_async
+from .key import Key, object_key
+
+
+class Migration(object):
+    """Base of the migrations, walks the ids of a model in batches.
+
+    Arguments:
+        model_class -- the model to migrate
+        batch_size -- the number of objects per pipeline. Default: 100
+
+    Ids are allocated with INCR, so the objects are found by walking
+    the ids up to the current value of ``<Model>:id``. ``run`` migrates
+    in the calling thread and ``start`` in a daemon thread.
+
+    Subclasses implement ``migrate_batch``.
+    """
+    __metaclass__ = abc.ABCMeta
+
+    def __init__(self, model_class, batch_size=100):
+        if is_async():
+            raise RuntimeError("Migrations need the sync client.")
+        self.model_class = model_class
+        self.batch_size = batch_size
+        self.migrated = 0
+        self.done = False
+
+    @property
+    def db(self):
+        return get_client()
+
+    def run(self):
+        last = int(self.db.get(self.model_class._key['id']) or 0)
+        for start in xrange(1, last + 1, self.batch_size):
+            ids = [str(id) for id in
+                   xrange(start, min(start + self.batch_size, last + 1))]
+            self.migrated += self.migrate_batch(ids)
+        self.done = True
+        return self.migrated
+
+    def start(self):
+        """Runs the migration in a daemon thread and returns it."""
+        def run():
+            try:
+                self.run()
+            except Exception as e:
+                logging.error(u'%s error: [%s]', self.__class__.__name__, e)
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    @abc.abstractmethod
+    def migrate_batch(self, ids):
+        """Migrates the objects with ids, returns how many were found.
+
+        ids are strings, in increasing order, and may include ids
+        that were never used or were deleted. A migration can stop
+        and run again, so migrating an object twice must leave it as
+        migrating it once.
+        """
+
+
+class BucketMigration(Migration):
+    """Moves the objects of a bucketed model out of their own hashes.
+
+    Switch the model to ``storage = 'bucketed'`` first: writes then go
+    to the buckets, and the migration only fills the entries that are
+    missing (HSETNX) and adds the old counter values, so that newer
+    writes are kept. Each batch is moved in one transaction.
+
+    The old hashes are deleted unless delete is False; the ids moved
+    are then recorded in the set ``<Model>:bucket:migrated``, so that
+    running the migration again does not add the counters twice.
+    Delete that set once the old hashes are dropped.
+    """
+    def __init__(self, model_class, batch_size=100, delete=True):
+        super(BucketMigration, self).__init__(model_class, batch_size)
+        if not model_class._bucket_size:
+            raise ValueError("%s is not bucketed." % model_class.__name__)
+        self.delete = delete
+
+    @property
+    def migrated_key(self):
+        return self.model_class._key['bucket']['migrated']
+
+    def migrate_batch(self, ids):
+        model_class = self.model_class
+        pipeline = self.db.pipeline()
+        for id in ids:
+            pipeline.hgetall(model_class._object_key(id))
+            if not self.delete:
+                pipeline.sismember(self.migrated_key, id)
+        res = pipeline.execute()
+        if self.delete:
+            migrated = [False] * len(ids)
+        else:
+            res, migrated = res[::2], res[1::2]
+
+        counters = set(model_class._counters)
+        found = 0
+        pipeline = self.db.pipeline()
+        for id, h, done in zip(ids, res, migrated):
+            if not h:
+                continue
+            found += 1
+            if done:
+                continue
+            key, field = model_class._storage_location(id)
+            blob = dict((k, v) for k, v in h.iteritems() if k not in counters)
+            pipeline.hsetnx(key, field, json.dumps(blob))
+            for k in counters & set(h):
+                pipeline.hincrby(key, '%s:%s' % (field, k), int(h[k]))
+            if self.delete:
+                pipeline.delete(model_class._object_key(id))
+            else:
+                pipeline.sadd(self.migrated_key, id)
+        pipeline.execute()
+        return found
+
+
+class KeyMigration(Migration):
+    """Renames the keys of a model after its key options changed.
+
+    Arguments:
+        old_prefix -- the key prefix before the change. Default: the
+                      class name
+        old_id_encoding -- the id encoding before. Default: 'decimal'
+        old_hash_tag -- whether hash tags were used before.
+                        Default: False
+
+    The id counter is renamed first, so run the migration before the
+    new options create objects. Object hashes, counter shards and
+    buckets are renamed with RENAMENX, keys that already exist under
+    the new name are left alone.
+    """
+    def __init__(self, model_class, old_prefix=None,
+            old_id_encoding='decimal', old_hash_tag=False, batch_size=100):
+        super(KeyMigration, self).__init__(model_class, batch_size)
+        self.old_prefix = Key(old_prefix or model_class.__name__)
+        self.old_id_encoding = old_id_encoding
+        self.old_hash_tag = old_hash_tag
+
+    def run(self):
+        old_id, new_id = self.old_prefix['id'], self.model_class._key['id']
+        if old_id != new_id and self.db.exists(old_id):
+            self.db.renamenx(old_id, new_id)
+        if self.model_class._bucket_size:
+            self.migrate_buckets()
+        return super(KeyMigration, self).run()
+
+    def old_key(self, id):
+        return object_key(self.old_prefix, id, self.old_id_encoding,
+                self.old_hash_tag)
+
+    def rename(self, pairs):
+        """Renames the (old, new) keys that exist, returns how many."""
+        pairs = [(old, new) for old, new in pairs if old != new]
+        pipeline = self.db.pipeline()
+        for old, new in pairs:
+            pipeline.exists(old)
+        pairs = [p for p, e in zip(pairs, pipeline.execute()) if e]
+        pipeline = self.db.pipeline()
+        for old, new in pairs:
+            pipeline.renamenx(old, new)
+        pipeline.execute()
+        return len(pairs)
+
+    def migrate_buckets(self):
+        model_class = self.model_class
+        last = int(self.db.get(model_class._key['id']) or 0)
+        old_bucket = self.old_prefix['bucket']
+        pairs = []
+        for n in xrange(last // model_class._bucket_size + 1):
+            old = old_bucket[n]
+            if self.old_hash_tag:
+                old = old.tagged()
+            pairs.append((old, model_class._storage_location(
+                n * model_class._bucket_size)[0]))
+        self.rename(pairs)
+
+    def migrate_batch(self, ids):
+        model_class = self.model_class
+        sharded = [model_class._attributes[k] for k in model_class._counters
+                   if model_class._attributes[k].shards]
+        pairs = []
+        for id in ids:
+            old, new = self.old_key(id), model_class._object_key(id)
+            if not model_class._bucket_size:
+                pairs.append((old, new))
+            for counter in sharded:
+                for i in xrange(counter.shards):
+                    pairs.append((old[counter.name][i],
+                                  new[counter.name][i]))
+        return self.rename(pairs)
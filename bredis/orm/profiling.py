@@ -0,0 +1,159 @@
+"""
+This module contains the round trip profiling of a logical scope,
+e.g. a request, to find the lazy loads that cause N+1 queries.
+
+Example:
+
+    with QueryBudget(budget=20, action='raise') as scope:
+        render_feed()
+    logging.info(scope.summary())
+"""
+
+import logging
+import os
+import sys
+import threading
+import traceback
+
+from ..instrument import add_sink, remove_sink
+from .exceptions import QueryBudgetExceeded
+
+
+_local = threading.local()
+_package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _scopes():
+    scopes = getattr(_local, 'scopes', None)
+    if scopes is None:
+        scopes = _local.scopes = []
+    return scopes
+
+
+def _caller():
+    """Returns (filename, lineno) of the first frame outside bredis."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not os.path.abspath(filename).startswith(_package_dir):
+            return filename, frame.f_lineno
+        frame = frame.f_back
+    return '?', 0
+
+
+def note_lazy_load(instance, name):
+    """Records a lazy fetch of attribute name by a descriptor."""
+    scopes = getattr(_local, 'scopes', None)
+    if not scopes:
+        return
+    field = '%s.%s' % (instance.__class__.__name__, name)
+    site = _caller()
+    for scope in scopes:
+        scope.lazy_load(field, site)
+
+
+class QueryBudget(object):
+    """Counts the Redis round trips of a scope.
+
+    Arguments:
+        budget -- the number of round trips allowed, None for no limit
+        action -- 'warn' to log or 'raise' to raise QueryBudgetExceeded
+                  when the budget is exceeded. Default: 'warn'
+        name -- the name of the scope in the report. Default: None
+        stacks -- keep the full stack of each lazy load. Default: False
+
+    Round trips are counted while the scope is active in the current
+    thread, and each lazy load of ``Attribute``, ``ReferenceField``
+    and ``Counter`` is recorded with the call site that triggered it.
+    The budget is checked when the scope exits.
+    """
+    def __init__(self, budget=None, action='warn', name=None, stacks=False):
+        if action not in ('warn', 'raise'):
+            raise ValueError("action should be 'warn' or 'raise'.")
+        self.budget = budget
+        self.action = action
+        self.name = name
+        self.stacks = stacks
+        self.round_trips = 0
+        self.commands = 0
+        self.lazy_loads = {}
+        self.lazy_stacks = {}
+
+    def __enter__(self):
+        scopes = _scopes()
+        scopes.append(self)
+        add_sink(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _scopes().remove(self)
+        remove_sink(self)
+        if exc_type is None:
+            self.check()
+
+    def record(self, event):
+        # sinks are global, only count events of the owning thread
+        if self in getattr(_local, 'scopes', ()):
+            self.round_trips += 1
+            self.commands += event.commands
+
+    def lazy_load(self, field, site):
+        k = (field, site)
+        self.lazy_loads[k] = self.lazy_loads.get(k, 0) + 1
+        if self.stacks and k not in self.lazy_stacks:
+            self.lazy_stacks[k] = traceback.format_stack()[:-3]
+
+    @property
+    def exceeded(self):
+        return self.budget is not None and self.round_trips > self.budget
+
+    def check(self):
+        """Warns or raises if the budget is exceeded."""
+        if not self.exceeded:
+            return
+        if self.action == 'raise':
+            raise QueryBudgetExceeded(self.summary())
+        logging.warning(self.summary())
+
+    def patterns(self):
+        """Returns the repeated lazy loads, most frequent first.
+
+        Each item is (field, filename, lineno, count).
+        """
+        return sorted(((f, s[0], s[1], n)
+                       for (f, s), n in self.lazy_loads.iteritems()),
+                      key=lambda p: -p[3])
+
+    def summary(self):
+        lines = ['%s: %d round trips (%d commands)%s' % (
+            self.name or 'Query budget', self.round_trips, self.commands,
+            ', budget %d' % self.budget if self.budget is not None else '')]
+        for field, filename, lineno, count in self.patterns():
+            lines.append('  %s lazily loaded %d times from %s:%d' % (
+                field, count, os.path.basename(filename), lineno))
+        return '\n'.join(lines)
+
+
+class QueryBudgetMixin(object):
+    """Profiles each request of a tornado RequestHandler.
+
+    Set ``query_budget`` (and optionally ``query_budget_action``) on
+    the handler. The scope covers the code run by the handler in the
+    IOLoop thread, so the counts of concurrent async requests mix;
+    use it on one request at a time when profiling async handlers.
+    """
+    query_budget = None
+    query_budget_action = 'warn'
+
+    def prepare(self):
+        super(QueryBudgetMixin, self).prepare()
+        self._query_budget = QueryBudget(self.query_budget,
+                self.query_budget_action,
+                name='%s %s' % (self.request.method, self.request.path))
+        self._query_budget.__enter__()
+
+    def on_finish(self):
+        budget, self._query_budget = self._query_budget, None
+        if budget is not None:
+            budget.__exit__(None, None, None)
+        super(QueryBudgetMixin, self).on_finish()
@@ -0,0 +1,175 @@
+"""
+This module contains the unit-of-work session that queues the writes
+of models and containers and flushes them in one Redis pipeline.
+"""
+
+import logging
+import threading
+
+from .. import get_client, is_async
+from ..instrument import instrument
+
+
+_local = threading.local()
+
+
+def get_session():
+    """Returns the innermost active session, or None."""
+
+    sessions = getattr(_local, 'sessions', None)
+    if sessions:
+        return sessions[-1]
+    return None
+
+
+class Session(object):
+    """Queues writes and flushes them as a single pipeline.
+
+    Arguments:
+        transaction -- wrap the flush in MULTI/EXEC. Default: True
+        callback -- called with the pipeline results once the session
+                    is flushed. Default: None
+
+    While a session is active, ``Model.save``, ``Model.save_async``,
+    ``Model.delete`` and ``Model.incr`` queue their commands on the
+    session pipeline instead of sending them. Containers join the
+    session through ``attach``, which sets their ``pipeline``.
+
+    Example:
+
+        with session() as s:
+            post.save()
+            post.incr('comments')
+            s.attach(List('timeline')).append(post.id)
+
+    New instances still need one round trip to allocate their id.
+    The per-instance ``Mutex`` is not taken inside a session, the
+    MULTI/EXEC block makes the flush atomic instead.
+
+    The active sessions are kept per thread, and in async mode every
+    handler runs on the thread of the IOLoop: the with block must not
+    yield, or the writes of the handlers running meanwhile would join
+    the session. A session still open when the IOLoop runs its next
+    callbacks is closed, the writes that follow are sent directly and
+    leaving the block discards the queued ones and raises
+    RuntimeError.
+    """
+    def __init__(self, transaction=True, callback=None):
+        self.transaction = transaction
+        self.callback = callback
+        self._pipeline = None
+        self._pending = 0
+        self._deferred_flush = None
+        self._attached = []
+        self._spanned = False
+
+    def __enter__(self):
+        if not hasattr(_local, 'sessions'):
+            _local.sessions = []
+        _local.sessions.append(self)
+        if is_async():
+            from tornado.ioloop import IOLoop
+            IOLoop.instance().add_callback(self._check_closed)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._spanned:
+            self.discard()
+            if exc_type is None:
+                raise RuntimeError("A session cannot span a yield.")
+            return
+        _local.sessions.remove(self)
+        if exc_type is None:
+            self.flush(self.callback)
+        else:
+            self.discard()
+
+    def _check_closed(self):
+        sessions = getattr(_local, 'sessions', [])
+        if self in sessions:
+            logging.error(u'A session spans a yield, it is closed.')
+            sessions.remove(self)
+            self._spanned = True
+
+    @property
+    def pipeline(self):
+        """Returns the pipeline the writes are queued on."""
+        if self._pipeline is None:
+            db = instrument(get_client(), 'Session')
+            if is_async():
+                self._pipeline = db.pipeline(transactional=self.transaction)
+            else:
+                self._pipeline = db.pipeline(transaction=self.transaction)
+        return self._pipeline
+
+    def attach(self, container):
+        """Binds the container to the session pipeline and returns it.
+
+        Reads on an attached container return the pipeline instead
+        of a value, so only use it for mutations. The container gets
+        its previous pipeline back once the session is flushed or
+        discarded.
+        """
+        self._attached.append((container, container.pipeline))
+        container.pipeline = self.pipeline
+        return container
+
+    def _detach(self):
+        attached, self._attached = self._attached, []
+        for container, pipeline in reversed(attached):
+            container.pipeline = pipeline
+
+    def hold(self):
+        """Delays the flush until a matching ``release``.
+
+        Used by async writes that need a round trip (e.g. to allocate
+        an id) before they can queue their commands.
+        """
+        self._pending += 1
+
+    def release(self):
+        self._pending -= 1
+        if not self._pending and self._deferred_flush is not None:
+            callback = self._deferred_flush[0]
+            self._deferred_flush = None
+            self.flush(callback)
+
+    def flush(self, callback=None):
+        """Executes the queued commands.
+
+        Returns the pipeline results in sync mode.
+        """
+        if self._pending:
+            self._deferred_flush = (callback,)
+            return None
+        self._detach()
+        pipeline, self._pipeline = self._pipeline, None
+        if pipeline is None:
+            if callback:
+                callback([])
+            return []
+        if is_async():
+            pipeline.execute(callback=callback)
+        else:
+            res = pipeline.execute()
+            if callback:
+                callback(res)
+            return res
+
+    def discard(self):
+        """Drops the queued commands."""
+        self._detach()
+        pipeline, self._pipeline = self._pipeline, None
+        self._deferred_flush = None
+        if pipeline is None:
+            return
+        if is_async():
+            # tornado-redis clients share one pipeline object
+            pipeline.discard()
+        else:
+            pipeline.reset()
+
+
+def session(transaction=True, callback=None):
+    """Returns a new unit-of-work session."""
+    return Session(transaction=transaction, callback=callback)
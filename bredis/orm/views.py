@@ -0,0 +1,250 @@
+"""
+This module contains the materialized views of the models, sorted
+sets of object ids kept up to date by the writes of the model.
+
+Example:
+
+    class Post(Model):
+        category = CharField()
+        score = Counter()
+
+        class Meta:
+            views = [SortedView('score', partition_by='category',
+                                limit=1000)]
+
+    Post.objects.view('score_by_category', partition='news', limit=10)
+"""
+
+from ..scripts import Script
+from .attributes import (Counter, IntegerField, FloatField, DateTimeField,
+        DateField)
+
+
+# KEYS: the hash the object is stored in, the hash of the partition
+#       of each id
+# ARGV: id, the field and kind of the score, the partition field or
+#       '', the key of the view, the limit or ''
+# kind is '' for a field of the object hash, 'b' for a field of the
+# JSON entry of a bucketed object, 'c' for a counter of a bucketed
+# object. The score and the partition are read after the write, so a
+# missing object is removed from the view and a moved one from its
+# previous partition. The sorted sets of the partitions are derived
+# from the key of the view, whose hash tag they share.
+_update_view = Script("""
+local storage, ids = KEYS[1], KEYS[2]
+local id, field, kind = ARGV[1], ARGV[2], ARGV[3]
+local partition_by, view, limit = ARGV[4], ARGV[5], tonumber(ARGV[6])
+
+local blob
+if kind ~= '' then
+    blob = redis.call('HGET', storage, id)
+    if blob then
+        blob = cjson.decode(blob)
+    end
+end
+
+-- returns the stored value of the field name, or nil
+local function stored(name, counter)
+    if kind == '' then
+        return redis.call('HGET', storage, name)
+    elseif counter then
+        return redis.call('HGET', storage, id .. ':' .. name)
+    elseif blob then
+        local value = blob[name]
+        if value ~= nil and value ~= cjson.null then
+            return tostring(value)
+        end
+    end
+end
+
+local function partition_key(partition)
+    return view .. ':p:' .. partition
+end
+
+local score = stored(field, kind == 'c')
+local old = redis.call('HGET', ids, id)
+if not score then
+    if old then
+        redis.call('ZREM', partition_key(old), id)
+        redis.call('HDEL', ids, id)
+    end
+    return 0
+end
+local partition = ''
+if partition_by ~= '' then
+    partition = stored(partition_by) or ''
+end
+if old and old ~= partition then
+    redis.call('ZREM', partition_key(old), id)
+end
+local key = partition_key(partition)
+redis.call('ZADD', key, score, id)
+redis.call('HSET', ids, id, partition)
+
+-- past twice the limit, drop the ids of other partitions, then keep
+-- the limit highest scores
+if limit and redis.call('ZCARD', key) > 2 * limit then
+    local kept = 0
+    for _, m in ipairs(redis.call('ZREVRANGE', key, 0, -1)) do
+        if redis.call('HGET', ids, m) ~= partition then
+            redis.call('ZREM', key, m)
+        elseif kept < limit then
+            kept = kept + 1
+        else
+            redis.call('ZREM', key, m)
+            redis.call('HDEL', ids, m)
+        end
+    end
+end
+return 1
+""")
+
+# KEYS: the sorted set of a partition, the hash of the partition of
+#       each id
+# ARGV: min, max, offset, count or -1, '1' for the highest scores
+#       first, the partition
+# Returns the ids and scores, flattened. The ids of objects that
+# moved to another partition or were deleted are removed on the way.
+_read_view = Script("""
+local key, ids, partition = KEYS[1], KEYS[2], ARGV[6]
+local offset, count = tonumber(ARGV[3]), tonumber(ARGV[4])
+local res, stale, start = {}, {}, 0
+if count == 0 then
+    return res
+end
+local batch = count < 0 and 1000 or math.max(offset + count, 10)
+
+local function range()
+    if ARGV[5] == '1' then
+        return redis.call('ZREVRANGEBYSCORE', key, ARGV[2], ARGV[1],
+                          'WITHSCORES', 'LIMIT', start, batch)
+    end
+    return redis.call('ZRANGEBYSCORE', key, ARGV[1], ARGV[2],
+                      'WITHSCORES', 'LIMIT', start, batch)
+end
+
+local done = false
+while not done do
+    local page = range()
+    for i = 1, #page, 2 do
+        if redis.call('HGET', ids, page[i]) ~= partition then
+            stale[#stale + 1] = page[i]
+        elseif offset > 0 then
+            offset = offset - 1
+        else
+            res[#res + 1] = page[i]
+            res[#res + 1] = page[i + 1]
+            if #res == 2 * count then
+                done = true
+                break
+            end
+        end
+    end
+    done = done or #page < 2 * batch
+    start = start + batch
+end
+for i = 1, #stale, 1000 do
+    redis.call('ZREM', key, unpack(stale, i, math.min(i + 999, #stale)))
+end
+return res
+""")
+
+
+class SortedView(object):
+    """A leaderboard of the objects of a model by a numeric field.
+
+    Arguments:
+        field -- the attribute or counter the objects are scored by
+        partition_by -- an attribute or reference field, a sorted set
+                        is kept per value. Default: None
+        limit -- keep only the limit highest scores per partition.
+                 A partition is trimmed back to them once it holds
+                 twice as many ids. The limit is lossy: a trimmed
+                 object only comes back on its next write, so reads
+                 past the highest scores of the last trim may miss
+                 objects. Default: None
+        name -- the name of the view in ``Manager.view``. Default:
+                field, or '<field>_by_<partition_by>'
+
+    The views of ``Meta.views`` are updated in the pipeline of each
+    save, delete and incr, from the score stored by the write. The
+    view keys are ``<Model>:view:<name>:p:<partition>``, and the hash
+    ``<Model>:view:<name>:ids`` holds the current partition of each
+    object. The score and the partition are read from storage by the
+    update, so a write does not need them loaded. Reads drop the ids
+    whose partition changed. Objects that expire stay in the views
+    until they are saved or deleted again.
+    """
+    def __init__(self, field, partition_by=None, limit=None, name=None):
+        self.field = field
+        self.partition_by = partition_by
+        self.limit = limit
+        if name is None:
+            name = field
+            if partition_by:
+                name = '%s_by_%s' % (field, partition_by)
+        self.name = name
+        self.model_class = None
+
+    def contribute_to_class(self, model_class):
+        """Binds the view to model_class, checks its fields."""
+        att = model_class._attributes.get(self.field)
+        if not isinstance(att, (IntegerField, FloatField, DateTimeField,
+                                DateField)):
+            raise ValueError("%s cannot score a view." % self.field)
+        if isinstance(att, Counter) and (att.shards or att.buffered):
+            # their increments bypass the model writes
+            raise ValueError("Views cannot use sharded or buffered "
+                             "counters.")
+        if self.partition_by:
+            references = model_class._references
+            if self.partition_by in references:
+                self.partition_by = references[self.partition_by].attname
+            if self.partition_by not in model_class._attributes:
+                raise ValueError("Unknown field %s" % self.partition_by)
+            if self.partition_by in model_class._counters:
+                raise ValueError("A counter cannot partition a view.")
+        self.model_class = model_class
+        key = model_class._key['view'][self.name]
+        # the keys of the view share the slot of its hash tag
+        self.key = key.tagged() if model_class._hash_tag else key
+
+    def partition_key(self, partition=None):
+        """Returns the sorted set of a partition."""
+        return '%s:p:%s' % (self.key, self.partition(partition))
+
+    def partition(self, value):
+        """Returns the partition of the objects whose partition_by
+        field holds value, as stored.
+        """
+        if value is None or not self.partition_by:
+            return ''
+        value = self.model_class._attributes[self.partition_by] \
+                .typecast_for_storage(value)
+        return value.encode('utf-8') if isinstance(value, unicode) else value
+
+    def queue_update(self, instance, pipeline):
+        """Queues the update of the view from the stored values of
+        instance.
+        """
+        model_class = self.model_class
+        storage_key = instance._storage_location(instance.id)[0]
+        if not model_class._bucket_size:
+            kind = ''
+        elif self.field in model_class._counters:
+            kind = 'c'
+        else:
+            kind = 'b'
+        _update_view([storage_key, self.key['ids']],
+                [instance.id, self.field, kind, self.partition_by or '',
+                 self.key, self.limit or ''], db=pipeline)
+
+    def read(self, partition=None, offset=0, limit=None, min_score=None,
+            max_score=None, reverse=True, db=None, callback=None):
+        """Returns the ids and scores of a partition, flattened."""
+        args = ['-inf' if min_score is None else min_score,
+                '+inf' if max_score is None else max_score,
+                offset, -1 if limit is None else limit, int(bool(reverse)),
+                self.partition(partition)]
+        return _read_view([self.partition_key(partition), self.key['ids']],
+                args, db=db, callback=callback)
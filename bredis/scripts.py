@@ -0,0 +1,71 @@
+"""
+This module contains the helper to run Lua scripts with either the
+sync or the async client.
+"""
+
+import hashlib
+
+from redis.exceptions import NoScriptError
+
+from . import get_client, is_async
+from .instrument import instrument
+
+
+def _noscript(e):
+    """Returns True if e is the error of an EVALSHA whose script is not
+    cached by the server.
+
+    redis-py raises NoScriptError, tornado-redis passes a ResponseError
+    whose message contains the NOSCRIPT reply.
+    """
+    return isinstance(e, NoScriptError) or (isinstance(e, Exception) and
+                                            'NOSCRIPT' in str(e))
+
+
+class Script(object):
+    """A Lua script evaluated on the Redis server.
+
+    Arguments:
+        source -- the Lua source of the script
+
+    Calling the script runs EVALSHA on ``db``, which defaults to the
+    current client, and falls back to EVAL when the server does not
+    have the script yet. In async mode the result is passed to
+    ``callback``.
+
+    ``db`` may also be a pipeline. A NOSCRIPT reply cannot be retried
+    inside a pipeline, so pipelines send EVAL with the source.
+    """
+    def __init__(self, source):
+        self.source = source
+        self.sha = hashlib.sha1(source).hexdigest()
+
+    def __call__(self, keys=(), args=(), db=None, callback=None):
+        if db is None:
+            db = instrument(get_client(), 'Script')
+        keys = list(keys)
+        args = list(args)
+        pipeline = hasattr(db, 'execute')
+        if is_async():
+            if pipeline:
+                return db.eval(self.source, keys, args, callback=callback)
+
+            def on_response(res):
+                if _noscript(res):
+                    db.eval(self.source, keys, args, callback=callback)
+                elif callback:
+                    callback(res)
+
+            return db.evalsha(self.sha, keys, args, callback=on_response)
+        if pipeline:
+            res = db.eval(self.source, len(keys), *(keys + args))
+        else:
+            try:
+                res = db.evalsha(self.sha, len(keys), *(keys + args))
+            except Exception as e:
+                if not _noscript(e):
+                    raise
+                res = db.eval(self.source, len(keys), *(keys + args))
+        if callback:
+            callback(res)
+        return res
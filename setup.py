@@ -15,7 +15,7 @@ setup(
     packages=find_packages(),
     install_requires=[
         'tornado==2.4.1',
-        'redis>=2.4.10',
+        'redis>=2.7.0',
         'tornado_redis==2.4.1',
         'python-dateutil==2.1',
     ],
@@ -0,0 +1,64 @@
+"""
+This module contains the test cases run against a local redis-server.
+
+The server is taken from BREDIS_TEST_REDIS ('host:port', default
+'localhost:6379'), and its db 15 is flushed before each test. The
+tests are skipped when no server answers.
+"""
+
+import os
+import unittest
+
+import redis
+from tornado.ioloop import IOLoop
+from tornado.testing import AsyncTestCase
+
+import bredis
+
+
+HOST, _, PORT = os.environ.get('BREDIS_TEST_REDIS',
+        'localhost:6379').partition(':')
+PORT = int(PORT or 6379)
+DB = 15
+
+
+def _flushdb(test):
+    bredis.setup_connection(HOST, PORT, DB)
+    try:
+        bredis.get_client().flushdb()
+    except redis.ConnectionError:
+        test.skipTest("No redis-server at %s:%d" % (HOST, PORT))
+
+
+class RedisTestCase(unittest.TestCase):
+    """Runs the test with the sync client on a flushed db."""
+
+    def setUp(self):
+        _flushdb(self)
+        self.db = bredis.get_client()
+
+
+class AsyncRedisTestCase(AsyncTestCase):
+    """Runs the test with the tornado client on a flushed db.
+
+    ``self.db`` is a sync client of the same db to check the results.
+    """
+
+    def get_new_ioloop(self):
+        # the tornado client runs on the global IOLoop
+        return IOLoop.instance()
+
+    def setUp(self):
+        super(AsyncRedisTestCase, self).setUp()
+        _flushdb(self)
+        self.db = bredis.get_client()
+        bredis.setup_connection(HOST, PORT, DB, async=True)
+
+    def tearDown(self):
+        bredis.setup_connection(HOST, PORT, DB)
+        super(AsyncRedisTestCase, self).tearDown()
+
+    def call(self, func, *args, **kwargs):
+        """Returns the result func passes to its callback."""
+        func(*args, callback=self.stop, **kwargs)
+        return self.wait()
@@ -0,0 +1,116 @@
+from bredis.containers import Set, List, SortedSet, Hash, TypedList
+from bredis.orm import Model, Attribute, IntegerField, Counter
+
+from .base import AsyncRedisTestCase
+
+
+class AsyncPost(Model):
+    title = Attribute()
+    pages = IntegerField()
+    hits = Counter()
+
+
+class AsyncModelTest(AsyncRedisTestCase):
+
+    def test_lifecycle(self):
+        post = AsyncPost(title='a', pages=3)
+        self.call(post.save_async)
+        self.assertEqual(post.id, '1')
+        self.assertEqual(self.db.hgetall('AsyncPost:1'),
+                         {'title': 'a', 'pages': '3', 'hits': '0'})
+        self.assertTrue(self.call(AsyncPost.exists_async, '1'))
+        self.assertFalse(self.call(AsyncPost.exists_async, '2'))
+        self.assertEqual(self.call(post.incr_async, 'hits', 3), 3)
+        self.assertEqual(self.call(post.decr_async, 'hits'), 2)
+
+        post = self.call(AsyncPost.objects.get_by_id_async, '1')
+        self.assertEqual((post.title, post.pages, post.hits), ('a', 3, 2))
+        self.db.hset('AsyncPost:1', 'title', 'b')
+        self.assertIs(self.call(post.load_async, ['title']), post)
+        self.assertEqual(post.title, 'b')
+
+        self.call(post.delete_async)
+        self.assertFalse(self.call(AsyncPost.exists_async, '1'))
+        self.assertIsNone(self.call(AsyncPost.objects.get_by_id_async, '1'))
+
+    def test_errors(self):
+        post = AsyncPost(pages='x')
+        self.assertEqual(self.call(post.save_async),
+                         [('pages', 'bad type')])
+        self.db.set('AsyncPost:1', 'x')
+        self.assertFalse(self.call(AsyncPost.exists_async, '2'))
+        post = AsyncPost(title='a')
+        post._id = '1'
+        self.assertTrue(isinstance(self.call(post.incr_async, 'hits'),
+                                   Exception))
+        self.assertRaises(ValueError, post.incr_async, 'title',
+                          callback=self.stop)
+
+
+class AsyncContainerTest(AsyncRedisTestCase):
+
+    def test_set(self):
+        s = Set('s')
+        self.assertEqual(self.call(s.add_async, 'a'), 1)
+        self.call(s.add_async, 'b')
+        self.assertEqual(self.call(s.all_async), set(['a', 'b']))
+        self.assertTrue(self.call(s.contains_async, 'a'))
+        self.assertEqual(self.call(s.len_async), 2)
+        self.db.sadd('t', 'b', 'c')
+        res = self.call(s.union_async, 'u', Set('t'))
+        self.assertEqual(self.db.smembers(res.key), set(['a', 'b', 'c']))
+        res = self.call(s.intersection_async, 'i', Set('t'))
+        self.assertEqual(self.db.smembers(res.key), set(['b']))
+        res = self.call(s.difference_async, 'd', Set('t'))
+        self.assertEqual(self.db.smembers(res.key), set(['a']))
+        self.assertEqual(self.call(s.sinter_async, Set('t')), set(['b']))
+        self.assertFalse(self.call(s.remove_async, 'x'))
+
+    def test_list(self):
+        l = List('l')
+        self.call(l.append_async, 'a')
+        self.call(l.extend_async, ['b', 'c'])
+        self.call(l.unshift_async, 'z')
+        self.assertEqual(self.call(l.all_async), ['z', 'a', 'b', 'c'])
+        self.assertEqual(self.call(l.get_async, 1), 'a')
+        self.assertEqual(self.call(l.pop_async), 'c')
+        self.assertEqual(self.call(l.shift_async), 'z')
+        self.assertEqual(self.call(l.len_async), 2)
+
+    def test_sorted_set(self):
+        z = SortedSet('z')
+        self.call(z.add_async, 'a', 1)
+        self.call(z.add_async, 'b', 2)
+        self.assertEqual(self.call(z.incr_by_async, 'a', 5), 6)
+        self.assertEqual(self.call(z.members_async), ['b', 'a'])
+        self.assertEqual(self.call(z.revrank_async, 'a'), 0)
+        self.assertEqual(self.call(z.score_async, 'b'), 2)
+        self.assertTrue(self.call(z.contains_async, 'b'))
+
+    def test_hash(self):
+        h = Hash('h')
+        self.call(h.set_async, 'a', '1')
+        self.call(h.update_async, {'b': '2'})
+        self.assertEqual(self.call(h.dict_async), {'a': '1', 'b': '2'})
+        self.assertEqual(self.call(h.get_async, 'a'), '1')
+        self.assertTrue(self.call(h.contains_async, 'b'))
+        self.assertEqual(self.call(h.len_async), 2)
+
+    def test_typed_list(self):
+        self.db.hset('AsyncPost:1', 'title', 'a')
+        self.db.rpush('l', '1', '2')
+        posts = self.call(TypedList('l', AsyncPost).all_async)
+        self.assertEqual([p.title for p in posts], ['a'])
+        self.db.rpush('n', '1', '2')
+        self.assertEqual(self.call(TypedList('n', int).all_async), [1, 2])
+
+    def test_errors(self):
+        self.db.set('k', 'x')
+        for call, args in ((Set('k').pop_async, ()),
+                           (List('k').append_async, ('a',)),
+                           (Hash('k').get_async, ('a',))):
+            self.assertTrue(isinstance(self.call(call, *args), Exception))
+        self.assertTrue(isinstance(self.call(SortedSet('k').add_async,
+                                             'a', 1), Exception))
+        self.assertTrue(isinstance(self.call(TypedList('k', int).all_async),
+                                   Exception))
@@ -0,0 +1,45 @@
+import json
+import os
+import subprocess
+import sys
+
+from .base import RedisTestCase, HOST, PORT, DB
+
+
+BENCH = os.path.join(os.path.dirname(__file__), '..', 'benchmarks',
+                     'bench.py')
+
+
+def _bench(*args):
+    process = subprocess.Popen([sys.executable, BENCH, '--host', HOST,
+            '--port', str(PORT), '--db', str(DB)] + list(args),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate()
+    return process.returncode, out, err
+
+
+class BenchTest(RedisTestCase):
+
+    def assertResults(self, mode):
+        code, out, err = _bench('--mode', mode, '--iterations', '3')
+        self.assertEqual(code, 0, err)
+        doc = json.loads(out)
+        self.assertEqual((doc['mode'], doc['iterations']), (mode, 3))
+        self.assertTrue(doc['results'])
+        for result in doc['results']:
+            self.assertEqual(result['ops'], 3)
+            self.assertTrue(result['round_trips_per_op'] > 0, result)
+        return doc['results']
+
+    def test_sync(self):
+        names = set(r['name'] for r in self.assertResults('sync'))
+        for name in ('Model.save', 'Manager.get_by_id', 'Set.add',
+                     'Hash.__getitem__', 'TypedList.all'):
+            self.assertIn(name, names)
+
+    def test_async(self):
+        self.assertResults('async')
+
+    def test_bad_mode(self):
+        code, out, err = _bench('--mode', 'threads')
+        self.assertEqual(code, 2)
@@ -0,0 +1,98 @@
+import threading
+
+from bredis.orm import (Model, Attribute, Counter, CounterBuffer,
+        get_counter_buffer)
+
+from .base import RedisTestCase, AsyncRedisTestCase
+
+
+class BufferedPage(Model):
+    title = Attribute()
+    views = Counter(buffered=True)
+
+
+class CounterBufferTest(RedisTestCase):
+
+    def test_cached_value_after_flush(self):
+        page = BufferedPage(title='a')
+        page.save()
+        self.db.hset(page.key(), 'views', 10)
+        page = BufferedPage.objects.get_by_id(page.id)
+        self.assertEqual(page.views, 10)
+        page.incr('views')
+        self.assertEqual(page.views, 11)
+        get_counter_buffer().flush()
+        self.assertEqual(page.views, 11)
+        self.assertEqual(self.db.hget(page.key(), 'views'), '11')
+
+    def test_save_keeps_counters(self):
+        page = BufferedPage(title='a')
+        page.save()
+        page.incr('views', 3)
+        get_counter_buffer().flush()
+        self.db.hincrby(page.key(), 'views', 5)
+        page.title = 'b'
+        page.save()
+        self.assertEqual(self.db.hget(page.key(), 'views'), '8')
+        self.assertEqual(self.db.hget(page.key(), 'title'), 'b')
+
+    def test_start_once(self):
+        buffer = CounterBuffer(interval=60)
+        barrier = threading.Event()
+
+        def start():
+            barrier.wait()
+            buffer.start()
+
+        threads = [threading.Thread(target=start) for _ in xrange(20)]
+        for t in threads:
+            t.start()
+        before = threading.active_count()
+        barrier.set()
+        for t in threads:
+            t.join()
+        # one flush thread is left
+        self.assertEqual(threading.active_count(), before - 20 + 1)
+        buffer.stop()
+        self.assertIsNone(buffer._timer)
+
+    def test_failed_flush(self):
+        from redis.exceptions import ResponseError
+        buffer = CounterBuffer(interval=60)
+        buffer.incr('a', 'views', 2)
+        buffer.incr('b', 'views', 3)
+        self.db.set('b', 'x')
+        self.assertRaises(ResponseError, buffer.flush)
+        # only the failed increment is sent again
+        self.assertEqual(buffer.pending('a', 'views'), 0)
+        self.assertEqual(buffer.pending('b', 'views'), 3)
+        self.db.delete('b')
+        buffer.stop()
+        self.assertEqual(self.db.hget('a', 'views'), '2')
+        self.assertEqual(self.db.hget('b', 'views'), '3')
+
+
+class AsyncCounterBufferTest(AsyncRedisTestCase):
+
+    def test_flush(self):
+        buffer = CounterBuffer(interval=60)
+        buffer.incr('a', 'views', 2)
+        self.assertEqual(self.call(buffer.flush), [2])
+        self.assertEqual(self.call(buffer.flush), [])
+        self.call(buffer.stop)
+        self.assertEqual(self.db.hget('a', 'views'), '2')
+
+    def test_failed_flush(self):
+        buffer = CounterBuffer(interval=60)
+        buffer.incr('a', 'views', 2)
+        buffer.incr('b', 'views', 3)
+        self.db.set('b', 'x')
+        res = self.call(buffer.flush)
+        self.assertEqual(len([r for r in res if isinstance(r, Exception)]),
+                         1)
+        self.assertEqual(buffer.pending('a', 'views'), 0)
+        self.assertEqual(buffer.pending('b', 'views'), 3)
+        self.db.delete('b')
+        self.call(buffer.stop)
+        self.assertEqual(self.db.hget('a', 'views'), '2')
+        self.assertEqual(self.db.hget('b', 'views'), '3')
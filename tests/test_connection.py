@@ -0,0 +1,84 @@
+import bredis
+
+from .base import RedisTestCase, AsyncRedisTestCase, HOST, PORT, DB
+
+
+class ConnectionTest(RedisTestCase):
+
+    def tearDown(self):
+        bredis.setup_connection(HOST, PORT, DB)
+
+    def test_backends(self):
+        self.assertFalse(bredis.is_async())
+        bredis.setup_connection(HOST, PORT, DB, async=True)
+        self.assertTrue(bredis.is_async())
+        bredis.setup_connection(HOST, PORT, DB)
+        self.assertFalse(bredis.is_async())
+        self.assertEqual(
+            bredis.get_client().connection_pool.connection_kwargs['db'], DB)
+
+    def test_tornado_settings(self):
+        bredis.setup_connection(HOST, PORT, DB, async=True)
+        client = bredis.get_client()
+        bredis.setup_connection(HOST, PORT, DB, async=True)
+        self.assertIs(bredis.get_client(), client)
+        bredis.setup_connection(HOST, PORT, DB - 1, async=True)
+        self.assertIsNot(bredis.get_client(), client)
+        self.assertEqual(bredis.get_client().selected_db, DB - 1)
+
+    def test_unknown_backend(self):
+        self.assertRaises(ValueError, bredis.setup_connection, HOST, PORT,
+                backend='memcached')
+
+
+class AsyncConnectionTest(AsyncRedisTestCase):
+
+    def test_pipeline_select(self):
+        # a new client, whose first command is a pipeline
+        bredis.setup_connection(HOST, PORT, DB, async=True,
+                                max_connections=10)
+        pipeline = bredis.get_client().pipeline()
+        for i in xrange(2):
+            pipeline.sadd('s', str(i))
+            self.assertEqual(self.call(pipeline.execute), [1])
+
+    def test_pipeline_select_after_reconnect(self):
+        pipeline = bredis.get_client().pipeline()
+        pipeline.sadd('s', 'a')
+        self.assertEqual(self.call(pipeline.execute), [1])
+        # a new connection starts on db 0
+        bredis.get_client().connection.info['db'] = 0
+        for i in xrange(2):
+            pipeline.sadd('s', str(i))
+            self.assertEqual(self.call(pipeline.execute), [1])
+        self.assertEqual(self.db.smembers('s'), set(['a', '0', '1']))
+
+    def test_first_pipeline(self):
+        # without a db to select, the pipeline sends no command of its
+        # own that would connect
+        bredis.setup_connection(HOST, PORT, async=True)
+        pipeline = bredis.get_client().pipeline()
+        pipeline.exists('bredis:test')
+        self.assertEqual(self.call(pipeline.execute), [False])
+
+    def test_unreachable_server(self):
+        from tornadoredis.exceptions import ConnectionError
+        # the client connects on its first command
+        bredis.setup_connection(HOST, 1, DB, async=True)
+        self.assertRaises(ConnectionError, bredis.get_client().get, 'k',
+                          callback=self.stop)
+
+    def test_error_replies(self):
+        self.db.set('k', 'v')
+        client = bredis.get_client()
+        # commands whose replies are formatted pass the error too
+        for func, args in ((client.sadd, ['k', 'a']),
+                           (client.hmget, ['k', ['a']]),
+                           (client.hgetall, ['k'])):
+            self.assertTrue(isinstance(self.call(func, *args), Exception))
+        pipeline = client.pipeline()
+        pipeline.hmget('k', ['a'])
+        pipeline.hmget('h', ['a'])
+        res = self.call(pipeline.execute)
+        self.assertTrue(isinstance(res[0], Exception))
+        self.assertEqual(res[1], {'a': None})
@@ -0,0 +1,438 @@
+import time
+
+from tornado.ioloop import IOLoop
+
+import bredis
+from bredis import get_client
+from bredis.containers import (Set, SortedSet, Hash, Queue,
+        QueueConsumer, HyperLogLog, Bitmap, BloomFilter, TimeSeries)
+
+from .base import RedisTestCase, AsyncRedisTestCase, HOST, PORT, DB
+
+
+class CachedSetTest(RedisTestCase):
+
+    def setUp(self):
+        super(CachedSetTest, self).setUp()
+        self.a, self.b = Set('a'), Set('b')
+        self.a.add_many(['1', '2', '3'])
+        self.b.add_many(['2', '3', '4'])
+
+    def test_operations(self):
+        a, b = self.a, self.b
+        self.assertEqual(a.cached_intersection(b).members, set(['2', '3']))
+        self.assertEqual(a.cached_union(b).members,
+                         set(['1', '2', '3', '4']))
+        self.assertEqual(a.cached_difference(b).members, set(['1']))
+        self.assertEqual(b.cached_difference(a).members, set(['4']))
+        # the key does not depend on the operand order but for difference
+        self.assertEqual(a.cached_union(b).key, b.cached_union(a).key)
+        self.assertNotEqual(a.cached_difference(b).key,
+                            b.cached_difference(a).key)
+
+    def test_reuse(self):
+        res = self.a.cached_intersection(self.b, ttl=30)
+        self.assertTrue(res.key.startswith('bredis:cache:sinter:'))
+        self.assertTrue(28 <= self.db.ttl(res.key) <= 30)
+        # the result lags behind the operands until it expires
+        self.b.add('1')
+        self.assertEqual(self.a.cached_intersection(self.b).members,
+                         set(['2', '3']))
+        self.db.delete(res.key)
+        self.assertEqual(self.a.cached_intersection(self.b).members,
+                         set(['1', '2', '3']))
+
+    def test_empty(self):
+        res = self.a.cached_intersection(Set('missing'))
+        self.assertEqual(res.members, set())
+        self.assertFalse(self.db.exists(res.key))
+
+
+class AsyncCachedSetTest(AsyncRedisTestCase):
+
+    def test_operations(self):
+        self.db.sadd('a', '1', '2')
+        self.db.sadd('b', '2', '3')
+        a, b = Set('a'), Set('b')
+        res = self.call(a.cached_intersection_async, b, ttl=30)
+        self.assertEqual(self.db.smembers(res.key), set(['2']))
+        self.assertTrue(28 <= self.db.ttl(res.key) <= 30)
+        res = self.call(a.cached_union_async, b)
+        self.assertEqual(self.db.smembers(res.key), set(['1', '2', '3']))
+        res = self.call(a.cached_difference_async, b)
+        self.assertEqual(self.db.smembers(res.key), set(['1']))
+
+    def test_errors(self):
+        self.db.set('b', 'x')
+        res = self.call(Set('a').cached_union_async, Set('b'))
+        self.assertTrue(isinstance(res, Exception))
+
+
+class HashTest(RedisTestCase):
+
+    def setUp(self):
+        super(HashTest, self).setUp()
+        self.h = Hash('h')
+        self.h.update({'a': '1', 'b': '2'}, c='x')
+
+    def test_get_many(self):
+        self.assertEqual(self.h.get_many(['a', 'z']), {'a': '1', 'z': None})
+        self.assertEqual(self.h.get_many([]), {})
+
+    def test_pop(self):
+        self.assertEqual(self.h.pop('a'), '1')
+        self.assertFalse('a' in self.h)
+        self.assertEqual(self.h.pop('a', 'd'), 'd')
+        self.assertRaises(KeyError, self.h.pop, 'a')
+
+    def test_setdefault(self):
+        self.assertEqual(self.h.setdefault('a', 'y'), '1')
+        self.assertEqual(self.h.setdefault('d', 4), '4')
+        self.assertEqual(self.h['d'], '4')
+        self.assertIsNone(self.h.setdefault('e'))
+        self.assertFalse('e' in self.h)
+
+    def test_replace(self):
+        self.h.replace({'z': '9'})
+        self.assertEqual(self.h.dict, {'z': '9'})
+        d = dict(('f%d' % i, str(i)) for i in xrange(2500))
+        self.h.dict = d
+        self.assertEqual(self.h.dict, d)
+        self.h.replace({})
+        self.assertFalse(self.db.exists('h'))
+
+    def test_incr(self):
+        self.assertEqual(self.h.incr('a', 2), 3)
+        self.assertEqual(self.h.incr_float('a', 0.5), 3.5)
+        self.assertEqual(self.h.incr_many({'b': 3, 'n': 1.5}),
+                         {'b': 5, 'n': 1.5})
+        self.assertEqual(self.h.get_many(['b', 'n']), {'b': '5', 'n': '1.5'})
+        from redis.exceptions import ResponseError
+        self.assertRaises(ResponseError, self.h.incr_many, {'c': 1})
+
+
+class AsyncHashTest(AsyncRedisTestCase):
+
+    def test_operations(self):
+        self.db.hmset('h', {'a': '1', 'b': '2'})
+        h = Hash('h')
+        self.assertEqual(self.call(h.get_many_async, ['a', 'z']),
+                         {'a': '1', 'z': None})
+        self.assertEqual(self.call(h.get_many_async, []), {})
+        self.assertEqual(self.call(h.pop_async, 'a'), '1')
+        self.assertEqual(self.call(h.pop_async, 'a', 'd'), 'd')
+        self.assertEqual(self.call(h.setdefault_async, 'b', 'y'), '2')
+        self.assertEqual(self.call(h.setdefault_async, 'c', 'y'), 'y')
+        self.assertEqual(self.call(h.incr_float_async, 'b', 0.5), 2.5)
+        self.assertEqual(self.call(h.incr_many_async, {'n': 2, 'm': 0.5}),
+                         {'n': 2, 'm': 0.5})
+        self.call(h.replace_async, {'z': '9'})
+        self.assertEqual(self.db.hgetall('h'), {'z': '9'})
+
+    def test_errors(self):
+        self.db.set('h', 'x')
+        h = Hash('h')
+        for func, args in ((h.pop_async, ['a']),
+                           (h.setdefault_async, ['a', 'y']),
+                           (h.incr_float_async, ['a']),
+                           (h.incr_many_async, [{'a': 1}])):
+            self.assertTrue(isinstance(self.call(func, *args), Exception))
+
+
+class BatchTest(RedisTestCase):
+
+    def test_batch(self):
+        s = Set('s')
+        self.assertEqual(s.add_many(['a', 'b', 'c'], chunk_size=2), 3)
+        self.assertEqual(s.contains_many(['a', 'x'], chunk_size=1),
+                         [True, False])
+        self.assertEqual(s.remove_many(['a', 'x']), 1)
+        z = SortedSet('z')
+        self.assertEqual(z.add_many({'a': 1, 'b': 2}, chunk_size=2), 2)
+        self.assertEqual(self.db.zrange('z', 0, -1, withscores=True),
+                         [('a', 1.0), ('b', 2.0)])
+
+    def test_attached(self):
+        pipeline = self.db.pipeline()
+        s = Set('s', pipeline=pipeline)
+        self.assertIsNone(s.add_many(['a', 'b', 'c'], chunk_size=2))
+        # native commands, not a script per chunk
+        self.assertEqual([args for args, _ in pipeline.command_stack],
+                         [('SADD', 's', 'a', 'b'), ('SADD', 's', 'c')])
+        self.assertRaises(RuntimeError, s.contains_many, ['a'])
+        self.assertEqual(pipeline.execute(), [2, 1])
+        self.assertEqual(self.db.scard('s'), 3)
+
+
+class AsyncBatchTest(AsyncRedisTestCase):
+
+    def test_batch(self):
+        s = Set('s')
+        self.assertEqual(self.call(s.add_many_async, ['a', 'b'],
+                                   chunk_size=1), 2)
+        self.assertEqual(self.call(s.contains_many_async, ['a', 'x']),
+                         [True, False])
+
+    def test_attached(self):
+        pipeline = get_client().pipeline()
+        s = Set('s', pipeline=pipeline)
+        self.assertIsNone(self.call(s.add_many_async, ['a', 'b']))
+        self.assertEqual(self.call(pipeline.execute), [2])
+
+    def test_error(self):
+        self.db.set('s', 'x')
+        res = self.call(Set('s').add_many_async, ['a'])
+        self.assertTrue(isinstance(res, Exception))
+
+
+class ClientTest(RedisTestCase):
+
+    def test_follows_setup_connection(self):
+        s = Set('s')
+        s.add('a')
+        try:
+            bredis.setup_connection(HOST, PORT, DB - 1)
+            self.assertEqual(len(s), 0)
+        finally:
+            bredis.setup_connection(HOST, PORT, DB)
+        self.assertEqual(len(s), 1)
+        self.assertIs(Set('s', db=self.db).db, self.db)
+
+
+class AsyncClientTest(AsyncRedisTestCase):
+
+    def setUp(self):
+        # the set is created in sync mode
+        bredis.setup_connection(HOST, PORT, DB)
+        self.s = Set('s')
+        super(AsyncClientTest, self).setUp()
+
+    def test_follows_setup_connection(self):
+        self.assertEqual(self.call(self.s.add_async, 'a'), 1)
+        self.assertEqual(self.db.smembers('s'), set(['a']))
+
+    def test_errors(self):
+        self.db.set('s', 'x')
+        self.assertTrue(isinstance(self.call(self.s.add_async, 'a'),
+                                   Exception))
+
+
+class QueueTest(RedisTestCase):
+
+    def test_pop_ack(self):
+        queue = Queue('q', visibility_timeout=0)
+        self.assertEqual(queue.push('a', 'b', 'c'), 3)
+        self.assertEqual(queue.pop(2), ['a', 'b'])
+        self.assertEqual(queue.inflight_len(), 2)
+        self.assertEqual(queue.ack(['a']), 1)
+        self.assertEqual(queue.reclaim(), 1)
+        self.assertEqual(queue.pop(5, timeout=1), ['b', 'c'])
+        self.assertEqual(queue.pop(timeout=1), [])
+        self.assertIs(queue.blocking_db, queue.db)
+
+
+class AsyncQueueTest(AsyncRedisTestCase):
+
+    def test_blocking_pop(self):
+        queue = Queue('q')
+        queue.pop_async(timeout=2, callback=self.stop)
+        # the shared client is not held up by the blocking pop
+        self.assertEqual(self.call(queue.push_async, 'a'), 1)
+        self.assertEqual(self.wait(), ['a'])
+        self.assertIsNot(queue.blocking_db, get_client())
+        self.assertIs(queue.blocking_db, queue.blocking_db)
+
+    def test_pop_error(self):
+        self.db.set('q', 'x')
+        res = self.call(Queue('q').pop_async, timeout=1)
+        self.assertTrue(isinstance(res, Exception))
+
+    def test_consumer_done_once(self):
+        queue = Queue('q')
+        self.db.lpush('q', 'a', 'b')
+        batches = []
+
+        def handler(items, done):
+            batches.append(items)
+            done()
+            done(['x'])
+            if len(batches) == 1:
+                raise ValueError
+            consumer.stop()
+            IOLoop.instance().add_timeout(time.time() + 0.1, self.stop)
+
+        pops = []
+        pop_async = queue.pop_async
+
+        def counted_pop_async(*args, **kwargs):
+            pops.append(args)
+            pop_async(*args, **kwargs)
+
+        queue.pop_async = counted_pop_async
+        consumer = QueueConsumer(queue, handler, count=1, timeout=1)
+        consumer.start()
+        self.wait()
+        self.assertEqual(batches, [['a'], ['b']])
+        self.assertEqual(len(pops), 2)
+        self.assertEqual(self.db.zcard('q:inflight'), 0)
+
+
+class BitmapTest(RedisTestCase):
+
+    def test_bitop(self):
+        a, b = Bitmap('a'), Bitmap('b')
+        a.set_many([1, 2, 3])
+        b.set_many([3, 4])
+        self.assertEqual(a.intersection('and', b).ids(), [3])
+        self.assertEqual(a.union('or', b).ids(), [1, 2, 3, 4])
+        self.assertEqual(a.bitop('xor', 'xor', b).ids(), [1, 2, 4])
+        self.assertEqual(a.get_many([0, 1]), [False, True])
+        self.assertEqual(a.count(), 3)
+
+
+class AsyncBitmapTest(AsyncRedisTestCase):
+
+    def test_bitop(self):
+        self.db.setbit('a', 1, 1)
+        self.db.setbit('b', 1, 1)
+        self.db.setbit('b', 2, 1)
+        res = self.call(Bitmap('a').bitop_async, 'or', 'or', Bitmap('b'))
+        self.assertEqual(res.key, 'or')
+        self.assertEqual(self.call(res.ids_async), [1, 2])
+
+    def test_error(self):
+        self.db.sadd('b', 'x')
+        res = self.call(Bitmap('a').bitop_async, 'and', 'and', Bitmap('b'))
+        self.assertTrue(isinstance(res, Exception))
+
+
+class HyperLogLogTest(RedisTestCase):
+
+    def test_count(self):
+        a, b = HyperLogLog('a'), HyperLogLog('b')
+        self.assertTrue(a.add('x', 'y'))
+        self.assertFalse(a.add('x'))
+        self.assertTrue(b.add_many([str(i) for i in xrange(100)],
+                                   chunk_size=30))
+        self.assertEqual(len(a), 2)
+        self.assertTrue(95 <= b.count() <= 105)
+        self.assertTrue(97 <= a.count(b) <= 107)
+        a.merge(b)
+        self.assertEqual(a.count(), a.count(b))
+
+    def test_error(self):
+        from redis.exceptions import ResponseError
+        self.db.sadd('a', 'x')
+        self.assertRaises(ResponseError, HyperLogLog('a').add, 'x')
+        self.assertRaises(ResponseError, HyperLogLog('a').count)
+
+
+class AsyncHyperLogLogTest(AsyncRedisTestCase):
+
+    def test_count(self):
+        a = HyperLogLog('a')
+        self.assertTrue(self.call(a.add_many_async, ['x', 'y']))
+        self.assertFalse(self.call(a.add_async, 'x'))
+        self.db.pfadd('b', 'z')
+        self.assertEqual(self.call(a.count_async), 2)
+        self.assertEqual(self.call(a.count_async, HyperLogLog('b')), 3)
+        self.call(a.merge_async, HyperLogLog('b'))
+        self.assertEqual(self.db.pfcount('a'), 3)
+
+    def test_errors(self):
+        self.db.sadd('a', 'x')
+        a = HyperLogLog('a')
+        for func, args in ((a.add_async, ['x']), (a.count_async, []),
+                           (a.merge_async, [HyperLogLog('b')])):
+            self.assertTrue(isinstance(self.call(func, *args), Exception))
+
+
+class BloomFilterTest(RedisTestCase):
+
+    def test_add(self):
+        f = BloomFilter('f', capacity=100, error_rate=0.01)
+        self.assertEqual((f.size, f.hashes), (959, 7))
+        self.assertTrue(f.add('a'))
+        self.assertFalse(f.add('a'))
+        self.assertEqual(f.add_many(['b', u'\xe9', 'a'], chunk_size=2),
+                         [True, True, False])
+        self.assertTrue('a' in f)
+        self.assertTrue(u'\xe9' in f)
+        self.assertEqual(f.contains_many(['b', 'c'], chunk_size=1),
+                         [True, False])
+
+    def test_error_rate(self):
+        f = BloomFilter('f', capacity=1000, error_rate=0.01)
+        f.add_many(str(i) for i in xrange(1000))
+        self.assertTrue(all(f.contains_many(str(i) for i in xrange(1000))))
+        false = sum(f.contains_many('x%d' % i for i in xrange(1000)))
+        self.assertTrue(false < 30, false)
+
+    def test_size(self):
+        self.assertRaises(ValueError, BloomFilter, 'f', capacity=10 ** 10)
+
+
+class AsyncBloomFilterTest(AsyncRedisTestCase):
+
+    def test_add(self):
+        f = BloomFilter('f', capacity=100)
+        self.assertTrue(self.call(f.add_async, 'a'))
+        self.assertEqual(self.call(f.add_many_async, ['a', 'b']),
+                         [False, True])
+        self.assertTrue(self.call(f.contains_async, 'b'))
+        self.assertEqual(self.call(f.contains_many_async, ['a', 'c']),
+                         [True, False])
+
+    def test_errors(self):
+        self.db.sadd('f', 'x')
+        f = BloomFilter('f', capacity=100)
+        for func in (f.add_async, f.contains_async):
+            self.assertTrue(isinstance(self.call(func, 'a'), Exception))
+
+
+class TimeSeriesTest(RedisTestCase):
+
+    def test_append(self):
+        series = TimeSeries('ts', rollups=(10,))
+        self.assertEqual(series.append_many([(1, 2), (2, '4'), (12, 1.5)]),
+                         3)
+        self.assertEqual(series.range(), [(1.0, 2.0), (2.0, 4.0),
+                                          (12.0, 1.5)])
+        self.assertEqual(series.aggregate(10, 'sum'), [(0, 6.0), (10, 1.5)])
+        self.assertEqual(series.rollup(10, 'max'), [(0, 4.0), (10, 1.5)])
+
+    def test_bad_samples(self):
+        series = TimeSeries('ts', rollups=(10,))
+        for sample in ((1, 'x'), (1, None), ('x', 1), (1, float('nan')),
+                       (1, float('inf'))):
+            self.assertRaises(ValueError, series.append_many,
+                              [(0, 1), sample])
+        self.assertEqual(len(series), 0)
+        series.append(1, 5)
+        self.assertEqual(series.rollup(10, 'avg'), [(0, 1.0)])
+
+    def test_interval(self):
+        series = TimeSeries('ts')
+        for interval in (0, -1):
+            self.assertRaises(ValueError, series.aggregate, interval)
+        self.assertRaises(ValueError, TimeSeries, 'ts', rollups=(0,))
+
+
+class AsyncTimeSeriesTest(AsyncRedisTestCase):
+
+    def test_append(self):
+        series = TimeSeries('ts')
+        self.assertEqual(self.call(series.append_many_async,
+                                   [(1, 2), (3, 4)]), 2)
+        self.assertEqual(self.call(series.aggregate_async, 10, 'avg'),
+                         [(0, 3.0)])
+
+    def test_errors(self):
+        series = TimeSeries('ts')
+        self.assertRaises(ValueError, series.append_async, 'x',
+                          callback=self.stop)
+        self.assertRaises(ValueError, series.aggregate_async, 0,
+                          callback=self.stop)
+        self.db.set('ts', 'x')
+        res = self.call(series.aggregate_async, 10)
+        self.assertTrue(isinstance(res, Exception))
@@ -0,0 +1,65 @@
+from bredis.orm import Model, Attribute, Counter
+
+from .base import RedisTestCase, AsyncRedisTestCase
+
+
+class ShardedPost(Model):
+    title = Attribute()
+    hits = Counter(shards=4)
+    views = Counter(shards=2, shard_by='client')
+
+
+class ShardedCounterTest(RedisTestCase):
+
+    def test_incr(self):
+        post = ShardedPost(title='a')
+        post.save()
+        for i in xrange(20):
+            post.incr('hits')
+        post.incr('views', 3)
+        post.decr('views')
+        self.assertEqual(post.hits, 20)
+        self.assertEqual(post.views, 2)
+        # the increments are spread over the shards, not the hash
+        self.assertIsNone(self.db.hget('ShardedPost:1', 'hits'))
+        self.assertEqual(sum(int(self.db.hget('ShardedPost:1:hits:%d' % i,
+                                              'hits') or 0)
+                             for i in xrange(4)), 20)
+        # a client always increments the same shard
+        self.assertEqual(len(self.db.keys('ShardedPost:1:views:*')), 1)
+        post = ShardedPost.objects.get_by_id('1')
+        self.assertEqual(post.hits, 20)
+        self.assertEqual(post.views, 2)
+
+    def test_delete(self):
+        post = ShardedPost(title='a')
+        post.save()
+        post.incr('hits')
+        post.incr('views')
+        post.delete()
+        self.assertEqual(self.db.keys('ShardedPost:1*'), [])
+
+    def test_bad_shard_by(self):
+        self.assertRaises(ValueError, Counter, shards=2, shard_by='hash')
+
+
+class AsyncShardedCounterTest(AsyncRedisTestCase):
+
+    def test_incr(self):
+        self.db.hset('ShardedPost:1', 'title', 'a')
+        post = self.call(ShardedPost.objects.get_by_id_async, '1')
+        self.assertEqual(self.call(post.incr_async, 'hits', 2), 2)
+        post = self.call(ShardedPost.objects.get_by_id_async, '1')
+        self.assertEqual(post.hits, 2)
+        self.assertIs(self.call(post.load_async, ['hits']), post)
+        self.assertEqual(post.hits, 2)
+
+    def test_errors(self):
+        self.db.hset('ShardedPost:1', 'title', 'a')
+        post = self.call(ShardedPost.objects.get_by_id_async, '1')
+        self.assertRaises(ValueError, post.incr_async, 'title',
+                          callback=self.stop)
+        for i in xrange(4):
+            self.db.set('ShardedPost:1:hits:%d' % i, 'x')
+        self.assertTrue(isinstance(self.call(post.incr_async, 'hits'),
+                                   Exception))
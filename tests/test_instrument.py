@@ -0,0 +1,96 @@
+from bredis import get_client
+from bredis.containers import Set
+from bredis.instrument import (instrument, add_sink, remove_sink,
+        HistogramSink, InstrumentedClient)
+
+from .base import RedisTestCase, AsyncRedisTestCase
+
+
+class InstrumentTest(RedisTestCase):
+
+    def setUp(self):
+        super(InstrumentTest, self).setUp()
+        self.sink = HistogramSink()
+        add_sink(self.sink)
+
+    def tearDown(self):
+        remove_sink(self.sink)
+
+    def test_disabled(self):
+        remove_sink(self.sink)
+        self.assertIs(instrument(self.db, 'Set'), self.db)
+
+    def test_events(self):
+        s = Set('s')
+        s.add('a')
+        self.assertTrue('a' in s)
+        pipeline = s.db.pipeline()
+        pipeline.sadd('s', 'b').scard('s')
+        self.assertEqual(pipeline.execute(), [1, 2])
+        stats = self.sink.snapshot()
+        self.assertEqual(stats[('Set', 'sadd')]['round_trips'], 1)
+        self.assertEqual(stats[('Set', 'sismember')]['round_trips'], 1)
+        self.assertEqual(stats[('Set', 'pipeline')]['commands'], 2)
+
+    def test_wrappers_cached(self):
+        wrapper = instrument(self.db, 'Set')
+        self.assertIs(instrument(self.db, 'Set'), wrapper)
+        self.assertIsNot(instrument(self.db, 'List'), wrapper)
+        self.assertIs(wrapper.sadd, wrapper.sadd)
+
+    def test_errors(self):
+        from redis.exceptions import ResponseError
+        self.db.set('k', 'v')
+        self.assertRaises(ResponseError, instrument(self.db, 'Set').sadd,
+                'k', 'a')
+        self.assertEqual(self.sink.snapshot()[('Set', 'sadd')]['errors'], 1)
+        pipeline = instrument(self.db, 'Set').pipeline()
+        pipeline.sadd('s', 'a').sadd('k', 'a')
+        self.assertRaises(ResponseError, pipeline.execute)
+        self.assertEqual(self.sink.snapshot()[('Set', 'pipeline')]['errors'],
+                1)
+
+
+class AsyncInstrumentTest(AsyncRedisTestCase):
+
+    def setUp(self):
+        super(AsyncInstrumentTest, self).setUp()
+        self.sink = HistogramSink()
+        add_sink(self.sink)
+
+    def tearDown(self):
+        remove_sink(self.sink)
+        super(AsyncInstrumentTest, self).tearDown()
+
+    def test_events(self):
+        db = instrument(get_client(), 'Set')
+        self.assertEqual(self.call(db.sadd, 's', 'a'), 1)
+        self.assertEqual(self.sink.snapshot()[('Set', 'sadd')]['round_trips'],
+                1)
+
+    def test_errors(self):
+        self.db.set('k', 'v')
+        db = instrument(get_client(), 'Set')
+        self.assertTrue(isinstance(self.call(db.spop, 'k'), Exception))
+        pipeline = db.pipeline()
+        pipeline.spop('s').spop('k')
+        res = self.call(pipeline.execute)
+        self.assertTrue(isinstance(res[1], Exception))
+        stats = self.sink.snapshot()
+        self.assertEqual(stats[('Set', 'spop')]['errors'], 1)
+        self.assertEqual(stats[('Set', 'pipeline')]['errors'], 1)
+
+    def test_positional_callable(self):
+        calls = []
+
+        class Client(object):
+            def command(self, *args, **kwargs):
+                calls.append((args, kwargs.get('callback')))
+
+        def value():
+            pass
+
+        InstrumentedClient(Client(), 'Stub').command('key', value)
+        (args, callback), = calls
+        self.assertEqual(args, ('key', value))
+        self.assertIsNot(callback, value)
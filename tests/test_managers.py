@@ -0,0 +1,298 @@
+from bredis.orm import (Model, Attribute, IntegerField, FloatField, Counter,
+        ReferenceField)
+
+from .base import RedisTestCase, AsyncRedisTestCase
+
+
+class ManagerAvatar(Model):
+    url = Attribute()
+
+
+class ManagerAuthor(Model):
+    name = Attribute()
+    avatar = ReferenceField(ManagerAvatar)
+
+
+class ManagerBook(Model):
+    title = Attribute()
+    pages = IntegerField()
+    price = FloatField()
+    author = ReferenceField(ManagerAuthor)
+
+
+def _books():
+    avatar = ManagerAvatar(url='a.png')
+    avatar.save()
+    author = ManagerAuthor(name='ann', avatar=avatar)
+    author.save()
+    books = []
+    for i in xrange(3):
+        book = ManagerBook(title='t%d' % i, pages=100 * (i + 1),
+                           price=1.5 * i, author=author)
+        book.save()
+        books.append(book)
+    return author, books
+
+
+class PrefetchTest(RedisTestCase):
+
+    def test_prefetch(self):
+        author, books = _books()
+        objs = ManagerBook.objects.get_by_ids([b.id for b in books],
+                prefetch=('author', 'author__avatar'))
+        self.assertEqual([o.title for o in objs], ['t0', 't1', 't2'])
+        self.assertEqual(objs[0].__dict__['_author'].name, 'ann')
+        self.assertEqual(objs[0].__dict__['_author'].__dict__['_avatar'].url,
+                'a.png')
+
+    def test_unknown_reference(self):
+        author, books = _books()
+        self.assertRaises(ValueError, ManagerBook.objects.get_by_ids,
+                [books[0].id], prefetch=('autor',))
+        self.assertRaises(ValueError, ManagerBook.objects.get_by_ids,
+                [books[0].id], prefetch=('author__avatr',))
+
+
+class AsyncPrefetchTest(AsyncRedisTestCase):
+
+    def test_prefetch(self):
+        self.db.hmset('ManagerAuthor:1', {'name': 'ann'})
+        self.db.hmset('ManagerBook:1', {'title': 't', 'author_id': '1'})
+        objs = self.call(ManagerBook.objects.get_by_ids_async, ['1', '2'],
+                prefetch=('author',))
+        self.assertEqual(len(objs), 1)
+        self.assertEqual(objs[0].title, 't')
+        self.assertEqual(objs[0].author.name, 'ann')
+
+    def test_unknown_reference(self):
+        self.assertRaises(ValueError, ManagerBook.objects.get_by_ids_async,
+                ['1'], prefetch=('autor',), callback=self.stop)
+
+
+class FieldSelectionTest(RedisTestCase):
+
+    def test_only(self):
+        author, books = _books()
+        book = ManagerBook.objects.get_by_id(books[1].id, only=('title',))
+        self.assertEqual(book.__dict__['_title'], 't1')
+        self.assertEqual(sorted(book.deferred),
+                ['author_id', 'pages', 'price'])
+        # deferred fields are fetched on access
+        self.assertEqual(book.pages, 200)
+
+    def test_only_unset(self):
+        book = ManagerBook(pages=1)
+        book.save()
+        book = ManagerBook.objects.get_by_id(book.id, only=('title',))
+        self.assertIsNotNone(book)
+        self.assertIsNone(book.title)
+
+    def test_no_field(self):
+        author, books = _books()
+        ids = [b.id for b in books] + ['99']
+        objs = ManagerBook.objects.get_by_ids(ids, only=())
+        self.assertEqual([o.id for o in objs], ids[:3])
+        objs = ManagerBook.objects.get_by_ids(ids,
+                defer=ManagerBook._attributes.keys())
+        self.assertEqual([o.id for o in objs], ids[:3])
+        self.assertEqual(objs[0].title, 't0')
+
+    def test_unknown_attribute(self):
+        for kwargs in ({'only': ('titel',)}, {'defer': ('titel',)},
+                       {'only': 'title'}):
+            self.assertRaises(ValueError, ManagerBook.objects.get_by_ids,
+                              ['1'], **kwargs)
+
+
+class AsyncFieldSelectionTest(AsyncRedisTestCase):
+
+    def test_no_field(self):
+        self.db.hmset('ManagerBook:1', {'title': 't'})
+        objs = self.call(ManagerBook.objects.get_by_ids_async, ['1', '2'],
+                only=(), as_dict=False)
+        self.assertEqual([o.id for o in objs], ['1'])
+        self.assertIs(self.call(objs[0].load_async, []), objs[0])
+        self.assertIs(self.call(objs[0].load_deferred_async), objs[0])
+        self.assertEqual(objs[0].title, 't')
+
+    def test_errors(self):
+        self.assertRaises(ValueError, ManagerBook.objects.get_by_ids_async,
+                ['1'], only=('titel',), callback=self.stop)
+        self.db.set('ManagerBook:1', 'x')
+        self.db.hmset('ManagerBook:2', {'title': 't'})
+        objs = self.call(ManagerBook.objects.get_by_ids_async, ['1', '2'],
+                only=('title',), as_dict=False)
+        self.assertEqual([o.id for o in objs], ['2'])
+        book = ManagerBook(title='t')
+        self.call(book.save_async)
+        self.db.delete(book.key())
+        self.db.set(book.key(), 'x')
+        self.assertIsNone(self.call(book.load_async, ['title']))
+
+
+class AggregateItem(Model):
+    price = FloatField()
+    hits = Counter()
+    likes = Counter(shards=4)
+
+
+class BucketedItem(Model):
+    price = FloatField()
+    hits = Counter()
+
+    class Meta:
+        storage = 'bucketed'
+        bucket_size = 2
+
+
+class TaggedItem(Model):
+    price = FloatField()
+    likes = Counter(shards=2)
+
+    class Meta:
+        id_encoding = 'base62'
+        hash_tag = True
+
+
+class DeclaredItem(Model):
+    price = FloatField()
+    likes = Counter(shards=2)
+
+    class Meta:
+        declare_keys = True
+
+
+def _items(model_class, n=3):
+    items = []
+    for i in xrange(n):
+        item = model_class(price=float(i + 1))
+        item.save()
+        for name in model_class._counters:
+            item.incr(name, i + 1)
+        items.append(item)
+    return items
+
+
+class AggregateTest(RedisTestCase):
+
+    def assertAggregates(self, model_class, counter):
+        items = _items(model_class)
+        ids = [item.id for item in items] + ['99']
+        self.db.sadd('ids', *ids)
+        self.db.zadd('zids', **dict((id, 1) for id in ids))
+        aggregates = {'price__sum': 'price', 'price__avg': 'price',
+                      'price__min': 'price', 'price__max': 'price',
+                      counter + '__sum': counter}
+        for arg in (ids, 'ids', 'zids'):
+            res = model_class.objects.aggregate(arg, sum=['price', counter],
+                    avg='price', min='price', max='price')
+            self.assertEqual(res, {'count': 3, 'price__sum': 6.0,
+                    'price__avg': 2.0, 'price__min': 1.0, 'price__max': 3.0,
+                    counter + '__sum': 6})
+            self.assertEqual(model_class.objects.count(arg), 3)
+        self.assertEqual(model_class.objects.count([]), 0)
+        self.assertEqual(model_class.objects.count('missing'), 0)
+
+    def test_aggregate(self):
+        self.assertAggregates(AggregateItem, 'hits')
+        self.assertEqual(AggregateItem.objects.aggregate(['1', '2'],
+                sum='likes')['likes__sum'], 3)
+
+    def test_bucketed(self):
+        self.assertAggregates(BucketedItem, 'hits')
+
+    def test_tagged(self):
+        self.assertAggregates(TaggedItem, 'likes')
+
+    def test_declared_keys(self):
+        self.assertAggregates(DeclaredItem, 'likes')
+
+
+class AsyncAggregateTest(AsyncRedisTestCase):
+
+    def test_aggregate(self):
+        self.db.hmset('AggregateItem:1', {'price': '2'})
+        self.db.hmset('AggregateItem:2', {'price': '4'})
+        self.db.sadd('ids', '1', '2', '3')
+        res = self.call(AggregateItem.objects.aggregate_async, 'ids',
+                        avg='price')
+        self.assertEqual(res, {'count': 2, 'price__avg': 3.0})
+        self.assertEqual(self.call(AggregateItem.objects.count_async,
+                                   ['1', '3']), 1)
+
+    def test_declared_keys(self):
+        self.db.hmset('DeclaredItem:1', {'price': '2'})
+        self.db.sadd('ids', '1', '2')
+        res = self.call(DeclaredItem.objects.aggregate_async, 'ids',
+                        max='price')
+        self.assertEqual(res, {'count': 1, 'price__max': 2.0})
+
+    def test_error(self):
+        self.db.set('ids', 'x')
+        self.assertIsNone(self.call(AggregateItem.objects.aggregate_async,
+                                    'ids', sum='price'))
+        self.assertEqual(self.call(DeclaredItem.objects.count_async, 'ids'),
+                         0)
+
+
+class SortPageTest(RedisTestCase):
+
+    def setUp(self):
+        super(SortPageTest, self).setUp()
+        # ties at score 1 sort by member
+        self.db.zadd('z', a=1, b=1, c=1, d=1, e=2, f=3)
+
+    def pages(self, **kwargs):
+        ids, cursor = [], None
+        while True:
+            page = ManagerBook.objects.get_sort_page('z', cursor=cursor,
+                    count=2, load=False, **kwargs)
+            ids.append(page.ids)
+            cursor = page.cursor
+            if cursor is None:
+                return ids
+
+    def test_pages(self):
+        self.assertEqual(self.pages(),
+                [['a', 'b'], ['c', 'd'], ['e', 'f'], []])
+        self.assertEqual(self.pages(reverse=True),
+                [['f', 'e'], ['d', 'c'], ['b', 'a'], []])
+        self.assertEqual(self.pages(start=1, end=1),
+                [['a', 'b'], ['c', 'd'], []])
+
+    def test_removed_cursor(self):
+        page = ManagerBook.objects.get_sort_page('z', count=3, load=False)
+        self.db.zrem('z', 'c')
+        page = ManagerBook.objects.get_sort_page('z', cursor=page.cursor,
+                count=3, load=False, with_scores=True)
+        self.assertEqual(page.ids, ['d', 'e', 'f'])
+        self.assertEqual(page.scores, [1.0, 2.0, 3.0])
+
+    def test_count(self):
+        for count in (0, -1):
+            self.assertRaises(ValueError, ManagerBook.objects.get_sort_page,
+                              'z', count=count)
+        self.assertRaises(ValueError, ManagerBook.objects.get_sort_page,
+                          'z', cursor='!')
+
+
+class AsyncSortPageTest(AsyncRedisTestCase):
+
+    def test_page(self):
+        self.db.hmset('ManagerBook:1', {'title': 't'})
+        self.db.zadd('z', **{'1': 1, '2': 1})
+        page = self.call(ManagerBook.objects.get_sort_page_async, 'z',
+                         count=1)
+        self.assertEqual(page.ids, ['1'])
+        self.assertEqual(page.objects[0]['title'], 't')
+        page = self.call(ManagerBook.objects.get_sort_page_async, 'z',
+                         cursor=page.cursor, count=1)
+        self.assertEqual(page.ids, ['2'])
+
+    def test_errors(self):
+        self.assertRaises(ValueError,
+                ManagerBook.objects.get_sort_page_async, 'z', count=0,
+                callback=self.stop)
+        self.db.set('z', 'x')
+        self.assertIsNone(self.call(ManagerBook.objects.get_sort_page_async,
+                                    'z'))
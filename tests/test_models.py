@@ -0,0 +1,153 @@
+from bredis.orm import Model, Attribute
+from bredis.orm import BadKeyError
+from bredis.orm.base import from_key, from_keys, get_model_from_key
+from bredis.orm.key import ID_ENCODINGS, encode_id, decode_id, strip_tag
+
+from .base import RedisTestCase, AsyncRedisTestCase
+
+
+class StatePost(Model):
+    key_cache = Attribute()
+    deferred = Attribute()
+    state = Attribute()
+
+
+class RegistryPost(Model):
+    title = Attribute()
+
+    class Meta:
+        key_prefix = 'rp'
+
+
+class ModelTest(RedisTestCase):
+
+    def test_save_and_load(self):
+        post = RegistryPost(title='a')
+        post.save()
+        self.assertEqual(post.key(), 'rp:1')
+        post = RegistryPost.objects.get_by_id('1')
+        self.assertEqual(post.title, 'a')
+        post.delete()
+        self.assertIsNone(RegistryPost.objects.get_by_id('1'))
+
+    def test_state_fields(self):
+        post = StatePost(key_cache='xy', deferred='d', state='s')
+        post.save()
+        self.assertEqual(post.key(), 'StatePost:1')
+        self.assertEqual(self.db.hgetall('StatePost:1'),
+                {'key_cache': 'xy', 'deferred': 'd', 'state': 's'})
+        post = StatePost.objects.get_by_id('1', only=('state',))
+        self.assertEqual(post.deferred, 'd')
+        self.assertEqual(post.key_cache, 'xy')
+
+    def test_shadowing_fields(self):
+        for name in ('key', 'errors', 'id', 'meta_ttl'):
+            self.assertRaises(ValueError, type, 'Shadow', (Model,),
+                              {name: Attribute()})
+
+    def test_registry(self):
+        self.assertIs(get_model_from_key('rp:1'), RegistryPost)
+        self.assertIs(get_model_from_key('RegistryPost'), RegistryPost)
+        self.assertRaises(ValueError, type, 'RegistryPost', (Model,), {})
+        self.assertRaises(ValueError, type, 'OtherPost', (Model,),
+                          {'Meta': type('Meta', (), {'key_prefix': 'rp'})})
+        # a failed registration leaves the registry alone
+        self.assertIs(get_model_from_key('rp:1'), RegistryPost)
+        self.assertIsNone(get_model_from_key('OtherPost'))
+
+    def test_from_keys(self):
+        RegistryPost(title='a').save()
+        StatePost(state='s').save()
+        self.assertEqual(from_key('rp:1').title, 'a')
+        objs = from_keys(['rp:1', 'StatePost:1', 'rp:2'])
+        self.assertEqual(objs[0].title, 'a')
+        self.assertEqual(objs[1].state, 's')
+        self.assertIsNone(objs[2])
+
+
+class AsyncModelStateTest(AsyncRedisTestCase):
+
+    def test_state_fields(self):
+        post = StatePost(key_cache='xy', deferred='d', state='s')
+        self.call(post.save_async)
+        post = self.call(StatePost.objects.get_by_id_async, post.id,
+                         only=('state',))
+        self.assertEqual(post.state, 's')
+        # the field shadows Model.deferred
+        self.assertEqual(post.object_dict, {'id': '1', 'state': 's'})
+        self.assertIs(self.call(post.load_deferred_async), post)
+        self.assertEqual((post.key_cache, post.deferred), ('xy', 'd'))
+
+    def test_errors(self):
+        post = StatePost(state='s')
+        self.call(post.save_async)
+        self.db.delete(post.key())
+        self.db.set(post.key(), 'x')
+        self.assertIsNone(self.call(StatePost.objects.get_by_id_async,
+                                    post.id, only=('state',)))
+        self.assertTrue(isinstance(self.call(post.save_async), Exception))
+
+
+class TaggedPost(Model):
+    title = Attribute()
+
+    class Meta:
+        id_encoding = 'base62'
+        hash_tag = True
+
+
+class BracePost(Model):
+    title = Attribute()
+
+    class Meta:
+        key_prefix = 'br{ace}'
+
+
+class KeyTest(RedisTestCase):
+
+    def test_encode_id(self):
+        self.assertEqual(encode_id(12), '12')
+        self.assertEqual(encode_id('12'), '12')
+        self.assertEqual(encode_id(61, 'base62'), 'Z')
+        for encoding in ID_ENCODINGS:
+            self.assertRaises(ValueError, encode_id, '1a', encoding)
+            self.assertRaises(ValueError, encode_id, -1, encoding)
+            self.assertEqual(decode_id(encode_id(0, encoding), encoding), 0)
+            self.assertEqual(decode_id(encode_id(1000, encoding), encoding),
+                             1000)
+
+    def test_tagged_keys(self):
+        for i in xrange(62):
+            post = TaggedPost(title='t%d' % i)
+            post.save()
+        self.assertEqual(post.key(), '{TaggedPost:10}')
+        self.assertEqual(strip_tag('{TaggedPost:10}:hits'),
+                         'TaggedPost:10:hits')
+        self.assertEqual(from_key('{TaggedPost:10}').title, 't61')
+        self.assertEqual(from_key('{TaggedPost:10}:hits').title, 't61')
+
+    def test_braces_in_prefix(self):
+        post = BracePost(title='a')
+        post.save()
+        self.assertEqual(post.key(), 'br{ace}:1')
+        self.assertEqual(from_key('br{ace}:1').title, 'a')
+        self.assertRaises(BadKeyError, from_key, 'brace:1')
+
+
+class AsyncKeyTest(AsyncRedisTestCase):
+
+    def test_tagged_keys(self):
+        self.db.set('TaggedPost:id', 60)
+        post = TaggedPost(title='a')
+        self.call(post.save_async)
+        self.assertEqual(post.key(), '{TaggedPost:Z}')
+        self.assertEqual(self.db.hget('{TaggedPost:Z}', 'title'), 'a')
+        post = self.call(TaggedPost.objects.get_by_id_async, post.id)
+        self.assertEqual(post.title, 'a')
+
+    def test_bad_ids(self):
+        for id in ('1a', '-1'):
+            self.assertRaises(ValueError, RegistryPost.objects.get_by_id_async,
+                              id, callback=self.stop)
+        self.assertRaises(ValueError, TaggedPost.objects.get_by_id_async,
+                          '-1', callback=self.stop)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from bredis.orm import Model, CharField, AttributeNotIndexed
+
+from .base import RedisTestCase, AsyncRedisTestCase
+
+
+class PrefixUser(Model):
+    name = CharField(prefix_index=True)
+    city = CharField()
+
+
+def _users(*names):
+    users = []
+    for name in names:
+        user = PrefixUser(name=name)
+        user.save()
+        users.append(user)
+    return users
+
+
+class PrefixIndexTest(RedisTestCase):
+
+    def test_startswith(self):
+        _users('Alice', 'alfred', ' Bob', 'ALBERT')
+        search = PrefixUser.objects.startswith
+        self.assertEqual(search('name', 'al'), ['4', '2', '1'])
+        self.assertEqual(search('name', ' AL '), ['4', '2', '1'])
+        self.assertEqual(search('name', 'bo'), ['3'])
+        self.assertEqual(search('name', 'al', limit=2), ['4', '2'])
+        self.assertEqual(search('name', 'z'), [])
+        self.assertEqual([u.name for u in search('name', 'ali', load=True)],
+                         ['Alice'])
+
+    def test_unicode(self):
+        _users(u'\xc9lodie', 'eve')
+        self.assertEqual(PrefixUser.objects.startswith('name', u'\xe9l'),
+                         ['1'])
+        self.assertEqual(PrefixUser.objects.startswith('name', '\xc3\xa9'),
+                         ['1'])
+
+    def test_reindex(self):
+        user, = _users('alice')
+        user.name = 'bob'
+        user.save()
+        self.assertEqual(PrefixUser.objects.startswith('name', 'al'), [])
+        self.assertEqual(PrefixUser.objects.startswith('name', 'bo'), ['1'])
+        # fields that were not loaded are left as indexed
+        user = PrefixUser.objects.get_by_id('1', only=('city',))
+        user.city = 'paris'
+        user.save()
+        self.assertEqual(PrefixUser.objects.startswith('name', 'bo'), ['1'])
+        user.name = None
+        user.save()
+        self.assertEqual(self.db.zcard('PrefixUser:prefix:name'), 0)
+
+    def test_delete(self):
+        a, b = _users('ann', 'anna')
+        a.delete()
+        self.assertEqual(PrefixUser.objects.startswith('name', 'an'), ['2'])
+        self.assertFalse(self.db.hexists('PrefixUser:prefix:name:ids', '1'))
+
+    def test_not_indexed(self):
+        self.assertRaises(AttributeNotIndexed,
+                PrefixUser.objects.startswith, 'city', 'p')
+
+
+class AsyncPrefixIndexTest(AsyncRedisTestCase):
+
+    def test_startswith(self):
+        for name in ('Alice', 'alfred'):
+            self.call(PrefixUser(name=name).save_async)
+        self.assertEqual(self.call(PrefixUser.objects.startswith_async,
+                                   'name', 'AL'), ['2', '1'])
+        users = self.call(PrefixUser.objects.startswith_async, 'name',
+                          'alf', load=True)
+        self.assertEqual([u.name for u in users], ['alfred'])
+
+    def test_errors(self):
+        self.assertRaises(AttributeNotIndexed,
+                PrefixUser.objects.startswith_async, 'city', 'p',
+                callback=self.stop)
+        self.db.set('PrefixUser:prefix:name', 'x')
+        self.assertEqual(self.call(PrefixUser.objects.startswith_async,
+                                   'name', 'a'), [])
@@ -0,0 +1,122 @@
+import logging
+
+from bredis.containers import Set
+from bredis.orm import (Model, Attribute, IntegerField, Counter,
+        ReferenceField, QueryBudget, QueryBudgetExceeded)
+
+from .base import RedisTestCase, AsyncRedisTestCase
+
+
+class ProfiledAuthor(Model):
+    name = Attribute()
+
+
+class ProfiledPost(Model):
+    title = Attribute()
+    pages = IntegerField()
+    hits = Counter()
+    author = ReferenceField(ProfiledAuthor)
+
+
+def _posts(n=3):
+    author = ProfiledAuthor(name='ann')
+    author.save()
+    ids = []
+    for i in xrange(n):
+        post = ProfiledPost(title='t%d' % i, pages=i, author=author)
+        post.save()
+        ids.append(post.id)
+    return ids
+
+
+class QueryBudgetTest(RedisTestCase):
+
+    def test_round_trips(self):
+        s = Set('s')
+        with QueryBudget() as scope:
+            s.add('a')
+            pipeline = s.db.pipeline()
+            pipeline.sadd('s', 'b').scard('s')
+            pipeline.execute()
+        self.assertEqual(scope.round_trips, 2)
+        self.assertEqual(scope.commands, 3)
+        self.assertFalse(scope.exceeded)
+        # not counted outside the scope
+        s.add('c')
+        self.assertEqual(scope.round_trips, 2)
+
+    def test_lazy_loads(self):
+        ids = _posts()
+        with QueryBudget() as scope:
+            posts = ProfiledPost.objects.get_by_ids(ids, only=('title',))
+            for post in posts:
+                post.pages, post.author, post.hits
+        patterns = scope.patterns()
+        self.assertEqual(sorted(p[0] for p in patterns),
+                ['ProfiledPost.author', 'ProfiledPost.author_id',
+                 'ProfiledPost.hits',
+                 'ProfiledPost.pages'])
+        for field, filename, lineno, count in patterns:
+            self.assertEqual(count, 3)
+            self.assertTrue(filename.endswith('test_profiling.py'))
+        self.assertTrue('ProfiledPost.pages lazily loaded 3 times from '
+                        'test_profiling.py' in scope.summary())
+
+    def test_stacks(self):
+        ids = _posts(1)
+        with QueryBudget(stacks=True) as scope:
+            ProfiledPost.objects.get_by_id(ids[0], only=()).pages
+        (k, stack), = scope.lazy_stacks.items()
+        self.assertEqual(k[0], 'ProfiledPost.pages')
+        self.assertTrue('test_stacks' in stack[-1])
+
+    def test_nested(self):
+        with QueryBudget() as outer:
+            Set('s').add('a')
+            with QueryBudget() as inner:
+                Set('s').add('b')
+        self.assertEqual(outer.round_trips, 2)
+        self.assertEqual(inner.round_trips, 1)
+
+    def test_budget(self):
+        def run(**kwargs):
+            with QueryBudget(name='feed', **kwargs):
+                for i in xrange(3):
+                    Set('s').add(str(i))
+        run(budget=3, action='raise')
+        self.assertRaises(QueryBudgetExceeded, run, budget=2, action='raise')
+        logger = logging.getLogger()
+        level, logger.level = logger.level, logging.CRITICAL
+        try:
+            run(budget=2)
+        finally:
+            logger.level = level
+        self.assertRaises(ValueError, QueryBudget, action='fail')
+
+    def test_exception_in_scope(self):
+        def run():
+            with QueryBudget(budget=0, action='raise'):
+                Set('s').add('a')
+                raise KeyError
+        # the original exception is not masked by the budget check
+        self.assertRaises(KeyError, run)
+        with QueryBudget() as scope:
+            Set('s').add('a')
+        self.assertEqual(scope.round_trips, 1)
+
+
+class AsyncQueryBudgetTest(AsyncRedisTestCase):
+
+    def test_round_trips(self):
+        with QueryBudget() as scope:
+            self.assertEqual(self.call(Set('s').add_async, 'a'), 1)
+        self.assertEqual(scope.round_trips, 1)
+
+    def test_errors(self):
+        self.db.set('k', 'v')
+        with QueryBudget(budget=0) as scope:
+            res = self.call(Set('k').pop_async)
+        self.assertTrue(isinstance(res, Exception))
+        # failed round trips are counted, lazy loads are not made
+        self.assertEqual(scope.round_trips, 1)
+        self.assertTrue(scope.exceeded)
@@ -0,0 +1,46 @@
+from bredis import get_client
+from bredis.scripts import Script
+
+from .base import RedisTestCase, AsyncRedisTestCase
+
+
+_answer = Script("return {KEYS[1], ARGV[1]}")
+
+
+class ScriptTest(RedisTestCase):
+
+    def test_after_script_flush(self):
+        self.db.script_flush()
+        self.assertEqual(_answer(['k'], [42]), ['k', '42'])
+        # cached now
+        self.assertEqual(self.db.script_exists(_answer.sha), [True])
+        self.assertEqual(_answer(['k'], [43]), ['k', '43'])
+
+    def test_pipeline(self):
+        self.db.script_flush()
+        pipeline = self.db.pipeline()
+        _answer(['k'], [1], db=pipeline)
+        _answer(['k'], [2], db=pipeline)
+        self.assertEqual(pipeline.execute(), [['k', '1'], ['k', '2']])
+
+    def test_error(self):
+        from redis.exceptions import ResponseError
+        self.assertRaises(ResponseError, Script("return redis.call('x')"))
+
+
+class AsyncScriptTest(AsyncRedisTestCase):
+
+    def test_after_script_flush(self):
+        self.db.script_flush()
+        self.assertEqual(self.call(_answer, ['k'], [42]), ['k', '42'])
+        self.assertEqual(self.call(_answer, ['k'], [43]), ['k', '43'])
+
+    def test_pipeline(self):
+        self.db.script_flush()
+        pipeline = get_client().pipeline()
+        _answer(['k'], [1], db=pipeline)
+        self.assertEqual(self.call(pipeline.execute), [['k', '1']])
+
+    def test_error(self):
+        res = self.call(Script("return redis.call('x')"))
+        self.assertTrue(isinstance(res, Exception))
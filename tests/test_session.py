@@ -0,0 +1,79 @@
+from tornado.ioloop import IOLoop
+
+from bredis.containers import List
+from bredis.orm import Model, Attribute, Counter, session, get_session
+
+from .base import RedisTestCase, AsyncRedisTestCase
+
+
+class SessionPost(Model):
+    title = Attribute()
+    hits = Counter()
+
+
+class SessionTest(RedisTestCase):
+
+    def test_flush_at_exit(self):
+        post = SessionPost(title='a')
+        post.save()
+        timeline = List('timeline')
+        with session() as s:
+            post.title = 'b'
+            post.save()
+            post.incr('hits')
+            s.attach(timeline).append(post.id)
+            self.assertEqual(self.db.hget(post.key(), 'title'), 'a')
+            self.assertEqual(self.db.llen('timeline'), 0)
+        self.assertEqual(self.db.hget(post.key(), 'title'), 'b')
+        self.assertEqual(self.db.hget(post.key(), 'hits'), '1')
+        self.assertEqual(self.db.lrange('timeline', 0, -1), [post.id])
+
+    def test_discard_on_error(self):
+        post = SessionPost(title='a')
+        post.save()
+        try:
+            with session():
+                post.title = 'b'
+                post.save()
+                raise KeyError
+        except KeyError:
+            pass
+        self.assertEqual(self.db.hget(post.key(), 'title'), 'a')
+        self.assertIsNone(get_session())
+
+    def test_attach_restores_pipeline(self):
+        timeline = List('timeline')
+        with session() as s:
+            s.attach(timeline).append('1')
+        self.assertIsNone(timeline.pipeline)
+        timeline.append('2')
+        self.assertEqual(self.db.lrange('timeline', 0, -1), ['1', '2'])
+
+        try:
+            with session() as s:
+                s.attach(timeline).append('3')
+                raise KeyError
+        except KeyError:
+            pass
+        self.assertIsNone(timeline.pipeline)
+        timeline.append('4')
+        self.assertEqual(self.db.lrange('timeline', 0, -1), ['1', '2', '4'])
+
+
+class AsyncSessionTest(AsyncRedisTestCase):
+
+    def test_flush_at_exit(self):
+        post = SessionPost(title='a')
+        with session(callback=self.stop):
+            post.save_async()
+        self.wait()
+        self.assertEqual(self.db.hget(post.key(), 'title'), 'a')
+
+    def test_span_yield(self):
+        s = session()
+        s.__enter__()
+        # another handler runs while the block waits
+        IOLoop.instance().add_callback(self.stop)
+        self.wait()
+        self.assertIsNone(get_session())
+        self.assertRaises(RuntimeError, s.__exit__, None, None, None)
@@ -0,0 +1,131 @@
+import json
+
+from bredis.orm import (Model, Attribute, IntegerField, Counter,
+        BucketMigration)
+
+from .base import RedisTestCase, AsyncRedisTestCase
+
+
+class BucketPost(Model):
+    title = Attribute()
+    pages = IntegerField()
+    hits = Counter()
+
+    class Meta:
+        storage = 'bucketed'
+        bucket_size = 10
+
+
+class StoragePost(Model):
+    title = Attribute()
+    hits = Counter()
+
+
+class BucketTest(RedisTestCase):
+
+    def test_layout(self):
+        for i in xrange(11):
+            BucketPost(title='t%d' % i, pages=i).save()
+        self.assertEqual(self.db.hlen('BucketPost:bucket:0'), 9)
+        self.assertEqual(self.db.hkeys('BucketPost:bucket:1'), ['10', '11'])
+        self.assertEqual(json.loads(self.db.hget('BucketPost:bucket:1', '11')),
+                {'title': 't10', 'pages': '10'})
+        self.assertFalse(self.db.exists('BucketPost:11'))
+        self.assertEqual(BucketPost.objects.get_by_id('11').storage_key(),
+                'BucketPost:bucket:1')
+
+    def test_save_and_load(self):
+        post = BucketPost(title='a', pages=3)
+        post.save()
+        post = BucketPost.objects.get_by_id(post.id)
+        self.assertEqual((post.title, post.pages), ('a', 3))
+        post.title = 'b'
+        post.save()
+        self.assertEqual(BucketPost.objects.get_by_id(post.id).title, 'b')
+        self.assertIsNone(BucketPost.objects.get_by_id('99'))
+        objs = BucketPost.objects.get_by_ids([post.id, '99'])
+        self.assertEqual([o.title for o in objs], ['b'])
+        # lazy fetch of a deferred field
+        post = BucketPost.objects.get_by_id(post.id, only=('title',))
+        self.assertEqual(post.pages, 3)
+
+    def test_counters(self):
+        post = BucketPost(title='a')
+        post.save()
+        post.incr('hits', 2)
+        post.decr('hits')
+        self.assertEqual(self.db.hget('BucketPost:bucket:0', '1:hits'), '1')
+        # saving keeps the counter
+        post.title = 'b'
+        post.save()
+        self.assertEqual(BucketPost.objects.get_by_id(post.id).hits, 1)
+
+    def test_delete(self):
+        a, b = BucketPost(title='a'), BucketPost(title='b')
+        a.save()
+        b.save()
+        a.incr('hits')
+        a.delete()
+        self.assertIsNone(BucketPost.objects.get_by_id(a.id))
+        self.assertEqual(self.db.hkeys('BucketPost:bucket:0'), ['2'])
+        self.assertEqual(BucketPost.objects.get_by_id(b.id).title, 'b')
+
+    def test_ttl(self):
+        post = BucketPost(title='a')
+        self.assertRaises(ValueError, post.save, ttl=10)
+        self.assertRaises(ValueError, type, 'ExpiringBucketPost', (Model,),
+                {'Meta': type('Meta', (), {'storage': 'bucketed',
+                                           'ttl': 10})})
+
+
+class BucketMigrationTest(RedisTestCase):
+
+    def setUp(self):
+        super(BucketMigrationTest, self).setUp()
+        self.db.set('BucketPost:id', 3)
+        self.db.hmset('BucketPost:1', {'title': 'a', 'hits': '2'})
+        self.db.hmset('BucketPost:3', {'title': 'c'})
+
+    def test_migrate(self):
+        # a write made after the switch is kept
+        self.db.hset('BucketPost:bucket:0', '3', json.dumps({'title': 'd'}))
+        self.db.hincrby('BucketPost:bucket:0', '1:hits', 1)
+        self.assertEqual(BucketMigration(BucketPost, batch_size=2).run(), 2)
+        self.assertFalse(self.db.exists('BucketPost:1'))
+        post = BucketPost.objects.get_by_id('1')
+        self.assertEqual((post.title, post.hits), ('a', 3))
+        self.assertEqual(BucketPost.objects.get_by_id('3').title, 'd')
+
+    def test_keep(self):
+        for i in xrange(2):
+            self.assertEqual(BucketMigration(BucketPost, delete=False).run(),
+                             2)
+        self.assertEqual(BucketPost.objects.get_by_id('1').hits, 2)
+        self.assertTrue(self.db.exists('BucketPost:1'))
+        self.assertEqual(self.db.smembers('BucketPost:bucket:migrated'),
+                         set(['1', '3']))
+
+    def test_not_bucketed(self):
+        self.assertRaises(ValueError, BucketMigration, StoragePost)
+
+
+class AsyncBucketTest(AsyncRedisTestCase):
+
+    def test_save_and_load(self):
+        post = BucketPost(title='a', pages=2)
+        self.call(post.save_async)
+        self.assertEqual(json.loads(self.db.hget('BucketPost:bucket:0', '1')),
+                {'title': 'a', 'pages': '2'})
+        self.assertEqual(self.call(post.incr_async, 'hits', 3), 3)
+        post = self.call(BucketPost.objects.get_by_id_async, '1')
+        self.assertEqual((post.title, post.pages, post.hits), ('a', 2, 3))
+        self.call(post.delete_async)
+        self.assertEqual(self.db.hlen('BucketPost:bucket:0'), 0)
+
+    def test_errors(self):
+        post = BucketPost(title='a')
+        self.call(post.save_async)
+        self.db.set('BucketPost:bucket:0', 'x')
+        self.assertTrue(isinstance(self.call(post.save_async), Exception))
+        self.assertTrue(isinstance(self.call(post.incr_async, 'hits'),
+                                   Exception))
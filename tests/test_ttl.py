@@ -0,0 +1,109 @@
+from bredis.orm import Model, Attribute, Counter
+
+from .base import RedisTestCase, AsyncRedisTestCase
+
+
+class ExpiringPost(Model):
+    title = Attribute()
+    hits = Counter()
+    likes = Counter(shards=2)
+
+    class Meta:
+        ttl = 100
+
+
+class SlidingPost(Model):
+    title = Attribute()
+    likes = Counter(shards=2)
+
+    class Meta:
+        ttl = 100
+        sliding_ttl = True
+
+
+class TTLTest(RedisTestCase):
+
+    def assertExpires(self, key, low, high):
+        ttl = self.db.pttl(key)
+        self.assertTrue(low <= ttl <= high, '%s expires in %s' % (key, ttl))
+
+    def test_save(self):
+        post = ExpiringPost(title='a')
+        post.save()
+        self.assertExpires('ExpiringPost:1', 99000, 100000)
+        post.save(ttl=5.5)
+        self.assertExpires('ExpiringPost:1', 5000, 5500)
+
+    def test_counters(self):
+        post = ExpiringPost(title='a')
+        post.save(ttl=50)
+        post.incr('hits', 2)
+        post.incr('likes')
+        self.assertEqual(ExpiringPost.objects.get_by_id(post.id).hits, 2)
+        self.assertExpires('ExpiringPost:1', 49000, 50000)
+        shard, = self.db.keys('ExpiringPost:1:likes:*')
+        self.assertExpires(shard, 49000, 50000)
+        post.touch(ttl=20)
+        self.assertExpires('ExpiringPost:1', 19000, 20000)
+        self.assertExpires(shard, 19000, 20000)
+
+    def test_expired(self):
+        post = ExpiringPost(title='a')
+        post.save()
+        self.db.delete('ExpiringPost:1')
+        # increments do not recreate the keys of expired objects
+        post.incr('hits')
+        post.incr('likes')
+        self.assertEqual(self.db.keys('ExpiringPost:1*'), [])
+
+    def test_sliding(self):
+        post = SlidingPost(title='a')
+        post.save()
+        post.incr('likes')
+        shard, = self.db.keys('SlidingPost:1:likes:*')
+        self.db.expire('SlidingPost:1', 10)
+        self.db.expire(shard, 10)
+        post = SlidingPost.objects.get_by_id(post.id)
+        self.assertExpires('SlidingPost:1', 99000, 100000)
+        self.assertExpires(shard, 99000, 100000)
+        self.db.expire('SlidingPost:1', 10)
+        self.assertEqual(post.title, 'a')
+        self.assertExpires('SlidingPost:1', 99000, 100000)
+        self.db.expire('SlidingPost:1', 10)
+        objs = SlidingPost.objects.get_by_ids([post.id, '99'],
+                                              only=('title',))
+        self.assertEqual([o.title for o in objs], ['a'])
+        self.assertExpires('SlidingPost:1', 99000, 100000)
+        # missing objects are not created by the refresh
+        self.assertIsNone(SlidingPost.objects.get_by_id('99'))
+        self.assertFalse(self.db.exists('SlidingPost:99'))
+
+    def test_meta(self):
+        self.assertRaises(ValueError, type, 'BadSlidingPost', (Model,),
+                          {'Meta': type('Meta', (), {'sliding_ttl': True})})
+        self.assertRaises(ValueError, type, 'BadBufferedPost', (Model,),
+                          {'Meta': type('Meta', (), {'ttl': 10}),
+                           'hits': Counter(buffered=True)})
+
+
+class AsyncTTLTest(AsyncRedisTestCase):
+
+    def test_save_and_touch(self):
+        post = ExpiringPost(title='a')
+        self.call(post.save_async, ttl=30)
+        self.assertTrue(29 <= self.db.ttl('ExpiringPost:1') <= 30)
+        self.assertEqual(self.call(post.incr_async, 'hits', 2), 2)
+        self.assertTrue(29 <= self.db.ttl('ExpiringPost:1') <= 30)
+        self.call(post.touch_async, ttl=10)
+        self.assertTrue(9 <= self.db.ttl('ExpiringPost:1') <= 10)
+        self.db.delete('ExpiringPost:1')
+        self.assertIsNone(self.call(post.incr_async, 'hits'))
+        self.assertFalse(self.db.exists('ExpiringPost:1'))
+
+    def test_errors(self):
+        post = ExpiringPost(title='a')
+        self.call(post.save_async)
+        self.db.delete('ExpiringPost:1')
+        self.db.set('ExpiringPost:1', 'x')
+        self.assertTrue(isinstance(self.call(post.incr_async, 'hits'),
+                                   Exception))
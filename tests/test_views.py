@@ -0,0 +1,124 @@
+from bredis.orm import Model, CharField, Counter, SortedView
+
+from .base import RedisTestCase, AsyncRedisTestCase
+
+
+class ViewPost(Model):
+    category = CharField()
+    score = Counter()
+
+    class Meta:
+        views = [SortedView('score', partition_by='category', limit=2),
+                 SortedView('score', name='top')]
+
+
+class BucketedViewPost(Model):
+    category = CharField()
+    score = Counter()
+
+    class Meta:
+        storage = 'bucketed'
+        bucket_size = 10
+        views = [SortedView('score', partition_by='category')]
+
+
+def _ids(model_class, name, **kwargs):
+    return model_class.objects.view(name, load=False, **kwargs).ids
+
+
+class ViewTest(RedisTestCase):
+
+    def posts(self, model_class=ViewPost, n=4):
+        posts = []
+        for i in xrange(n):
+            post = model_class(category='news')
+            post.save()
+            post.incr('score', i + 1)
+            posts.append(post)
+        return posts
+
+    def test_view(self):
+        posts = self.posts()
+        self.assertEqual(_ids(ViewPost, 'top'), ['4', '3', '2', '1'])
+        self.assertEqual(_ids(ViewPost, 'top', offset=1, limit=2),
+                         ['3', '2'])
+        page = ViewPost.objects.view('top', limit=1, with_scores=True)
+        self.assertEqual(page.scores, [4.0])
+        self.assertEqual(page.objects[0].id, '4')
+        self.assertEqual(_ids(ViewPost, 'top', reverse=False, min_score=2,
+                              max_score=3), ['2', '3'])
+
+    def test_limit(self):
+        posts = self.posts()
+        # four ids in a view limited to two: not trimmed yet
+        self.assertEqual(_ids(ViewPost, 'score_by_category',
+                              partition='news'), ['4', '3', '2', '1'])
+        posts[3].category = 'sports'
+        posts[3].save()
+        posts[2].delete()
+        self.assertEqual(_ids(ViewPost, 'score_by_category',
+                              partition='news'), ['2', '1'])
+        self.assertEqual(_ids(ViewPost, 'score_by_category',
+                              partition='sports'), ['4'])
+        for i in xrange(3):
+            post = ViewPost(category='news')
+            post.save()
+            post.incr('score', 10 + i)
+        # past twice the limit, trimmed back to the two highest scores
+        # as the third post was saved, then it was incremented
+        self.assertEqual(_ids(ViewPost, 'score_by_category',
+                              partition='news'), ['7', '6', '5'])
+        # a trimmed post comes back on its next write
+        posts[1].incr('score', 20)
+        self.assertEqual(_ids(ViewPost, 'score_by_category',
+                              partition='news'), ['2', '7', '6', '5'])
+        self.assertEqual(
+            sorted(self.db.hkeys('ViewPost:view:score_by_category:ids')),
+            ['2', '4', '5', '6', '7'])
+
+    def test_unloaded_partition(self):
+        self.posts(n=1)
+        post = ViewPost.objects.get_by_id('1', only=())
+        post.incr('score', 5)
+        self.assertEqual(ViewPost.objects.view('score_by_category',
+                partition='news', with_scores=True, load=False).scores, [6.0])
+
+    def test_bucketed(self):
+        posts = self.posts(BucketedViewPost, 2)
+        posts[0].category = 'sports'
+        posts[0].save()
+        self.assertEqual(_ids(BucketedViewPost, 'score_by_category',
+                              partition='news'), ['2'])
+        self.assertEqual(_ids(BucketedViewPost, 'score_by_category',
+                              partition='sports'), ['1'])
+
+    def test_bad_views(self):
+        self.assertRaises(ValueError, type, 'BadViewPost', (Model,), {
+                'hits': Counter(),
+                'Meta': type('Meta', (), {
+                    'views': [SortedView('hits', partition_by='hits')]})})
+        self.assertRaises(ValueError, type, 'BadViewPost', (Model,), {
+                'title': CharField(),
+                'Meta': type('Meta', (), {
+                    'views': [SortedView('title')]})})
+
+
+class AsyncViewTest(AsyncRedisTestCase):
+
+    def test_incr(self):
+        self.db.hmset('ViewPost:1', {'category': 'news', 'score': '1'})
+        # the partition is not loaded, the update reads it
+        post, = self.call(ViewPost.objects.get_by_ids_async, ['1'], only=(),
+                          as_dict=False)
+        self.call(post.incr_async, 'score', 2)
+        page = self.call(ViewPost.objects.view_async, 'score_by_category',
+                         partition='news', with_scores=True)
+        self.assertEqual(page.ids, ['1'])
+        self.assertEqual(page.scores, [3.0])
+        self.assertEqual(page.objects[0]['category'], 'news')
+
+    def test_error(self):
+        self.db.set('ViewPost:view:top:p:', 'x')
+        self.assertIsNone(self.call(ViewPost.objects.view_async, 'top'))
+        self.assertRaises(Exception, ViewPost.objects.view_async, 'none',
+                          callback=self.stop)